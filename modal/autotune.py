@@ -0,0 +1,271 @@
+"""
+Search for engine settings that maximize throughput under a latency SLO.
+
+tune.py supplies an evaluator that runs each trial on a Modal GPU, and
+SimulatedEngine stands in for it so the search can be exercised offline
+against a throughput curve of your own.
+"""
+
+import json
+import math
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+# Engine settings the tuner sweeps (and writes back to tuning.json)
+TUNED_KEYS = ("n_gpu", "data_parallel", "max_num_seqs", "max_num_batched_tokens", "max_concurrent_inputs")
+
+OBJECTIVES = ("throughput", "per-gpu")
+
+
+@dataclass
+class TrialResult:
+    """Measurement of one candidate profile; ``error`` is set if it failed to run."""
+
+    profile: dict
+    throughput: float = 0.0  # output tokens per second
+    requests_per_s: float = 0.0
+    p50_latency_s: float = 0.0  # end-to-end request latency
+    p95_latency_s: float = 0.0
+    error: str | None = None
+
+    def meets(self, slo_p95_s: float) -> bool:
+        return self.error is None and self.p95_latency_s <= slo_p95_s
+
+    def score(self, objective: str = "throughput") -> float:
+        """Output tokens per second, in total or per GPU."""
+        if objective == "per-gpu":
+            return self.throughput / gpu_count(self.profile)
+        return self.throughput
+
+
+def gpu_count(profile: dict) -> int:
+    """GPUs a profile's container takes: ``n_gpu`` per data-parallel replica."""
+    return profile["n_gpu"] * profile.get("data_parallel", 1)
+
+
+@dataclass
+class SearchSpace:
+    """Candidate values per setting; every (n_gpu, data_parallel,
+    max_num_batched_tokens) combination is a line that is walked through
+    ``max_num_seqs`` (per replica) in ascending order."""
+
+    n_gpu: list[int]
+    max_num_batched_tokens: list[int]
+    max_num_seqs: list[int]
+    data_parallel: list[int] = field(default_factory=lambda: [1])
+
+    def lines(self) -> list[dict]:
+        return [
+            {"n_gpu": n_gpu, "data_parallel": data_parallel, "max_num_batched_tokens": batched}
+            for n_gpu in sorted(set(self.n_gpu))
+            for data_parallel in sorted(set(self.data_parallel))
+            for batched in sorted(set(self.max_num_batched_tokens))
+        ]
+
+
+@dataclass
+class SearchResult:
+    best: TrialResult | None
+    trials: list[TrialResult] = field(default_factory=list)
+
+
+def candidate_profile(line: dict, max_num_seqs: int) -> dict:
+    """A trial profile: each replica accepts as many requests as its engine schedules."""
+    return {**line, "max_num_seqs": max_num_seqs, "max_concurrent_inputs": max_num_seqs}
+
+
+def search(
+    evaluate: Callable[[list[dict]], list[TrialResult]],
+    space: SearchSpace,
+    slo_p95_s: float,
+    objective: str = "throughput",
+    min_gain: float = 0.02,
+    log: Callable[[str], None] = print,
+) -> SearchResult:
+    """Find the highest-scoring profile whose p95 latency meets ``slo_p95_s``.
+
+    Each line raises ``max_num_seqs`` until a trial fails (the KV cache or the
+    weights do not fit), misses the SLO (more sequences only add latency from
+    there), or improves the score by less than ``min_gain`` over the line's
+    best so far. Lines advance together, one round at a time, so ``evaluate``
+    receives a batch of independent profiles it can run in parallel.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}. Available: {', '.join(OBJECTIVES)}")
+
+    seqs = sorted(set(space.max_num_seqs))
+    active = {index: (line, 0, 0.0) for index, line in enumerate(space.lines())}  # line, seqs index, best
+    trials: list[TrialResult] = []
+
+    round_number = 0
+    while active:
+        round_number += 1
+        batch = {index: candidate_profile(line, seqs[position]) for index, (line, position, _) in active.items()}
+        log(f"Round {round_number}: {len(batch)} trial(s)")
+        results = evaluate(list(batch.values()))
+
+        for (index, profile), result in zip(batch.items(), results):
+            trials.append(result)
+            line, position, line_best = active[index]
+            score = result.score(objective)
+            if result.error:
+                stop = f"failed: {result.error}"
+            elif result.p95_latency_s > slo_p95_s:
+                stop = f"p95 {result.p95_latency_s:.1f}s over the SLO"
+            elif line_best and score < line_best * (1 + min_gain):
+                stop = f"gained under {min_gain:.0%}"
+            elif position + 1 == len(seqs):
+                stop = "end of range"
+            else:
+                stop = None
+            log(f"  {format_profile(profile)}: {format_result(result)}" + (f" (line done: {stop})" if stop else ""))
+
+            if stop:
+                del active[index]
+            else:
+                active[index] = (line, position + 1, max(line_best, score))
+
+    passing = [trial for trial in trials if trial.meets(slo_p95_s)]
+    best = max(passing, key=lambda trial: trial.score(objective), default=None)
+    return SearchResult(best=best, trials=trials)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (``q`` in 0-100); 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def format_profile(profile: dict) -> str:
+    return (
+        f"n_gpu={profile['n_gpu']} data_parallel={profile.get('data_parallel', 1)} "
+        f"max_num_seqs={profile['max_num_seqs']} "
+        f"max_num_batched_tokens={profile['max_num_batched_tokens']}"
+    )
+
+
+def format_result(result: TrialResult) -> str:
+    if result.error:
+        return f"error ({result.error})"
+    return (
+        f"{result.throughput:,.0f} tok/s, {result.requests_per_s:.2f} req/s, "
+        f"p50 {result.p50_latency_s:.1f}s, p95 {result.p95_latency_s:.1f}s"
+    )
+
+
+# =============================================================================
+# Offline evaluator
+# =============================================================================
+
+
+class SimulatedEngine:
+    """Evaluator that reads throughput off a supplied curve instead of a GPU.
+
+    ``throughput_fn(profile)`` returns output tokens per second, or raises to
+    model a profile that cannot start. Trials are a closed loop with
+    ``max_num_seqs`` clients per replica, so by Little's law the mean request
+    latency is ``clients * tokens_per_request / throughput``; p95 is that
+    times ``p95_factor``.
+    """
+
+    def __init__(
+        self,
+        throughput_fn: Callable[[dict], float],
+        tokens_per_request: float,
+        p95_factor: float = 1.6,
+    ):
+        self.throughput_fn = throughput_fn
+        self.tokens_per_request = tokens_per_request
+        self.p95_factor = p95_factor
+        self.trials = 0
+
+    def __call__(self, profiles: list[dict]) -> list[TrialResult]:
+        results = []
+        for profile in profiles:
+            self.trials += 1
+            try:
+                throughput = self.throughput_fn(profile)
+            except Exception as e:
+                results.append(TrialResult(profile, error=str(e)))
+                continue
+            requests_per_s = throughput / self.tokens_per_request
+            mean_latency = profile["max_num_seqs"] * profile.get("data_parallel", 1) / requests_per_s
+            results.append(TrialResult(
+                profile,
+                throughput=throughput,
+                requests_per_s=requests_per_s,
+                p50_latency_s=mean_latency,
+                p95_latency_s=mean_latency * self.p95_factor,
+            ))
+        return results
+
+
+def saturating_curve(
+    peak_tok_s: float,
+    half_seqs: float,
+    min_gpus: int = 1,
+    max_seqs_per_gpu: int = 256,
+    tp_efficiency: float = 0.7,
+    dp_efficiency: float = 0.95,
+    batched_tokens_knee: int = 16384,
+) -> Callable[[dict], float]:
+    """A typical throughput curve for SimulatedEngine.
+
+    A replica's throughput grows as ``seqs / (seqs + half_seqs)`` towards a
+    peak that each extra tensor-parallel GPU raises by ``tp_efficiency`` of
+    one GPU, and dips a little below ``batched_tokens_knee`` tokens per step
+    (prefill chunks starve decode). Each extra data-parallel replica adds
+    ``dp_efficiency`` of one replica. Replicas with fewer than ``min_gpus``
+    GPUs (weights do not fit) or more than ``max_seqs_per_gpu`` sequences
+    per GPU (KV cache too small) raise.
+    """
+
+    def throughput(profile: dict) -> float:
+        n_gpu, seqs = profile["n_gpu"], profile["max_num_seqs"]
+        if n_gpu < min_gpus:
+            raise RuntimeError(f"weights need {min_gpus} GPU(s)")
+        if seqs > max_seqs_per_gpu * n_gpu:
+            raise RuntimeError("not enough KV cache for max_num_seqs")
+        peak = peak_tok_s * (1 + tp_efficiency * (n_gpu - 1))
+        step = min(1.0, profile["max_num_batched_tokens"] / batched_tokens_knee) ** 0.2
+        replicas = 1 + dp_efficiency * (profile.get("data_parallel", 1) - 1)
+        return peak * seqs / (seqs + half_seqs) * step * replicas
+
+    return throughput
+
+
+# =============================================================================
+# tuning.json
+# =============================================================================
+
+
+def write_tuning(
+    path: Path,
+    config_key: str,
+    result: TrialResult,
+    slo_p95_s: float,
+    objective: str,
+    workload: str,
+):
+    """Record the winning profile for a MODELS key, keeping other entries."""
+    try:
+        tuning = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        tuning = {}
+    measured = asdict(result)
+    measured.pop("profile")
+    measured.pop("error")
+    tuning[config_key] = {
+        "profile": {key: result.profile[key] for key in TUNED_KEYS},
+        "measured": measured,
+        "slo_p95_s": slo_p95_s,
+        "objective": objective,
+        "workload": workload,
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    path.write_text(json.dumps(tuning, indent=2, sort_keys=True) + "\n", encoding="utf-8")
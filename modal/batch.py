@@ -0,0 +1,315 @@
+"""
+Offline batch jobs for the GPU router: a JSONL file of requests in, a JSONL
+file of responses out.
+
+A job is a directory under the store root, which vllm_gpu_server.py mounts
+from the vllm-batches volume:
+
+    <job_id>/manifest.json       status, progress and the shard plan
+    <job_id>/requests.jsonl      the parsed requests, one per input line
+    <job_id>/shards/<n>.jsonl    results of shard n, written when it finishes
+
+Input and output lines follow the OpenAI Batch API format:
+
+    {"custom_id": "doc-1", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+    {"id": "...", "custom_id": "doc-1", "response": {"status_code": 200, "body": {...}}, "error": null}
+
+plan_shards groups requests by model and sorts each group by prompt length,
+so requests over the same document land in the same shard (and share
+prefix-cache blocks) and a shard decodes sequences of similar length. Each
+shard is one call to the model class, which submits all of its requests to
+the engine at once. run_job skips shards whose results already exist, so
+running a job again after a crash resumes it.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterator
+from pathlib import Path
+
+# Request URL to model class method
+BATCH_ENDPOINTS = {"/v1/chat/completions": "chat", "/v1/completions": "complete"}
+
+DEFAULT_SHARD_SIZE = 128  # Requests per model class call; a shard must finish within its timeout
+DEFAULT_PARALLEL_SHARDS = 4  # Shards in flight per model
+DEFAULT_SHARD_RETRIES = 2  # Extra attempts for a shard whose call fails (e.g. its container died)
+RUNNER_LEASE_S = 120  # A job whose runner has not renewed its lease for this long can be resumed
+
+JOB_ID_PATTERN = re.compile(r"^batch_[0-9a-f]{16}$")
+
+
+def prompt_length(request: dict) -> int:
+    """Characters of prompt text in a parsed batch request (to sort shards by)."""
+    params = request["params"]
+    if request["endpoint"] == "chat":
+        return sum(len(str(message.get("content", ""))) for message in params["messages"])
+    prompt = params["prompt"]
+    return len(prompt) if isinstance(prompt, str) else sum(len(str(p)) for p in prompt)
+
+
+def plan_shards(requests: list[dict], shard_size: int) -> list[dict]:
+    """Cut requests into shards of at most ``shard_size``, one model per shard.
+
+    Within a model, requests are ordered by prompt length and then prompt
+    text, so identical documents are adjacent. Returns ``{"shard", "model",
+    "indices"}`` dicts numbered from 0.
+    """
+    by_model: dict[str, list[dict]] = {}
+    for request in requests:
+        by_model.setdefault(request["model"], []).append(request)
+
+    shards = []
+    for model_key, group in by_model.items():
+        group.sort(key=lambda request: (prompt_length(request), json.dumps(request["params"], sort_keys=True)))
+        for start in range(0, len(group), shard_size):
+            shards.append({
+                "shard": len(shards),
+                "model": model_key,
+                "indices": [request["index"] for request in group[start : start + shard_size]],
+            })
+    return shards
+
+
+def result_line(job_id: str, request: dict, result: dict) -> dict:
+    """Output line for one request from a model class result (``response`` or ``error``)."""
+    line = {"id": f"{job_id}-{request['index']}", "custom_id": request["custom_id"], "response": None, "error": None}
+    if "response" in result:
+        line["response"] = {"status_code": 200, "body": result["response"]}
+    else:
+        line["error"] = {"code": "generation_failed", "message": result.get("error", "unknown error")}
+    return line
+
+
+class BatchStore:
+    """Batch jobs as files under ``root``.
+
+    ``launch(job_id)`` starts (or restarts) the job runner, e.g. by spawning a
+    Modal function. ``persist()`` and ``refresh()`` are called after writes
+    and before reads, for volumes that need an explicit commit and reload.
+    File I/O runs in a worker thread so the router's event loop is never
+    blocked on the volume.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        launch: Callable[[str], Awaitable] | None = None,
+        persist: Callable[[], Awaitable] | None = None,
+        refresh: Callable[[], Awaitable] | None = None,
+    ):
+        self.root = Path(root)
+        self.launch = launch
+        self.persist = persist
+        self.refresh = refresh
+        self._manifest_lock = asyncio.Lock()  # saves land in order, never interleaved
+        self._start_lock = asyncio.Lock()  # one lease check-and-set at a time
+
+    def _job_dir(self, job_id: str) -> Path:
+        if not JOB_ID_PATTERN.match(job_id):
+            raise KeyError(job_id)
+        return self.root / job_id
+
+    async def _persist(self):
+        if self.persist is not None:
+            await self.persist()
+
+    async def _refresh(self):
+        if self.refresh is not None:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Could not reload the batch store: {e}")
+
+    async def submit(
+        self,
+        requests: list[dict],
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        parallel: int = DEFAULT_PARALLEL_SHARDS,
+    ) -> dict:
+        """Store a new job and launch it; returns its manifest.
+
+        ``requests`` are parsed lines: ``{"index", "custom_id", "model",
+        "endpoint", "params"}`` with ``params`` the model method's kwargs.
+        """
+        job_id = f"batch_{uuid.uuid4().hex[:16]}"
+        shards = plan_shards(requests, shard_size)
+        manifest = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": int(time.time()),
+            "finished_at": None,
+            "total": len(requests),
+            "completed": 0,
+            "failed": 0,
+            "parallel": parallel,
+            "models": sorted({shard["model"] for shard in shards}),
+            "shards": shards,
+            "done_shards": [],
+            "failed_shards": [],
+        }
+        await asyncio.to_thread(self._write_job, job_id, requests, manifest)
+        await self._persist()
+        await self.start(job_id)
+        return await self.manifest(job_id, refresh=False)
+
+    async def start(self, job_id: str) -> bool:
+        """Launch the runner for a stored job (again, to resume it).
+
+        Takes the job's runner lease first; returns False, launching nothing,
+        if a runner still holds it, so two runners never work on one job.
+        """
+        async with self._start_lock:
+            manifest = await self.manifest(job_id)
+            if has_runner(manifest):
+                return False
+            manifest["lease_until"] = time.time() + RUNNER_LEASE_S
+            await self.save_manifest(manifest)
+        if self.launch is not None:
+            await self.launch(job_id)
+        return True
+
+    async def manifest(self, job_id: str, refresh: bool = True) -> dict:
+        """The job's manifest; raises KeyError for an unknown job."""
+        if refresh:
+            await self._refresh()
+        path = self._job_dir(job_id) / "manifest.json"
+        try:
+            return json.loads(await asyncio.to_thread(path.read_text))
+        except FileNotFoundError:
+            raise KeyError(job_id) from None
+
+    async def save_manifest(self, manifest: dict):
+        text = json.dumps(manifest)
+        async with self._manifest_lock:
+            await asyncio.to_thread(self._write_atomic, self._job_dir(manifest["id"]) / "manifest.json", text)
+            await self._persist()
+
+    async def requests(self, job_id: str) -> list[dict]:
+        path = self._job_dir(job_id) / "requests.jsonl"
+        text = await asyncio.to_thread(path.read_text)
+        return [json.loads(line) for line in text.splitlines() if line]
+
+    async def write_shard(self, job_id: str, shard: int, lines: list[dict]):
+        """Store a finished shard's result lines (atomically, so a crash never leaves half a shard)."""
+        text = "".join(json.dumps(line) + "\n" for line in lines)
+        await asyncio.to_thread(self._write_atomic, self._shard_path(job_id, shard), text)
+
+    def shard_done(self, job_id: str, shard: int) -> bool:
+        return self._shard_path(job_id, shard).exists()
+
+    def results(self, job_id: str, manifest: dict) -> Iterator[str]:
+        """Result lines of the finished shards, shard by shard (match them by custom_id)."""
+        for shard in manifest["shards"]:
+            path = self._shard_path(job_id, shard["shard"])
+            if path.exists():
+                with open(path, encoding="utf-8") as f:
+                    yield from f
+
+    def _shard_path(self, job_id: str, shard: int) -> Path:
+        return self._job_dir(job_id) / "shards" / f"{shard}.jsonl"
+
+    def _write_job(self, job_id: str, requests: list[dict], manifest: dict):
+        job_dir = self._job_dir(job_id)
+        (job_dir / "shards").mkdir(parents=True, exist_ok=True)
+        self._write_atomic(job_dir / "requests.jsonl", "".join(json.dumps(r) + "\n" for r in requests))
+        self._write_atomic(job_dir / "manifest.json", json.dumps(manifest))
+
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def has_runner(manifest: dict) -> bool:
+    """Whether a runner holds the job's lease (it is queued or running and alive)."""
+    return (manifest.get("lease_until") or 0) > time.time()
+
+
+async def run_job(
+    store: BatchStore,
+    job_id: str,
+    run_shard: Callable[[str, list[dict]], Awaitable[list[dict]]],
+    retries: int = DEFAULT_SHARD_RETRIES,
+    log: Callable[[str], None] = print,
+) -> dict:
+    """Run every unfinished shard of a job and return its final manifest.
+
+    ``run_shard(model_key, requests)`` runs one shard on the model and
+    returns ``{"index", "response"}`` or ``{"index", "error"}`` per request.
+    Up to the job's ``parallel`` shards per model are in flight at once. A
+    shard whose call still fails after ``retries`` extra attempts is listed
+    in ``failed_shards`` and the job ends as "failed"; running the job again
+    retries just those shards. The runner renews the job's lease (see
+    BatchStore.start) while it runs and releases it when done.
+    """
+    manifest = await store.manifest(job_id)
+    requests = await store.requests(job_id)
+    by_index = {request["index"]: request for request in requests}
+
+    manifest["status"] = "running"
+    manifest["lease_until"] = time.time() + RUNNER_LEASE_S
+    manifest["failed_shards"] = []
+    manifest["done_shards"] = [s["shard"] for s in manifest["shards"] if store.shard_done(job_id, s["shard"])]
+    manifest["completed"] = sum(len(s["indices"]) for s in manifest["shards"] if s["shard"] in manifest["done_shards"])
+    await store.save_manifest(manifest)
+
+    pending = [s for s in manifest["shards"] if s["shard"] not in manifest["done_shards"]]
+    log(f"Batch {job_id}: {len(pending)} of {len(manifest['shards'])} shards to run, "
+        f"{manifest['completed']}/{manifest['total']} requests already done")
+    gates = {model_key: asyncio.Semaphore(manifest["parallel"]) for model_key in manifest["models"]}
+
+    async def run_one(shard: dict):
+        shard_requests = [by_index[index] for index in shard["indices"]]
+        payload = [
+            {"index": r["index"], "endpoint": r["endpoint"], "params": r["params"]} for r in shard_requests
+        ]
+        async with gates[shard["model"]]:
+            for attempt in range(retries + 1):
+                start = time.time()
+                try:
+                    results = await run_shard(shard["model"], payload)
+                    break
+                except Exception as e:
+                    log(f"Batch {job_id} shard {shard['shard']} attempt {attempt + 1} failed: {type(e).__name__}: {e}")
+            else:
+                manifest["failed_shards"].append(shard["shard"])
+                await store.save_manifest(manifest)
+                return
+
+        by_result = {result["index"]: result for result in results}
+        lines = [
+            result_line(job_id, request, by_result.get(request["index"], {"error": "no result returned"}))
+            for request in shard_requests
+        ]
+        await store.write_shard(job_id, shard["shard"], lines)
+        manifest["done_shards"].append(shard["shard"])
+        manifest["completed"] += len(lines)
+        manifest["failed"] += sum(1 for line in lines if line["error"] is not None)
+        await store.save_manifest(manifest)
+        log(f"Batch {job_id} shard {shard['shard']} ({shard['model']}, {len(lines)} requests) "
+            f"done in {time.time() - start:.0f}s: {manifest['completed']}/{manifest['total']}")
+
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(RUNNER_LEASE_S / 4)
+            manifest["lease_until"] = time.time() + RUNNER_LEASE_S
+            await store.save_manifest(manifest)
+
+    renewer = asyncio.create_task(renew_lease())
+    try:
+        await asyncio.gather(*(run_one(shard) for shard in pending))
+    finally:
+        renewer.cancel()
+
+    manifest["status"] = "failed" if manifest["failed_shards"] else "completed"
+    manifest["lease_until"] = None
+    manifest["finished_at"] = int(time.time())
+    await store.save_manifest(manifest)
+    log(f"Batch {job_id} {manifest['status']}: {manifest['completed']}/{manifest['total']} requests, "
+        f"{manifest['failed']} errors, {len(manifest['failed_shards'])} failed shards")
+    return manifest
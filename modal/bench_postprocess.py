@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for structured-output post-processing (postprocess.py).
+
+Times extract_json against the previous implementation (kept below as
+legacy_extract_json) on realistic model outputs, pathological inputs and
+short edge cases, and exits with 1 if extract_json returns different text on
+any case where the legacy version found valid JSON.
+Also times the streaming ThinkingFilter against the regex passes it replaces
+and fuzzes it with randomly chunked input to check they make the same
+decisions.
+
+Usage:
+    uv run python bench_postprocess.py
+    uv run python bench_postprocess.py --repeat 20 --case stray-braces
+    uv run python bench_postprocess.py --fuzz 100000
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from postprocess import ThinkingFilter, extract_json, strip_thinking_tokens
+
+DOCS_DIR = Path(__file__).resolve().parent.parent / "docs"
+
+
+# =============================================================================
+# Previous implementation (for comparison)
+# =============================================================================
+
+
+def legacy_strip_thinking_tokens(text: str) -> str:
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    text = re.sub(r"<thinking>.*?</thinking>", "", text, flags=re.DOTALL)
+    return text.strip()
+
+
+def legacy_extract_json(text: str) -> str:
+    text = text.strip()
+    try:
+        json.loads(text)
+        return text
+    except json.JSONDecodeError:
+        pass
+
+    text = legacy_strip_thinking_tokens(text)
+    try:
+        json.loads(text)
+        return text
+    except json.JSONDecodeError:
+        pass
+
+    start_idx = text.find("{")
+    if start_idx != -1:
+        depth = 0
+        in_string = False
+        escape_next = False
+
+        for i, char in enumerate(text[start_idx:], start_idx):
+            if escape_next:
+                escape_next = False
+                continue
+            if char == "\\":
+                escape_next = True
+                continue
+            if char == '"' and not escape_next:
+                in_string = not in_string
+                continue
+            if in_string:
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    candidate = text[start_idx : i + 1]
+                    try:
+                        json.loads(candidate)
+                        return candidate
+                    except json.JSONDecodeError:
+                        pass
+                    break
+
+    return text
+
+
+# =============================================================================
+# Inputs
+# =============================================================================
+
+
+def _extraction_payload(n_entities: int) -> str:
+    """An entity-extraction response shaped like dex-bench's structured-output benchmark."""
+    words = []
+    for doc in sorted(DOCS_DIR.glob("*.md")):
+        words.extend(doc.read_text(encoding="utf-8").split())
+    words = words or ["lorem", "ipsum", "dolor"]
+
+    extractions = [
+        {
+            "id": f"e{i}",
+            "extractionClass": "ORGANIZATION" if i % 3 else "PERSON",
+            "extractionText": " ".join(words[i * 3 : i * 3 + 3]),
+        }
+        for i in range(n_entities)
+    ]
+    relationships = [
+        {"sourceId": f"e{i}", "targetId": f"e{i + 1}", "relationshipType": "ASSOCIATED_WITH"}
+        for i in range(0, n_entities - 1, 2)
+    ]
+    return json.dumps({"extractions": extractions, "relationships": relationships}, indent=2)
+
+
+def build_cases() -> dict[str, str]:
+    payload = _extraction_payload(400)
+    thinking = "Let me find the {entities} in the document. " * 200
+    return {
+        "clean-json": payload,
+        "thinking-prefix": f"<think>{thinking}</think>\n{payload}",
+        "prose-wrapped": f"Here are the entities you asked for:\n```json\n{payload}\n```\nLet me know!",
+        "several-candidates": "Example: {not json} and {\"draft\": tru}\nFinal answer: " + payload,
+        "deep-nesting": "result: " + "[" * 50_000 + "]" * 50_000,
+        "stray-braces": "{ " * 200_000 + payload,
+        "megabyte-string": 'answer: {"text": "' + ("x{y}z\\\"" * 150_000) + '"}',
+        "no-json": "The model declined to answer. " * 20_000,
+        # Brackets around or before the answer must not hide it
+        "object-in-brackets": '[Answer: {"name": "Ada"}]',
+        "thinking-brackets": '<think>x</think>[note {"a": 1}]',
+        "array-before-object": '[1] see {"a":1}',
+        "thinking-array": '<think>x</think>[{"a": 1}, {"b": 2}]',
+        # A stray quote in bracketed prose must not pair with one of the answer's
+        "quote-in-brackets": 'Result [1 item, 2" long] {"a": 1}',
+        "quoted-list-note": 'I used [brackets for a "list] here:\n{"name": "x"}',
+        "quote-in-nested-note": 'Sure (see [the "note]) {"a": 1}',
+        "quoted-prose-payload": f'Specs [6" screen, "fast] below:\n{payload}',
+    }
+
+
+def build_thinking_cases() -> dict[str, str]:
+    payload = _extraction_payload(400)
+    reasoning = "Let me work through the document step by step. " * 2_000
+    return {
+        "no-thinking": payload,
+        "thinking-prefix": f"<think>{reasoning}</think>\n{payload}",
+        "many-spans": "".join(f"<think>step {i}</think>answer {i} " for i in range(20_000)),
+        "unclosed": f"<think>{reasoning}{payload}",
+        "stray-tags": "<thi <thinkin </think> " * 30_000,
+    }
+
+
+def _fuzz_thinking_filter(iterations: int, seed: int = 0) -> int:
+    """Feed random tag soup in random chunks; count disagreements with the regex passes."""
+    pieces = ["<think>", "</think>", "<thinking>", "</thinking>", "<thi", "nk>", "ing>",
+              "</", "<", "a", "b ", " ", "\n"]
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(iterations):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        thinking_filter = ThinkingFilter()
+        out = []
+        pos = 0
+        while pos < len(text):
+            size = rng.randint(1, 6)
+            out.append(thinking_filter.feed(text[pos : pos + size]))
+            pos += size
+        out.append(thinking_filter.flush())
+        if "".join(out) != legacy_strip_thinking_tokens(text):
+            mismatches += 1
+    return mismatches
+
+
+# =============================================================================
+# Runner
+# =============================================================================
+
+
+def time_call(fn, text: str, repeat: int) -> float:
+    """Best-of-``repeat`` wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction post-processing")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case (best is reported)")
+    parser.add_argument("--case", action="append", help="Only run the named case(s)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not time the previous implementation")
+    parser.add_argument("--fuzz", type=int, default=10_000, help="Random chunked inputs for the thinking filter check")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.case:
+        unknown = set(args.case) - set(cases)
+        if unknown:
+            print(f"Unknown case(s): {', '.join(sorted(unknown))}. Available: {', '.join(cases)}")
+            return 1
+        cases = {name: cases[name] for name in args.case}
+
+    # "Found" is new/legacy: whether each implementation returned parseable JSON
+    print(f"{'Case':<20} | {'Size':>10} | {'extract_json':>13} | {'legacy':>14} | {'Speedup':>8} | Found")
+    print("-" * 20 + "-+-" + "-+-".join("-" * w for w in (10, 13, 14, 8, 7)))
+
+    mismatches = []
+    for name, text in cases.items():
+        new_ms = time_call(extract_json, text, args.repeat)
+        json_text, parsed = extract_json(text)
+
+        legacy_cell, speedup_cell, legacy_found = "skipped", "-", "-"
+        if not args.skip_legacy:
+            try:
+                legacy_ms = time_call(legacy_extract_json, text, args.repeat)
+                legacy_cell = f"{legacy_ms:>10.2f} ms"
+                speedup_cell = f"{legacy_ms / new_ms:>7.1f}x" if new_ms else "-"
+                legacy_text = legacy_extract_json(text)
+                try:
+                    json.loads(legacy_text)
+                    legacy_found = "yes"
+                    if legacy_text != json_text:
+                        mismatches.append(name)
+                except (ValueError, RecursionError):
+                    legacy_found = "no"  # nothing usable; nothing to agree with
+            except RecursionError:
+                legacy_cell, legacy_found = "RecursionError", "no"
+
+        found = "yes" if parsed is not None else "no"
+        print(
+            f"{name:<20} | {len(text):>10,} | {new_ms:>10.2f} ms | {legacy_cell:>14} | "
+            f"{speedup_cell:>8} | {found}/{legacy_found}"
+        )
+
+    print(f"\n{'Thinking filter':<20} | {'Size':>10} | {'filter':>13} | {'regex':>14} | {'Speedup':>8} | Same")
+    print("-" * 20 + "-+-" + "-+-".join("-" * w for w in (10, 13, 14, 8, 7)))
+    for name, text in build_thinking_cases().items():
+        new_ms = time_call(strip_thinking_tokens, text, args.repeat)
+        legacy_ms = time_call(legacy_strip_thinking_tokens, text, args.repeat)
+        same = strip_thinking_tokens(text) == legacy_strip_thinking_tokens(text)
+        if not same:
+            mismatches.append(f"thinking:{name}")
+        print(
+            f"{name:<20} | {len(text):>10,} | {new_ms:>10.2f} ms | {legacy_ms:>11.2f} ms | "
+            f"{legacy_ms / new_ms if new_ms else 0:>7.1f}x | {'yes' if same else 'no'}"
+        )
+
+    if args.fuzz:
+        fuzz_mismatches = _fuzz_thinking_filter(args.fuzz)
+        print(f"\nFuzzed ThinkingFilter with {args.fuzz:,} chunked inputs: {fuzz_mismatches} mismatches")
+        if fuzz_mismatches:
+            mismatches.append("thinking:fuzz")
+
+    if mismatches:
+        print(f"\nOutput differs from legacy on: {', '.join(mismatches)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
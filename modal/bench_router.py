@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the GPU router (router.py) over in-process fake models.
+
+Drives the FastAPI app directly through ASGI, with no sockets or HTTP server,
+so all that is measured is the router itself: auth, request parsing, model
+lookup, gating, coalescing, caching and response shaping. The fake models
+(fake_engine.py) answer instantly by default, so everything is one thread on
+one core. For each case it reports:
+
+- CPU per request: process time over sequential requests
+- allocations per request: tracemalloc peak and bytes still held afterwards
+- max RPS: completed requests per second with many requests in flight
+
+--save writes the results as a baseline and --baseline compares against one,
+exiting 1 if CPU per request grew by more than --tolerance, so router
+regressions show up on a laptop.
+
+Usage:
+    uv run python bench_router.py
+    uv run python bench_router.py --case chat-small --requests 5000
+    uv run python bench_router.py --save router-baseline.json
+    uv run python bench_router.py --baseline router-baseline.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from fake_engine import fake_handles
+from response_cache import ResponseCache
+from router import create_app
+from structured_schemas import EXTRACTION_SCHEMA
+from workload import load_documents
+
+API_KEY = "bench-key"
+HEADERS = [
+    (b"content-type", b"application/json"),
+    (b"authorization", f"Bearer {API_KEY}".encode()),
+]
+
+
+# =============================================================================
+# ASGI driver
+# =============================================================================
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"") -> tuple[int, bytes]:
+    """Run one request through an ASGI app in-process; returns (status, body)."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": HEADERS,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    received = False
+    status = 0
+    chunks: list[bytes] = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Future()  # the client never disconnects
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+# =============================================================================
+# Cases
+# =============================================================================
+
+
+def build_cases() -> dict[str, tuple[str, bytes]]:
+    """Request (path, body) per case, shaped like dex-bench traffic."""
+    document = next(iter(load_documents().values()))[:20_000]
+    chat = {"model": "gemma-3-12b", "max_tokens": 64, "temperature": 0.7}
+    cases = {
+        "chat-small": ("/v1/chat/completions", {
+            **chat, "messages": [{"role": "user", "content": "Say hello in exactly 5 words."}],
+        }),
+        "chat-document": ("/v1/chat/completions", {
+            **chat, "messages": [{"role": "user", "content": f"Summarize:\n<document>{document}</document>"}],
+        }),
+        "chat-structured": ("/v1/chat/completions", {
+            **chat,
+            "messages": [{"role": "user", "content": "Extract the entities."}],
+            "response_format": {"type": "json_schema", "json_schema": {"name": "x", "schema": EXTRACTION_SCHEMA}},
+        }),
+        "chat-cached": ("/v1/chat/completions", {
+            **chat, "temperature": 0, "cache": True,
+            "messages": [{"role": "user", "content": "Say hello in exactly 5 words."}],
+        }),
+        "chat-stream": ("/v1/chat/completions", {
+            **chat, "stream": True, "stream_options": {"include_usage": True},
+            "messages": [{"role": "user", "content": "Say hello in exactly 5 words."}],
+        }),
+        "model-partial-name": ("/v1/chat/completions", {
+            **chat, "model": "GEMMA-3-12B-IT-latest",
+            "messages": [{"role": "user", "content": "Say hello in exactly 5 words."}],
+        }),
+        "completion": ("/v1/completions", {
+            "model": "gemma-3-12b", "prompt": "The capital of France is", "max_tokens": 16,
+        }),
+    }
+    return {name: (path, json.dumps(body).encode()) for name, (path, body) in cases.items()}
+
+
+def new_app():
+    """Router over instant fake models, with a memory-only response cache."""
+    cache = ResponseCache(1024, 64 * 1024 * 1024)
+    return create_app(fake_handles(), gpu_key="bench", api_key=API_KEY, response_cache=cache)
+
+
+# =============================================================================
+# Measurements
+# =============================================================================
+
+
+async def measure_cpu(app, path: str, body: bytes, requests: int, warmup: int = 50) -> tuple[float, float]:
+    """(CPU µs, wall µs) per request over ``requests`` sequential requests, after a warm-up."""
+    status, response = await asgi_request(app, "POST", path, body)
+    if status != 200:
+        raise RuntimeError(f"{path} returned {status}: {response[:200]!r}")
+    for _ in range(warmup):
+        await asgi_request(app, "POST", path, body)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        await asgi_request(app, "POST", path, body)
+    return (
+        (time.process_time() - cpu_start) / requests * 1e6,
+        (time.perf_counter() - wall_start) / requests * 1e6,
+    )
+
+
+async def measure_allocations(app, path: str, body: bytes, requests: int) -> tuple[int, int]:
+    """(peak bytes per request, bytes retained per request) under tracemalloc."""
+    await asgi_request(app, "POST", path, body)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await asgi_request(app, "POST", path, body)
+        _, peak = tracemalloc.get_traced_memory()
+        for _ in range(requests - 1):
+            await asgi_request(app, "POST", path, body)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline, max(0, current - baseline) // requests
+
+
+async def measure_rps(app, path: str, body: bytes, seconds: float, concurrency: int) -> float:
+    """Completed requests per second with ``concurrency`` requests always in flight."""
+    completed = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal completed
+        while time.perf_counter() < deadline:
+            await asgi_request(app, "POST", path, body)
+            completed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return completed / (time.perf_counter() - start)
+
+
+# =============================================================================
+# Runner
+# =============================================================================
+
+
+async def run(args: argparse.Namespace, cases: dict[str, tuple[str, bytes]]) -> dict[str, dict]:
+    results = {}
+    print(f"{'Case':<20} | {'Body':>8} | {'CPU/req':>10} | {'Wall/req':>10} | {'Peak alloc':>10} | "
+          f"{'Retained':>9} | {'Max RPS':>8}")
+    print("-" * 20 + "-+-" + "-+-".join("-" * w for w in (8, 10, 10, 10, 9, 8)))
+    for name, (path, body) in cases.items():
+        # A fresh app per case, so queues, coalescers and caches start empty
+        cpu_us, wall_us = await measure_cpu(new_app(), path, body, args.requests)
+        peak, retained = await measure_allocations(new_app(), path, body, min(args.requests, 500))
+        rps = await measure_rps(new_app(), path, body, args.seconds, args.concurrency)
+        results[name] = {
+            "cpu_us": cpu_us, "wall_us": wall_us, "peak_alloc_bytes": peak,
+            "retained_bytes": retained, "max_rps": rps,
+        }
+        print(f"{name:<20} | {len(body):>8,} | {cpu_us:>7.0f} µs | {wall_us:>7.0f} µs | "
+              f"{peak / 1024:>7.0f} KB | {retained:>7,} B | {rps:>8,.0f}")
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Cases whose CPU per request grew by more than ``tolerance`` over the baseline."""
+    regressions = []
+    print(f"\n{'Case':<20} | {'Baseline':>10} | {'Now':>10} | Change")
+    print("-" * 20 + "-+-" + "-+-".join("-" * w for w in (10, 10, 7)))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, now = baseline[name]["cpu_us"], result["cpu_us"]
+        change = now / before - 1 if before else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<20} | {before:>7.0f} µs | {now:>7.0f} µs | {change:>+6.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the GPU router over fake models")
+    parser.add_argument("--case", action="append", help="Only run the named case(s)")
+    parser.add_argument("--requests", type=int, default=2000, help="Sequential requests for CPU timing")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of the max RPS run per case")
+    parser.add_argument("--concurrency", type=int, default=256, help="Requests in flight for max RPS")
+    parser.add_argument("--save", type=Path, help="Write results as a baseline JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare CPU per request with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed CPU growth over the baseline")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.case:
+        unknown = set(args.case) - set(cases)
+        if unknown:
+            print(f"Unknown case(s): {', '.join(sorted(unknown))}. Available: {', '.join(cases)}")
+            return 1
+        cases = {name: cases[name] for name in args.case}
+
+    results = asyncio.run(run(args, cases))
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nWrote {args.save}")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f"\nCPU per request regressed on: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
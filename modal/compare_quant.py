@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Quality and throughput of a model's quantized variants, against the model.
+
+Sends the same benchmark-shaped requests (workload.py, temperature 0) through
+a GPU router to a full-precision model and to its QUANTIZED_VARIANTS
+(config.py), then reports per model:
+
+- Agreement: how closely each variant's output matches the bf16 model's for
+  the same request, scored on what the benchmark scores: the set of entity
+  types, the set of (class, text) extractions, or the words of a summary
+  (F1 over each). Exact is the share of byte-identical outputs, Invalid the
+  share of failed requests and unparseable JSON. The bf16 model answers
+  twice, and its agreement with itself is the noise floor: batching makes
+  even greedy decoding vary a little, so a variant is only as far from bf16
+  as it is below that row.
+- Throughput: one Poisson arrival schedule replayed against each model with
+  loadgen.py: output tokens/s, per GPU of a replica (the GPU spend), latency
+  and goodput. Modal adds containers as load grows, so pick a --rate that one
+  bf16 replica can just sustain, or per-replica capacity is hidden.
+
+Usage:
+    # gemma-3-27b against its fp8 and awq variants on the H100 app
+    uv run python compare_quant.py --base-url https://your-workspace--vllm-h100-serve.modal.run \\
+        --api-key $VLLM_API_KEY --model gemma-3-27b --gpu h100
+
+    # Only the fp8 variant, a larger quality set, no throughput runs
+    uv run python compare_quant.py --base-url ... --model gemma-3-12b --quant fp8 --requests 90 --rate 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+import aiohttp
+
+from config import GPU_SHORT_NAMES, MODELS, QUANTIZED_VARIANTS
+from loadgen import poisson_arrivals, request_body, run_load, summarize
+from workload import PROMPT_SHAPES, build_workload, describe_workload
+
+DEFAULT_QUALITY_REQUESTS = 30
+DEFAULT_PARALLEL = 8  # Quality requests in flight per model
+DEFAULT_RATE = 1.0
+DEFAULT_DURATION = 120.0
+
+
+# =============================================================================
+# Quality
+# =============================================================================
+
+
+def output_items(kind: str, text: str | None) -> Counter | None:
+    """What the benchmark scores in a response, as a multiset; None for no or invalid output."""
+    if text is None:
+        return None
+    if kind not in PROMPT_SHAPES or PROMPT_SHAPES[kind][2] is None:
+        return Counter(re.findall(r"\w+", text.lower()))
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if kind == "generate-entity-types":
+        return Counter({str(entity_type).strip().upper(): 1 for entity_type in data.get("entityTypes") or []})
+    return Counter({
+        (str(e.get("extractionClass", "")).strip().upper(), str(e.get("extractionText", "")).strip().lower()): 1
+        for e in data.get("extractions") or []
+        if isinstance(e, dict)
+    })
+
+
+def f1(reference: Counter, candidate: Counter) -> float:
+    """F1 of ``candidate`` against ``reference`` (1.0 when both are empty)."""
+    if not reference and not candidate:
+        return 1.0
+    overlap = sum((reference & candidate).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(candidate.values())
+    recall = overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def score_quality(workload: list[dict], reference: list[str | None], outputs: list[str | None]) -> dict:
+    """Agreement of ``outputs`` with ``reference``, request by request, overall and per kind.
+
+    Requests the reference has no valid output for are left out.
+    """
+    by_kind: dict[str, dict] = {}
+    for request, reference_text, text in zip(workload, reference, outputs):
+        reference_items = output_items(request["kind"], reference_text)
+        if reference_items is None:
+            continue
+        items = output_items(request["kind"], text)
+        scores = by_kind.setdefault(request["kind"], {"f1": [], "exact": 0, "invalid": 0})
+        scores["f1"].append(f1(reference_items, items) if items is not None else 0.0)
+        scores["exact"] += text == reference_text
+        scores["invalid"] += items is None
+
+    def combine(groups: list[dict]) -> dict:
+        compared = sum(len(scores["f1"]) for scores in groups)
+        if not compared:
+            return {"compared": 0, "agreement": None, "exact": None, "invalid": None}
+        return {
+            "compared": compared,
+            "agreement": sum(sum(scores["f1"]) for scores in groups) / compared,
+            "exact": sum(scores["exact"] for scores in groups) / compared,
+            "invalid": sum(scores["invalid"] for scores in groups) / compared,
+        }
+
+    return combine(list(by_kind.values())) | {
+        "by_kind": {kind: combine([scores]) for kind, scores in sorted(by_kind.items())}
+    }
+
+
+async def collect_outputs(
+    base_url: str,
+    api_key: str | None,
+    model: str,
+    workload: list[dict],
+    parallel: int = DEFAULT_PARALLEL,
+    timeout: float = 600,
+) -> list[str | None]:
+    """Message content of each request's (non-streamed) response, in order; None where it failed."""
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    url = f"{base_url.rstrip('/')}/v1/chat/completions"
+    gate = asyncio.Semaphore(parallel)
+
+    async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+
+        async def one(request: dict) -> str | None:
+            # Bypass the router's response cache, or the bf16 rerun would just replay the first run
+            body = request_body(request, model, stream=False) | {"cache": False}
+            async with gate:
+                try:
+                    async with session.post(url, json=body) as resp:
+                        if resp.status != 200:
+                            print(f"  {model}: HTTP {resp.status}: {(await resp.text())[:200]}")
+                            return None
+                        data = await resp.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    print(f"  {model}: {type(e).__name__}: {e}")
+                    return None
+            return data["choices"][0]["message"].get("content")
+
+        return list(await asyncio.gather(*(one(request) for request in workload)))
+
+
+# =============================================================================
+# Report
+# =============================================================================
+
+
+def print_report(results: dict, base_model: str, gpu: str):
+    base_gpus = results[base_model]["n_gpu"]
+    base_throughput = results[base_model]["throughput"]
+    base_per_gpu = base_throughput["output_tok_s"] / base_gpus if base_throughput else 0.0
+
+    print(f"\n{'Model':<16} | {'GPUs':>4} | {'Agreement':>9} | {'Exact':>6} | {'Invalid':>7} | "
+          f"{'Out tok/s':>9} | {'Per GPU':>8} | {'vs bf16':>7} | {'E2E p50':>7} | {'E2E p95':>7} | {'Goodput':>7}")
+    print("-" * 16 + "-+-" + "-+-".join("-" * w for w in (4, 9, 6, 7, 9, 8, 7, 7, 7, 7)))
+    for model_key, result in results.items():
+        quality = result["quality"]
+        cells = [f"{result['n_gpu']:>4}"]
+        if quality["agreement"] is None:
+            cells += [f"{'-':>9}", f"{'-':>6}", f"{'-':>7}"]
+        else:
+            cells += [f"{quality['agreement']:>9.1%}", f"{quality['exact']:>6.0%}", f"{quality['invalid']:>7.0%}"]
+        throughput = result["throughput"]
+        if throughput is None:
+            cells += [f"{'-':>9}", f"{'-':>8}", f"{'-':>7}", f"{'-':>7}", f"{'-':>7}", f"{'-':>7}"]
+        else:
+            per_gpu = throughput["output_tok_s"] / result["n_gpu"]
+            ratio = f"x{per_gpu / base_per_gpu:.2f}" if base_per_gpu else "-"
+            cells += [
+                f"{throughput['output_tok_s']:>9,.0f}",
+                f"{per_gpu:>8,.0f}",
+                f"{ratio:>7}",
+                f"{throughput['e2e_s']['p50']:>7.1f}",
+                f"{throughput['e2e_s']['p95']:>7.1f}",
+                f"{throughput['slo_attainment']:>7.0%}",
+            ]
+        print(f"{model_key:<16} | {' | '.join(cells)}")
+    print(f"\n{base_model} agreement is a second bf16 run against the first (the noise floor); "
+          f"GPUs per replica on {gpu}; Goodput is the share of requests meeting the SLOs given")
+
+    kinds = list(results[base_model]["quality"]["by_kind"])
+    if kinds:
+        print(f"\n{'Agreement by kind':<24} | {' | '.join(f'{model_key:>16}' for model_key in results)}")
+        print("-" * 24 + "-+-" + "-+-".join("-" * 16 for _ in results))
+        for kind in kinds:
+            cells = []
+            for result in results.values():
+                agreement = result["quality"]["by_kind"].get(kind, {}).get("agreement")
+                cells.append(f"{agreement:>16.1%}" if agreement is not None else f"{'-':>16}")
+            print(f"{kind:<24} | {' | '.join(cells)}")
+
+
+# =============================================================================
+# Main
+# =============================================================================
+
+
+async def _main(args: argparse.Namespace) -> int:
+    if args.model not in QUANTIZED_VARIANTS:
+        print(f"{args.model} has no quantized variants. Models with variants: {', '.join(QUANTIZED_VARIANTS)}")
+        return 1
+    methods = args.quant or list(QUANTIZED_VARIANTS[args.model])
+    unknown = [method for method in methods if method not in QUANTIZED_VARIANTS[args.model]]
+    if unknown:
+        print(f"Unknown quantization(s) for {args.model}: {', '.join(unknown)}. "
+              f"Available: {', '.join(QUANTIZED_VARIANTS[args.model])}")
+        return 1
+    model_keys = [args.model] + [f"{args.model}-{method}" for method in methods]
+
+    kinds = args.kind or None
+    quality_workload = build_workload(args.requests, seed=args.seed, kinds=kinds)
+    print(f"Target:      {args.base_url} ({args.gpu})")
+    print(f"Quality set: {describe_workload(quality_workload)}")
+
+    async def outputs_of(model_key: str, label: str) -> list[str | None]:
+        print(f"  {label}...")
+        return await collect_outputs(
+            args.base_url, args.api_key, model_key, quality_workload, args.parallel, args.timeout
+        )
+
+    reference = await outputs_of(args.model, f"{args.model} (reference)")
+    results = {}
+    for model_key in model_keys:
+        label = f"{model_key} (noise floor)" if model_key == args.model else model_key
+        outputs = await outputs_of(model_key, label)
+        results[model_key] = {
+            "n_gpu": MODELS[f"{model_key}-{args.gpu}"].gpu_count,
+            "quality": score_quality(quality_workload, reference, outputs),
+            "throughput": None,
+        }
+
+    if args.rate > 0:
+        arrivals = poisson_arrivals(args.rate, args.duration, None, args.seed)
+        load_workload = build_workload(len(arrivals), seed=args.seed + 1, kinds=kinds)
+        print(f"\nLoad:        {len(arrivals)} requests over {args.duration:.0f}s (Poisson {args.rate:g} req/s), "
+              f"{describe_workload(load_workload)}")
+        for model_key in model_keys:
+            print(f"  {model_key}...")
+            records, elapsed, peak = await run_load(
+                args.base_url, model_key, args.api_key, arrivals, load_workload, timeout=args.timeout
+            )
+            results[model_key]["throughput"] = summarize(
+                records, elapsed, peak, args.slo_ttft, args.slo_tpot, args.slo_e2e
+            )
+
+    print_report(results, args.model, args.gpu)
+    if args.output:
+        args.output.write_text(json.dumps({"model": args.model, "gpu": args.gpu, "results": results}, indent=2))
+        print(f"\nWrote {args.output}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare a model's quantized variants with it")
+    parser.add_argument("--base-url", required=True, help="GPU router base URL (without /v1)")
+    parser.add_argument("--api-key", default=os.environ.get("VLLM_API_KEY"), help="Bearer token (default: $VLLM_API_KEY)")
+    parser.add_argument("--model", default="gemma-3-27b", help="Full-precision model key (see QUANTIZED_VARIANTS)")
+    parser.add_argument("--quant", action="append", help="Only compare these quantization methods (default: all)")
+    parser.add_argument("--gpu", default="h100", choices=list(GPU_SHORT_NAMES.values()),
+                        help="GPU of the router's app, for GPUs per replica")
+    parser.add_argument("--kind", action="append", choices=list(PROMPT_SHAPES), help="Only send these request kinds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds")
+
+    quality = parser.add_argument_group("quality")
+    quality.add_argument("--requests", type=int, default=DEFAULT_QUALITY_REQUESTS,
+                         help="Requests each model answers for the comparison")
+    quality.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL, help="Quality requests in flight per model")
+
+    load = parser.add_argument_group("throughput")
+    load.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Poisson arrival rate in requests/s (0 = skip)")
+    load.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Seconds of arrivals per model")
+    load.add_argument("--slo-ttft", type=float, help="Max time to first token, seconds")
+    load.add_argument("--slo-tpot", type=float, help="Max time per output token, seconds")
+    load.add_argument("--slo-e2e", type=float, help="Max end-to-end latency, seconds")
+
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
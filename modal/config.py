@@ -4,12 +4,124 @@ Model configurations for vLLM deployments on Modal.
 Each model is mapped to:
 - huggingface_id: The HuggingFace model identifier
 - gpu: The recommended GPU type for this model
-- n_gpu: Number of GPUs (for tensor parallelism)
+- n_gpu: Number of GPUs per engine replica (for tensor parallelism)
+- data_parallel: Engine replicas per container (a container gets n_gpu x data_parallel GPUs)
 - max_model_len: Maximum context length (optional, for memory optimization)
+- gpu_memory_utilization, max_num_seqs, max_num_batched_tokens,
+  enable_chunked_prefill: vLLM engine scheduling and memory settings
+- max_concurrent_inputs: Requests each engine replica of a container accepts at once
+- enable_prefix_caching: Reuse KV cache blocks across requests sharing a prompt prefix
+- boot_mode: How containers start (eager, compiled, snapshot; see BOOT_MODES)
+- speculative: Speculative decoding profile (see SPECULATIVE_PROFILES), or None
+- quantization: Weight quantization method (see QUANTIZATION_METHODS), or None for bf16
+
+Quantized variants (QUANTIZED_VARIANTS) are models of their own, keyed
+"<model>-<method>" (e.g. gemma-3-27b-fp8), so their configs are keyed
+"<model>-<method>-<gpu>".
+
+Engine settings form a profile per (model, GPU): DEFAULT_ENGINE_PROFILE, then
+the model's entry in BASE_MODELS, then ENGINE_PROFILES[model][gpu], then any
+measured settings tune.py wrote to tuning.json. Both vllm_server.py and
+vllm_gpu_server.py build their engines from the resulting ModelConfig.
 """
 
+import dataclasses
+import json
+import os
 from dataclasses import dataclass
 
+# Concurrent requests per engine replica of a container; the engine batches them continuously
+DEFAULT_MAX_CONCURRENT_INPUTS = 32
+
+# Automatic prefix caching: requests that share a prompt prefix (the same document
+# under different instructions) reuse its KV blocks instead of recomputing prefill
+DEFAULT_ENABLE_PREFIX_CACHING = True
+
+# Container boot modes:
+# - "eager": no torch.compile or CUDA graphs; fastest first boot, slowest decode
+# - "compiled": torch.compile + CUDA graphs, with compile artifacts kept on the
+#   vllm-cache volume per model, GPU and vLLM version so only the first container
+#   of a deployment pays for compilation
+# - "snapshot": "compiled", plus a Modal memory snapshot (including GPU memory)
+#   taken once the engine is up; later containers restore it instead of loading
+BOOT_MODES = ("eager", "compiled", "snapshot")
+DEFAULT_BOOT_MODE = "eager"
+
+# Speculative decoding profiles (vLLM speculative_config), picked per model or GPU with
+# "speculative". Prompt lookup ("ngram") proposes the tokens that followed the last
+# few generated tokens wherever they occur in the prompt, so output that copies spans
+# of the document (summaries, extraction) is verified several tokens per step at no
+# extra model cost. A draft model proposes with a small model of the same tokenizer,
+# which also helps on text that is not in the prompt, at the cost of its weights
+# and KV cache. Speculation pays off while decode is memory bound; at large batch
+# sizes the rejected tokens cost more compute than the saved steps.
+SPECULATIVE_PROFILES = {
+    "ngram": {"method": "ngram", "num_speculative_tokens": 4, "prompt_lookup_min": 2, "prompt_lookup_max": 5},
+    "ngram-long": {"method": "ngram", "num_speculative_tokens": 8, "prompt_lookup_min": 3, "prompt_lookup_max": 8},
+    "draft-gemma-3-1b": {"model": "google/gemma-3-1b-it", "num_speculative_tokens": 3},  # Gemma 3 tokenizer
+}
+
+# Weight quantization methods for QUANTIZED_VARIANTS, mapped to vLLM's "quantization" argument:
+# - "fp8": FP8 weights, quantized by vLLM at load time from the bf16 checkpoint (FP8 activations
+#   on L40S, H100, H200 and B200; A100 has no FP8 tensor cores and runs weight-only Marlin kernels)
+# - "awq": 4-bit AWQ weights from a pre-quantized checkpoint; left to vLLM (None), which reads the
+#   method from the checkpoint and picks the faster AWQ Marlin kernels
+QUANTIZATION_METHODS = {
+    "fp8": "fp8",
+    "awq": None,
+}
+
+# Where vLLM's compile caches live in a container (the vllm-cache volume mount)
+VLLM_CACHE_DIR = "/root/.cache/vllm"
+
+# Engine settings used where neither the model nor its (model, GPU) profile sets them
+DEFAULT_ENGINE_PROFILE = {
+    "n_gpu": 2,
+    "data_parallel": 1,
+    "max_model_len": 49000,
+    "gpu_memory_utilization": 0.90,
+    "max_num_seqs": None,
+    "max_num_batched_tokens": None,
+    "enable_chunked_prefill": True,
+    "max_concurrent_inputs": DEFAULT_MAX_CONCURRENT_INPUTS,
+    "enable_prefix_caching": DEFAULT_ENABLE_PREFIX_CACHING,
+    "boot_mode": DEFAULT_BOOT_MODE,
+    "speculative": None,
+}
+
+# GPU router limits per model: remote calls in flight, and callers allowed to wait beyond that
+DEFAULT_ROUTER_MAX_IN_FLIGHT = 256
+DEFAULT_ROUTER_MAX_QUEUE = 1024
+
+# GPU router coalescing of /v1/completions requests into one batched remote call
+# (window in milliseconds; a window of 0 disables coalescing). Off by default: the
+# engine already batches concurrent requests, so the window mostly adds latency.
+# Enable it per model with coalesce_window_ms in BASE_MODELS.
+DEFAULT_COALESCE_WINDOW_MS = 0
+DEFAULT_COALESCE_MAX_BATCH = 32
+
+# GPU router response cache for repeated deterministic requests (opt-in per model;
+# a request can also set "cache": true/false)
+DEFAULT_RESPONSE_CACHE = False
+
+# Modal autoscaling of each model class (overridable per model in BASE_MODELS): containers
+# kept running at all times, the most allowed, idle containers kept ready beyond current
+# demand, and seconds an idle container lives. deploy.py --warm raises the minimum of
+# chosen (model, GPU) pools ahead of a scheduled run.
+DEFAULT_MIN_CONTAINERS = 0
+DEFAULT_MAX_CONTAINERS = None  # no cap beyond the workspace's GPU limits
+DEFAULT_BUFFER_CONTAINERS = 0
+DEFAULT_SCALEDOWN_WINDOW = 15 * 60
+
+# Multi-model mode (MULTI_MODELS in vllm_gpu_server.py): one container hosts an engine per
+# model on MULTI_MODEL_N_GPU GPUs, with all but the one serving asleep in host memory.
+# Every engine gets the whole container (tensor parallel over all its GPUs) while awake,
+# minus headroom for the CUDA contexts of the sleeping ones.
+MULTI_MODEL_N_GPU = 2
+MULTI_MODEL_GPU_MEMORY_UTILIZATION = 0.85
+MULTI_MODEL_MIN_TURN_S = 10.0  # A busy model serves at least this long before yielding the GPUs
+MULTI_MODEL_HOST_MEMORY_OVERHEAD_GB = 32  # Host memory beyond the offloaded weights
+
 
 @dataclass
 class ModelConfig:
@@ -18,10 +130,59 @@ class ModelConfig:
     name: str  # Short name used in dex-bench (e.g., "google/gemma-3-12b-it")
     huggingface_id: str  # HuggingFace model ID
     gpu: str  # Modal GPU type
-    n_gpu: int = 1  # Number of GPUs for tensor parallelism
+    n_gpu: int = 1  # GPUs per engine replica (tensor parallelism)
+    data_parallel: int = 1  # Engine replicas per container, each on its own n_gpu GPUs
     max_model_len: int | None = None  # Max context length (None = use model default)
     revision: str | None = None  # Specific model revision/commit
     tool_parser: str | None = None  # Tool call parser (hermes, mistral, llama3_json, etc.)
+    max_concurrent_inputs: int = DEFAULT_MAX_CONCURRENT_INPUTS  # Concurrent requests per engine replica
+    enable_prefix_caching: bool = DEFAULT_ENABLE_PREFIX_CACHING  # Reuse KV blocks of shared prompt prefixes
+    boot_mode: str = DEFAULT_BOOT_MODE  # eager, compiled or snapshot (see BOOT_MODES)
+    gpu_memory_utilization: float = 0.90  # Fraction of GPU memory for weights + KV cache
+    max_num_seqs: int | None = None  # Sequences per engine step (None = vLLM default)
+    max_num_batched_tokens: int | None = None  # Tokens per engine step (None = vLLM default)
+    enable_chunked_prefill: bool = True  # Split long prefills across steps, interleaved with decode
+    speculative: str | None = None  # Speculative decoding profile (see SPECULATIVE_PROFILES)
+    quantization: str | None = None  # Weight quantization method (see QUANTIZATION_METHODS)
+
+    @property
+    def gpu_count(self) -> int:
+        """GPUs per container: ``n_gpu`` for each of the ``data_parallel`` engine replicas."""
+        return self.n_gpu * self.data_parallel
+
+    @property
+    def container_max_inputs(self) -> int:
+        """Requests a container accepts at once, across its engine replicas."""
+        return self.max_concurrent_inputs * self.data_parallel
+
+    @property
+    def num_speculative_tokens(self) -> int:
+        """Draft tokens proposed per decode step (0 without speculative decoding)."""
+        if self.speculative is None:
+            return 0
+        return SPECULATIVE_PROFILES[self.speculative]["num_speculative_tokens"]
+
+    def engine_kwargs(self) -> dict:
+        """vLLM engine arguments for this profile (AsyncEngineArgs / `vllm serve` flags).
+
+        Unset optional values are left out so vLLM picks its own default.
+        """
+        kwargs = {
+            "model": self.huggingface_id,
+            "revision": self.revision,
+            "tensor_parallel_size": self.n_gpu,
+            "data_parallel_size": self.data_parallel if self.data_parallel > 1 else None,
+            "max_model_len": self.max_model_len,
+            "gpu_memory_utilization": self.gpu_memory_utilization,
+            "max_num_seqs": self.max_num_seqs,
+            "max_num_batched_tokens": self.max_num_batched_tokens,
+            "enable_chunked_prefill": self.enable_chunked_prefill,
+            "enable_prefix_caching": self.enable_prefix_caching,
+            "enforce_eager": self.boot_mode == "eager",
+            "speculative_config": SPECULATIVE_PROFILES[self.speculative] if self.speculative else None,
+            "quantization": QUANTIZATION_METHODS[self.quantization] if self.quantization else None,
+        }
+        return {key: value for key, value in kwargs.items() if value is not None}
 
 
 # GPU types available on Modal:
@@ -35,24 +196,143 @@ GPU_OPTIONS = ["L40S", "A100-80GB", "H100", "H200", "B200"]
 
 # Base model definitions
 # tool_parser options: hermes, mistral, llama3_json, internlm, jamba, pythonic, granite-20b-fc, granite, etc.
+# class_name: name of the generated Modal class in vllm_gpu_server.py (keep stable across deploys)
+# max_concurrent_inputs: requests per engine replica handed to the engine at once (larger models get fewer)
+# enable_prefix_caching: optional override (default on); set False to always recompute prefill
+# boot_mode: optional override of DEFAULT_BOOT_MODE (eager, compiled, snapshot)
+# speculative: optional SPECULATIVE_PROFILES name; off by default, set it per GPU in ENGINE_PROFILES
+#   (or tuning.json) once loadgen.py shows the acceptance rate pays for the drafts
+# Any DEFAULT_ENGINE_PROFILE key may also be set here for all GPUs, or in ENGINE_PROFILES per GPU
+# router_max_in_flight / router_max_queue: optional overrides of the GPU router limits
+# coalesce_window_ms / coalesce_max_batch: optional overrides of the router's completion coalescing
+# response_cache: optional override of whether the router caches this model's deterministic responses
+# min_containers / max_containers / buffer_containers / scaledown_window: optional overrides of
+# the model class's Modal autoscaling (see DEFAULT_MIN_CONTAINERS)
+# weights_gb: weight footprint, i.e. host memory a sleeping engine needs in multi-model mode
+# Quantized variants are added to BASE_MODELS from QUANTIZED_VARIANTS below
 BASE_MODELS = {
     "gemma-3-12b": {
         "name": "google/gemma-3-12b-it",
         "huggingface_id": "google/gemma-3-12b-it",
+        "class_name": "Gemma3_12B",  # Modal class name in vllm_gpu_server.py
         "tool_parser": "hermes",  # Gemma uses Hermes-style tool calling
+        "max_concurrent_inputs": 64,
+        "weights_gb": 24,
     },
     "gemma-3-27b": {
         "name": "google/gemma-3-27b-it",
         "huggingface_id": "google/gemma-3-27b-it",
+        "class_name": "Gemma3_27B",
         "tool_parser": "hermes",
+        "max_concurrent_inputs": 32,
+        "weights_gb": 54,
     },
     "qwen3-vl-30b": {
         "name": "qwen/qwen3-vl-30b-a3b-instruct",
         "huggingface_id": "Qwen/Qwen3-VL-30B-A3B-Instruct",
+        "class_name": "Qwen3_VL_30B",
         "tool_parser": "hermes",
+        "max_concurrent_inputs": 48,
+        "weights_gb": 62,
+    },
+}
+
+# Quantized variants per base model: method -> overrides of the base model's entry.
+# Each becomes a BASE_MODELS entry "<model>-<method>" (served as "<name>-<method>", Modal
+# class "<class_name>_<METHOD>") that inherits the base entry and its ENGINE_PROFILES,
+# with these overrides applied on every GPU after the base profile. FP8 halves and AWQ
+# roughly quarters the bf16 weights, so models that take two GPUs in bf16 fit one L40S
+# or H100: twice the replicas for the same GPU spend, and no tensor-parallel all-reduce.
+# compare_quant.py measures what that costs in output quality and gains in throughput.
+QUANTIZED_VARIANTS = {
+    "gemma-3-12b": {
+        "fp8": {"n_gpu": 1, "weights_gb": 13},
+    },
+    "gemma-3-27b": {
+        "fp8": {"n_gpu": 1, "weights_gb": 28},
+        # Google's quantization-aware-trained int4 weights, converted to the AWQ format
+        "awq": {"huggingface_id": "gaunernst/gemma-3-27b-it-int4-awq", "n_gpu": 1, "weights_gb": 17},
+    },
+}
+
+
+def _quantized_variant(model_key: str, method: str) -> dict:
+    """BASE_MODELS entry for a quantized variant of a base model."""
+    if method not in QUANTIZATION_METHODS:
+        raise ValueError(
+            f"Unknown quantization for {model_key}: {method}. Available: {', '.join(QUANTIZATION_METHODS)}"
+        )
+    model_info = BASE_MODELS[model_key]
+    variant = dict(model_info)
+    variant.update({
+        "name": f"{model_info['name']}-{method}",
+        "class_name": f"{model_info['class_name']}_{method.upper()}",
+        "base_model": model_key,
+        "quantization": method,
+    })
+    variant.update(QUANTIZED_VARIANTS[model_key][method])
+    return variant
+
+
+BASE_MODELS.update({
+    f"{model_key}-{method}": _quantized_variant(model_key, method)
+    for model_key, methods in QUANTIZED_VARIANTS.items()
+    for method in methods
+})
+
+# Engine profile per (base model, GPU short name), over the model's BASE_MODELS
+# entry and DEFAULT_ENGINE_PROFILE. Sized from bf16 weight footprints: ~24GB for
+# gemma-3-12b, ~54GB for gemma-3-27b and ~62GB for qwen3-vl-30b (a MoE with ~3B
+# active parameters, so it decodes fast and gains most from large batches).
+# Smaller GPUs get shorter contexts and fewer sequences so the KV cache fits;
+# larger ones drop tensor parallelism where the weights fit on one GPU.
+# "data_parallel" runs that many replicas of the n_gpu engine in each container,
+# e.g. two TP=1 engines instead of one TP=2 engine: no all-reduce per layer, but
+# each replica has only its own GPU's KV cache. Which wins depends on the model and
+# GPU, so measure it with tune.py (--n-gpu 1,2 --data-parallel 1,2) before setting it.
+ENGINE_PROFILES = {
+    "gemma-3-12b": {
+        "l40s": {"n_gpu": 1, "max_model_len": 32768, "gpu_memory_utilization": 0.92,
+                 "max_num_seqs": 64, "max_num_batched_tokens": 8192},
+        "a100": {"n_gpu": 1, "max_num_seqs": 128, "max_num_batched_tokens": 8192},
+        "h100": {"n_gpu": 1, "max_num_seqs": 128, "max_num_batched_tokens": 16384},
+        "h200": {"n_gpu": 1, "max_num_seqs": 256, "max_num_batched_tokens": 16384},
+        "b200": {"n_gpu": 1, "max_num_seqs": 256, "max_num_batched_tokens": 32768},
+    },
+    "gemma-3-27b": {
+        "l40s": {"n_gpu": 2, "max_model_len": 32768, "gpu_memory_utilization": 0.92,
+                 "max_num_seqs": 32, "max_num_batched_tokens": 8192},
+        "a100": {"n_gpu": 2, "max_num_seqs": 64, "max_num_batched_tokens": 8192},
+        "h100": {"n_gpu": 2, "max_num_seqs": 96, "max_num_batched_tokens": 16384},
+        "h200": {"n_gpu": 1, "max_num_seqs": 96, "max_num_batched_tokens": 16384},
+        "b200": {"n_gpu": 1, "max_num_seqs": 128, "max_num_batched_tokens": 16384},
+    },
+    "qwen3-vl-30b": {
+        "l40s": {"n_gpu": 2, "max_model_len": 32768, "gpu_memory_utilization": 0.92,
+                 "max_num_seqs": 48, "max_num_batched_tokens": 8192},
+        "a100": {"n_gpu": 2, "max_num_seqs": 128, "max_num_batched_tokens": 16384},
+        "h100": {"n_gpu": 2, "max_num_seqs": 128, "max_num_batched_tokens": 16384},
+        "h200": {"n_gpu": 1, "max_num_seqs": 192, "max_num_batched_tokens": 16384},
+        "b200": {"n_gpu": 1, "max_num_seqs": 256, "max_num_batched_tokens": 32768},
     },
 }
 
+# Measured settings from tune.py, keyed by MODELS key ({"gemma-3-12b-h100": {"profile":
+# {...}, "measured": {...}, ...}}). Only the "profile" part is applied, over ENGINE_PROFILES.
+TUNING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tuning.json")
+
+
+def load_tuning(path: str = TUNING_FILE) -> dict:
+    """Read tuning.json; a missing file means nothing has been tuned."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+TUNED_PROFILES = load_tuning()
+
 # GPU short names for config keys
 GPU_SHORT_NAMES = {
     "L40S": "l40s",
@@ -87,6 +367,81 @@ def get_base_model_info(model_key: str) -> dict:
     return BASE_MODELS[model_key]
 
 
+def get_router_limits(model_key: str) -> tuple[int, int]:
+    """Get (max_in_flight, max_queue) for a base model in the GPU router."""
+    model_info = get_base_model_info(model_key)
+    return (
+        model_info.get("router_max_in_flight", DEFAULT_ROUTER_MAX_IN_FLIGHT),
+        model_info.get("router_max_queue", DEFAULT_ROUTER_MAX_QUEUE),
+    )
+
+
+def get_coalesce_settings(model_key: str) -> tuple[float, int]:
+    """Get (window_ms, max_batch) for coalescing a base model's completions."""
+    model_info = get_base_model_info(model_key)
+    return (
+        model_info.get("coalesce_window_ms", DEFAULT_COALESCE_WINDOW_MS),
+        model_info.get("coalesce_max_batch", DEFAULT_COALESCE_MAX_BATCH),
+    )
+
+
+def get_autoscaling(model_key: str) -> dict:
+    """Modal autoscaler settings for a base model's class (``app.cls`` / ``update_autoscaler`` kwargs)."""
+    model_info = get_base_model_info(model_key)
+    return {
+        "min_containers": model_info.get("min_containers", DEFAULT_MIN_CONTAINERS),
+        "max_containers": model_info.get("max_containers", DEFAULT_MAX_CONTAINERS),
+        "buffer_containers": model_info.get("buffer_containers", DEFAULT_BUFFER_CONTAINERS),
+        "scaledown_window": model_info.get("scaledown_window", DEFAULT_SCALEDOWN_WINDOW),
+    }
+
+
+def get_compile_cache_root(model_key: str, gpu_short: str, vllm_version: str) -> str:
+    """VLLM_CACHE_ROOT for one model on one GPU type and vLLM version.
+
+    Compiled graphs are only valid for the GPU and vLLM build that produced
+    them, so each combination gets its own directory on the vllm-cache volume.
+    """
+    return f"{VLLM_CACHE_DIR}/{model_key}/{gpu_short}/vllm-{vllm_version}"
+
+
+def is_response_cache_enabled(model_key: str) -> bool:
+    """Whether the GPU router caches a base model's deterministic responses by default."""
+    model_info = get_base_model_info(model_key)
+    return model_info.get("response_cache", DEFAULT_RESPONSE_CACHE)
+
+
+def get_engine_profile(model_key: str, gpu_short: str) -> dict:
+    """Resolve the engine profile for a base model on a GPU (see ENGINE_PROFILES).
+
+    A quantized variant starts from its base model's profile, then applies its
+    QUANTIZED_VARIANTS overrides and its own ENGINE_PROFILES entry, if any.
+    """
+    model_info = get_base_model_info(model_key)
+    base_model = model_info.get("base_model", model_key)
+    profile = dict(DEFAULT_ENGINE_PROFILE)
+    profile.update({key: model_info[key] for key in DEFAULT_ENGINE_PROFILE if key in model_info})
+    profile.update(ENGINE_PROFILES.get(base_model, {}).get(gpu_short, {}))
+    if base_model != model_key:
+        overrides = QUANTIZED_VARIANTS[base_model][model_info["quantization"]]
+        profile.update({key: overrides[key] for key in DEFAULT_ENGINE_PROFILE if key in overrides})
+        profile.update(ENGINE_PROFILES.get(model_key, {}).get(gpu_short, {}))
+    tuned = TUNED_PROFILES.get(f"{model_key}-{gpu_short}", {}).get("profile", {})
+    profile.update({key: value for key, value in tuned.items() if key in DEFAULT_ENGINE_PROFILE})
+
+    if profile["boot_mode"] not in BOOT_MODES:
+        raise ValueError(
+            f"Unknown boot_mode for {model_key}: {profile['boot_mode']}. "
+            f"Available: {', '.join(BOOT_MODES)}"
+        )
+    if profile["speculative"] is not None and profile["speculative"] not in SPECULATIVE_PROFILES:
+        raise ValueError(
+            f"Unknown speculative profile for {model_key}: {profile['speculative']}. "
+            f"Available: {', '.join(SPECULATIVE_PROFILES)}"
+        )
+    return profile
+
+
 def _generate_all_configs() -> dict[str, ModelConfig]:
     """Generate all model+GPU combinations."""
     configs: dict[str, ModelConfig] = {}
@@ -100,8 +455,10 @@ def _generate_all_configs() -> dict[str, ModelConfig]:
                 name=model_info["name"],
                 huggingface_id=model_info["huggingface_id"],
                 gpu=gpu,
-                n_gpu=2,  # Use 2 GPUs for tensor parallelism
+                revision=model_info.get("revision"),
                 tool_parser=model_info.get("tool_parser"),
+                quantization=model_info.get("quantization"),
+                **get_engine_profile(model_key, gpu_short),
             )
 
     return configs
@@ -119,6 +476,42 @@ def get_model_config(model_key: str) -> ModelConfig:
     return MODELS[model_key]
 
 
+def get_multi_model_config(model_key: str, gpu_short: str) -> ModelConfig:
+    """Configuration for a base model's engine in a multi-model container.
+
+    The model's engine profile for the GPU, as one engine tensor parallel
+    over the container's MULTI_MODEL_N_GPU GPUs. Snapshot boot is replaced by compiled
+    boot: the container's engines are put to sleep and woken by the hot
+    swapper, not by a memory snapshot.
+    """
+    config = get_model_config(f"{model_key}-{gpu_short}")
+    return dataclasses.replace(
+        config,
+        n_gpu=MULTI_MODEL_N_GPU,
+        data_parallel=1,
+        gpu_memory_utilization=min(config.gpu_memory_utilization, MULTI_MODEL_GPU_MEMORY_UTILIZATION),
+        boot_mode="compiled" if config.boot_mode == "snapshot" else config.boot_mode,
+    )
+
+
+def get_multi_model_memory_mb(model_keys: list[str]) -> int:
+    """Host memory (MiB) for a multi-model container: every model's weights can be asleep at once."""
+    weights_gb = sum(get_base_model_info(model_key)["weights_gb"] for model_key in model_keys)
+    return (weights_gb + MULTI_MODEL_HOST_MEMORY_OVERHEAD_GB) * 1024
+
+
+def get_multi_model_autoscaling(model_keys: list[str]) -> dict:
+    """Autoscaler settings for a multi-model container: the most generous of its models'."""
+    settings = [get_autoscaling(model_key) for model_key in model_keys]
+    caps = [s["max_containers"] for s in settings]
+    return {
+        "min_containers": max(s["min_containers"] for s in settings),
+        "max_containers": None if None in caps else max(caps),
+        "buffer_containers": max(s["buffer_containers"] for s in settings),
+        "scaledown_window": max(s["scaledown_window"] for s in settings),
+    }
+
+
 def list_models() -> list[str]:
     """List all available model keys."""
     return sorted(MODELS.keys())
@@ -131,5 +524,5 @@ def list_models_by_gpu(gpu: str) -> list[str]:
 
 
 def list_models_by_base(base_model: str) -> list[str]:
-    """List all GPU variants for a specific base model."""
-    return [k for k in sorted(MODELS.keys()) if k.startswith(f"{base_model}-")]
+    """List all GPU variants for a specific base model (not those of its quantized variants)."""
+    return [k for k in sorted(MODELS.keys()) if k.rsplit("-", 1)[0] == base_model]
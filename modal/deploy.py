@@ -16,8 +16,16 @@ Usage:
     uv run python deploy.py --gpu h100
     uv run python deploy.py --gpu l40s
 
-    # Deploy all 5 GPU apps
+    # Deploy all 5 GPU apps in parallel (apps unchanged since their last deploy are skipped)
     uv run python deploy.py --all
+    uv run python deploy.py --all --force
+
+    # Host several models in one container pool, hot-swapped via vLLM sleep mode
+    uv run python deploy.py --gpu h100 --multi-model gemma-3-12b,gemma-3-27b
+
+    # Download all model weights into the shared cache volume (optionally before deploying)
+    uv run python deploy.py --prefetch
+    uv run python deploy.py --all --prefetch-first
 
     # Test a GPU endpoint with a specific model
     uv run python deploy.py --test-gpu h100 --test-model gemma-3-12b
@@ -27,32 +35,170 @@ Usage:
 
     # Get endpoint URL
     uv run python deploy.py --url h100
+
+    # Pre-warm (model, GPU) pools ahead of expected traffic, e.g. from a cron job
+    uv run python deploy.py --warm gemma-3-27b-h100,qwen3-vl-30b-h100 --warm-size 2
+    uv run python deploy.py --warm gemma-3-27b-h100 --warm-size 0   # back to the registry settings
 """
 
 import argparse
+import hashlib
+import json
 import os
+import re
 import subprocess
 import sys
+import threading
+import time
+import tomllib
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     BASE_MODELS,
     GPU_OPTIONS,
     GPU_SHORT_NAMES,
     MODELS,
+    MULTI_MODEL_N_GPU,
+    get_autoscaling,
+    get_multi_model_autoscaling,
     list_models,
     list_gpu_options,
 )
 
+WARM_POLL_INTERVAL = 10  # Seconds between heartbeat checks while pre-warming
+DEPLOY_WORKERS = 5  # GPU apps deployed at once by --all
+DEPLOY_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".deploy_state.json")
+
+_print_lock = threading.Lock()
+_state_lock = threading.Lock()
 
-def run_modal_command(cmd: list[str], env: dict[str, str] | None = None) -> int:
-    """Run a modal command with optional environment variables."""
+
+def run_modal_command(cmd: list[str], env: dict[str, str] | None = None, prefix: str = "") -> int:
+    """Run a modal command with optional environment variables.
+
+    With ``prefix``, output is read line by line and printed as
+    ``[prefix] line``, so parallel deploys stay readable.
+    """
     full_env = os.environ.copy()
     if env:
         full_env.update(env)
 
-    print(f"Running: {' '.join(cmd)}")
-    result = subprocess.run(cmd, env=full_env)
-    return result.returncode
+    if not prefix:
+        print(f"Running: {' '.join(cmd)}")
+        result = subprocess.run(cmd, env=full_env)
+        return result.returncode
+
+    def emit(line: str):
+        with _print_lock:
+            print(f"[{prefix}] {line}", flush=True)
+
+    emit(f"Running: {' '.join(cmd)}")
+    process = subprocess.Popen(
+        cmd, env=full_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    )
+    for line in process.stdout:
+        emit(line.rstrip("\n"))
+    return process.wait()
+
+
+# =============================================================================
+# Change detection
+# =============================================================================
+
+
+def _image_files(server_module: str) -> list[str]:
+    """Local files a server module bakes into its image (its add_local_file calls)."""
+    with open(server_module) as f:
+        return re.findall(r'\.add_local_file\(\s*"([^"]+)"', f.read())
+
+
+def app_hash(gpu_key: str, shared: list[str], server_module: str = "vllm_gpu_server.py") -> str:
+    """Content hash of what a GPU app deploy uploads.
+
+    Covers the server module (which holds the image spec), every local file
+    in the image (config.py included), the GPU key and the multi-model list.
+    """
+    digest = hashlib.sha256(f"{gpu_key}\0{','.join(shared)}\0".encode())
+    for path in [server_module, *_image_files(server_module)]:
+        digest.update(f"{path}\0".encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _modal_target() -> str:
+    """Where deploys go: "<profile>/<environment>", plus the token ID when one is set.
+
+    Read the way the modal CLI resolves them: MODAL_PROFILE and
+    MODAL_ENVIRONMENT, else the active profile in ~/.modal.toml (or
+    MODAL_CONFIG_PATH) and its environment.
+    """
+    profile = os.environ.get("MODAL_PROFILE", "")
+    environment = os.environ.get("MODAL_ENVIRONMENT", "")
+    if not profile or not environment:
+        try:
+            with open(os.environ.get("MODAL_CONFIG_PATH") or os.path.expanduser("~/.modal.toml"), "rb") as f:
+                config = tomllib.load(f)
+        except (OSError, ValueError):
+            config = {}
+        if not profile:
+            profile = next((name for name, p in config.items() if isinstance(p, dict) and p.get("active")), "")
+        if not environment:
+            environment = config.get(profile, {}).get("environment", "")
+    target = f"{profile or 'default'}/{environment or 'default'}"
+    token_id = os.environ.get("MODAL_TOKEN_ID")
+    return f"{target}/{token_id}" if token_id else target
+
+
+def _load_deploy_state() -> dict:
+    """DEPLOY_STATE_FILE: "apps" maps "<target>/<app>" to the content hash of its last
+    successful deploy, "warm" to the classes with a pre-warm override (see warm_pools).
+    """
+    try:
+        with open(DEPLOY_STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    return {"apps": state.get("apps", {}), "warm": state.get("warm", {})}
+
+
+def _update_deploy_state(update: Callable[[dict], None]):
+    with _state_lock:
+        state = _load_deploy_state()
+        update(state)
+        with open(DEPLOY_STATE_FILE, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+
+
+def _is_deployed(app_name: str) -> bool:
+    """Whether Modal lists the app as deployed in the current environment."""
+    try:
+        result = subprocess.run(
+            ["uv", "run", "modal", "app", "list", "--json"], capture_output=True, text=True, timeout=120
+        )
+        apps = json.loads(result.stdout)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return False  # unknown: deploy rather than skip
+    return any(app.get("Description") == app_name and app.get("State") == "deployed" for app in apps)
+
+
+# =============================================================================
+# Weight prefetch
+# =============================================================================
+
+
+def prefetch_weights(force: bool = False) -> int:
+    """Download every base model into the huggingface-cache volume, in parallel."""
+    print(f"\n{'='*60}")
+    print("Prefetching model weights into the huggingface-cache volume")
+    print(f"  Models: {', '.join(BASE_MODELS.keys())}")
+    print(f"{'='*60}\n")
+
+    cmd = ["uv", "run", "modal", "run", "prefetch.py"]
+    if force:
+        cmd.append("--force")
+    return run_modal_command(cmd)
 
 
 # =============================================================================
@@ -60,41 +206,133 @@ def run_modal_command(cmd: list[str], env: dict[str, str] | None = None) -> int:
 # =============================================================================
 
 
-def deploy_gpu(gpu_key: str) -> int:
-    """Deploy a GPU-based multi-model app."""
+def _shared_models(multi_models: str) -> list[str] | None:
+    """Parse --multi-model ("all" or comma-separated keys); None (after an error message) if unknown."""
+    shared = list(BASE_MODELS) if multi_models == "all" else [k for k in multi_models.split(",") if k]
+    unknown = [model_key for model_key in shared if model_key not in BASE_MODELS]
+    if unknown:
+        print(f"Error: Unknown model(s) for --multi-model: {', '.join(unknown)}")
+        print(f"Available models: {', '.join(BASE_MODELS.keys())}")
+        return None
+    return shared
+
+
+def _deploy_gpu_app(gpu_key: str, shared: list[str], force: bool = False, prefix: str = "") -> str:
+    """Deploy one GPU app unless unchanged; returns "deployed", "unchanged" or "failed".
+
+    An app is unchanged when its content hash matches its last successful
+    deploy to the same Modal profile and environment and Modal still lists
+    it as deployed. Apps with a pre-warm override are always redeployed, which
+    puts their autoscaling back to the registry settings.
+    """
+    app_name = f"vllm-{gpu_key}"
+    state_key = f"{_modal_target()}/{app_name}"
+    content_hash = app_hash(gpu_key, shared)
+    state = _load_deploy_state()
+    warmed = state["warm"].get(state_key)
+    if warmed:
+        message = f"Pre-warm override on {', '.join(warmed)}; redeploying to restore the registry autoscaling"
+        if prefix:
+            with _print_lock:
+                print(f"[{prefix}] {message}")
+        else:
+            print(message)
+    elif not force and state["apps"].get(state_key) == content_hash and _is_deployed(app_name):
+        return "unchanged"
+    result = run_modal_command(
+        ["uv", "run", "modal", "deploy", "vllm_gpu_server.py"],
+        env={"GPU_KEY": gpu_key, "MULTI_MODELS": ",".join(shared)},
+        prefix=prefix,
+    )
+    if result != 0:
+        return "failed"
+
+    def record(state: dict):
+        state["apps"][state_key] = content_hash
+        state["warm"].pop(state_key, None)
+
+    _update_deploy_state(record)
+    return "deployed"
+
+
+def deploy_gpu(gpu_key: str, multi_models: str = "", force: bool = False) -> int:
+    """Deploy a GPU-based multi-model app.
+
+    ``multi_models`` ("all" or comma-separated model keys) puts those models
+    in one hot-swapped container pool (MULTI_MODELS in vllm_gpu_server.py).
+    The deploy is skipped if nothing it uploads changed since the last
+    successful one (see app_hash), unless ``force`` is set.
+    """
     gpu_options = list_gpu_options()
     if gpu_key not in gpu_options:
         print(f"Error: Unknown GPU '{gpu_key}'")
         print(f"Available GPUs: {', '.join(gpu_options)}")
         return 1
 
+    shared = _shared_models(multi_models)
+    if shared is None:
+        return 1
+
     print(f"\n{'='*60}")
     print(f"Deploying vllm-{gpu_key} (multi-model server)")
     print(f"  GPU: {gpu_key.upper()}")
     print(f"  Models: {', '.join(BASE_MODELS.keys())}")
+    if shared:
+        print(f"  Sharing {MULTI_MODEL_N_GPU} GPUs (hot swap): {', '.join(shared)}")
     print(f"{'='*60}\n")
 
-    return run_modal_command(
-        ["uv", "run", "modal", "deploy", "vllm_gpu_server.py"],
-        env={"GPU_KEY": gpu_key},
-    )
+    status = _deploy_gpu_app(gpu_key, shared, force)
+    if status == "unchanged":
+        print(f"vllm-{gpu_key} is unchanged since its last deploy; skipping (use --force to redeploy)")
+        print(f"Pre-warmed pools stay up until a redeploy or --warm <model>-{gpu_key} --warm-size 0")
+    return 1 if status == "failed" else 0
+
 
+def deploy_all_gpus(multi_models: str = "", force: bool = False, workers: int = DEPLOY_WORKERS) -> int:
+    """Deploy all GPU-based apps (5 total), ``workers`` at a time.
 
-def deploy_all_gpus() -> int:
-    """Deploy all GPU-based apps (5 total)."""
-    failed = []
+    Each app's output is prefixed with its GPU key. Apps unchanged since
+    their last successful deploy are skipped unless ``force`` is set.
+    """
     gpu_options = list_gpu_options()
+    shared = _shared_models(multi_models)
+    if shared is None:
+        return 1
 
-    for gpu_key in gpu_options:
-        result = deploy_gpu(gpu_key)
-        if result != 0:
-            failed.append(gpu_key)
+    print(f"\n{'='*60}")
+    print(f"Deploying {len(gpu_options)} GPU apps, {workers} at a time")
+    print(f"  Models: {', '.join(BASE_MODELS.keys())}")
+    if shared:
+        print(f"  Sharing {MULTI_MODEL_N_GPU} GPUs (hot swap): {', '.join(shared)}")
+    print(f"{'='*60}\n")
 
+    def deploy(gpu_key: str) -> tuple[str, float]:
+        started = time.time()
+        try:
+            status = _deploy_gpu_app(gpu_key, shared, force, prefix=gpu_key)
+        except Exception as e:
+            with _print_lock:
+                print(f"[{gpu_key}] Error: {e}")
+            status = "failed"
+        return status, time.time() - started
+
+    started = time.time()
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        results = dict(zip(gpu_options, pool.map(deploy, gpu_options)))
+    elapsed = time.time() - started
+
+    print(f"\n{'App':<12} | {'Status':<9} | {'Time':>7}")
+    print("-" * 12 + "-+-" + "-" * 9 + "-+-" + "-" * 7)
+    for gpu_key, (status, seconds) in results.items():
+        print(f"{'vllm-' + gpu_key:<12} | {status:<9} | {seconds:>6.0f}s")
+    print(f"Total: {elapsed:.0f}s")
+
+    failed = [gpu_key for gpu_key, (status, _) in results.items() if status == "failed"]
     if failed:
         print(f"\nFailed to deploy: {', '.join(failed)}")
         return 1
 
-    print(f"\nSuccessfully deployed all {len(gpu_options)} GPU apps!")
+    print(f"\nAll {len(gpu_options)} GPU apps are up to date!")
     print("Each app serves all models on its GPU type.")
     return 0
 
@@ -136,6 +374,102 @@ def get_gpu_url(gpu_key: str) -> int:
     return 0
 
 
+# =============================================================================
+# Pre-warming
+# =============================================================================
+
+
+def _record_warm_override(app_name: str, class_name: str, active: bool):
+    """Note (or clear) a pre-warm override, so the next --gpu/--all redeploys the app."""
+    state_key = f"{_modal_target()}/{app_name}"
+
+    def record(state: dict):
+        classes = set(state["warm"].get(state_key, []))
+        if active:
+            classes.add(class_name)
+        else:
+            classes.discard(class_name)
+        if classes:
+            state["warm"][state_key] = sorted(classes)
+        else:
+            state["warm"].pop(state_key, None)
+
+    _update_deploy_state(record)
+
+
+def warm_pools(targets: str, size: int = 1, timeout_s: float = 1200, multi_models: str = "") -> int:
+    """Bring (model, GPU) container pools to ``size`` warm containers and wait until they serve.
+
+    ``targets`` are comma-separated MODELS keys (gemma-3-27b-h100). Each
+    pool's min_containers is raised through update_autoscaler; the override
+    lasts until the app is next deployed, which goes back to the registry
+    settings (get_autoscaling). The override is noted in DEPLOY_STATE_FILE,
+    so --gpu/--all redeploy the app even when it is otherwise unchanged.
+    ``size`` 0 restores those settings right away.
+    A container counts as warm once its engine heartbeat shows up in the
+    app's engine-metrics Dict. ``multi_models`` must match the deployed
+    --multi-model so that shared models resolve to the MultiModel pool.
+    """
+    import modal
+
+    from metrics import warm_containers
+
+    shared = list(BASE_MODELS) if multi_models == "all" else [k for k in multi_models.split(",") if k]
+    pools = {}  # (gpu_short, class_name) -> (hosted model keys, autoscaler settings)
+    for target in [t for t in targets.split(",") if t]:
+        if target not in MODELS:
+            print(f"Error: Unknown model '{target}'")
+            print(f"Available models: {', '.join(list_models())}")
+            return 1
+        model_key, gpu_short = target.rsplit("-", 1)
+        if model_key in shared:
+            hosted, class_name, settings = shared, "MultiModel", get_multi_model_autoscaling(shared)
+        else:
+            hosted, class_name = [model_key], BASE_MODELS[model_key]["class_name"]
+            settings = get_autoscaling(model_key)
+        if settings["max_containers"] is not None and settings["max_containers"] < size:
+            print(f"Error: {target} is capped at max_containers={settings['max_containers']}")
+            return 1
+        pools[(gpu_short, class_name)] = (hosted, settings)
+
+    print(f"\n{'='*60}")
+    print(f"{'Restoring' if size == 0 else 'Pre-warming'} {len(pools)} container pool(s)")
+    for (gpu_short, class_name), (_, settings) in pools.items():
+        min_containers = max(size, settings["min_containers"])
+        print(f"  vllm-{gpu_short}/{class_name}: min_containers={min_containers}")
+        cls = modal.Cls.from_name(f"vllm-{gpu_short}", class_name)
+        cls().update_autoscaler(**{**settings, "min_containers": min_containers})
+        _record_warm_override(f"vllm-{gpu_short}", class_name, min_containers > settings["min_containers"])
+    print(f"{'='*60}\n")
+    if size == 0:
+        return 0
+
+    started = time.time()
+    pending = dict(pools)
+    while pending:
+        elapsed = time.time() - started
+        heartbeats = {
+            gpu_short: list(modal.Dict.from_name(f"vllm-{gpu_short}-engine-metrics").values())
+            for gpu_short in {gpu_short for gpu_short, _ in pending}
+        }
+        for (gpu_short, class_name), (hosted, _) in list(pending.items()):
+            counts = warm_containers(heartbeats[gpu_short])
+            warm = max(counts.get(model_key, 0) for model_key in hosted)
+            print(f"  [{elapsed:5.0f}s] vllm-{gpu_short}/{class_name}: {warm}/{size} warm")
+            if warm >= size:
+                print(f"  vllm-{gpu_short}/{class_name} ready after {elapsed:.0f}s")
+                del pending[(gpu_short, class_name)]
+        if pending and elapsed > timeout_s:
+            names = ", ".join(f"vllm-{gpu_short}/{class_name}" for gpu_short, class_name in pending)
+            print(f"\nTimed out after {timeout_s:.0f}s waiting for: {names}")
+            return 1
+        if pending:
+            time.sleep(WARM_POLL_INTERVAL)
+
+    print(f"\nAll {len(pools)} pool(s) warm after {time.time() - started:.0f}s")
+    return 0
+
+
 # =============================================================================
 # Legacy: Model-based deployment (one app per model+GPU)
 # =============================================================================
@@ -152,7 +486,7 @@ def deploy_model(model_key: str) -> int:
     print(f"\n{'='*60}")
     print(f"Deploying {model_key} (legacy single-model mode)")
     print(f"  HuggingFace ID: {config.huggingface_id}")
-    print(f"  GPU: {config.gpu} x{config.n_gpu}")
+    print(f"  GPU: {config.gpu} x{config.gpu_count}")
     print(f"{'='*60}\n")
 
     return run_modal_command(
@@ -203,6 +537,28 @@ def list_available() -> int:
     print(f"  Models per GPU: {', '.join(BASE_MODELS.keys())}")
     print(f"  Total endpoints: {len(list_gpu_options())} (under 8 limit)")
 
+    print("\nEngine profiles (ENGINE_PROFILES in config.py):")
+    print(f"  {'Model':<15} | {'Quant':<5} | {'GPU':<5} | {'TP':>2} | {'DP':>2} | {'Max len':>7} | {'Mem':>4} | {'Seqs':>5} | "
+          f"{'Batch tok':>9} | {'Boot':<8} | Speculative")
+    for base_model in BASE_MODELS.keys():
+        for gpu in GPU_OPTIONS:
+            gpu_short = GPU_SHORT_NAMES[gpu]
+            config = MODELS[f"{base_model}-{gpu_short}"]
+            print(
+                f"  {base_model:<15} | {config.quantization or 'bf16':<5} | {gpu_short:<5} | {config.n_gpu:>2} | {config.data_parallel:>2} | "
+                f"{config.max_model_len or '-':>7} | "
+                f"{config.gpu_memory_utilization:>4.2f} | {config.max_num_seqs or '-':>5} | "
+                f"{config.max_num_batched_tokens or '-':>9} | {config.boot_mode:<8} | {config.speculative or '-'}"
+            )
+
+    print("\nAutoscaling per model (min/max/buffer containers, scaledown window):")
+    for base_model in BASE_MODELS.keys():
+        settings = get_autoscaling(base_model)
+        print(
+            f"  {base_model:<15} | min {settings['min_containers']} | max {settings['max_containers'] or '-'} | "
+            f"buffer {settings['buffer_containers']} | scaledown {settings['scaledown_window']}s"
+        )
+
     print("\nUsage:")
     print("  uv run python deploy.py --gpu h100      # Deploy H100 app")
     print("  uv run python deploy.py --all           # Deploy all 5 GPU apps")
@@ -240,10 +596,23 @@ def main():
         epilog="""
 GPU-based deployment (recommended - uses 5 endpoints):
   uv run python deploy.py --gpu h100           Deploy H100 multi-model app
-  uv run python deploy.py --all                Deploy all 5 GPU apps
+  uv run python deploy.py --all                Deploy all 5 GPU apps in parallel
+  uv run python deploy.py --all --force        Redeploy apps even if unchanged
+  uv run python deploy.py --gpu h100 --multi-model all
+                                               Hot-swap all models in one 2-GPU pool
   uv run python deploy.py --test-gpu h100      Test H100 endpoint
   uv run python deploy.py --url h100           Get H100 endpoint URL
 
+Pre-warming (raises min_containers until the next deploy):
+  uv run python deploy.py --warm gemma-3-27b-h100 --warm-size 2
+                                               Wait until 2 containers serve
+  uv run python deploy.py --warm gemma-3-27b-h100 --warm-size 0
+                                               Restore the registry settings
+
+Weight prefetch (fills the shared HuggingFace cache volume):
+  uv run python deploy.py --prefetch           Download and verify all models
+  uv run python deploy.py --all --prefetch-first
+
 Legacy model-based deployment (uses 15 endpoints - exceeds limit):
   uv run python deploy.py --model gemma-3-12b-l40s
   uv run python deploy.py --test gemma-3-12b-l40s
@@ -276,6 +645,17 @@ Legacy model-based deployment (uses 15 endpoints - exceeds limit):
         type=str,
         help="Get endpoint URL for a GPU app or model",
     )
+    group.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Download and verify all model weights into the cache volume",
+    )
+    group.add_argument(
+        "--warm",
+        type=str,
+        metavar="TARGETS",
+        help="Pre-warm these model+GPU pools (comma-separated, e.g. gemma-3-27b-h100)",
+    )
     group.add_argument(
         "--list",
         "-l",
@@ -304,15 +684,63 @@ Legacy model-based deployment (uses 15 endpoints - exceeds limit):
         default="gemma-3-12b",
         help="Model to test with --test-gpu (default: gemma-3-12b)",
     )
+    parser.add_argument(
+        "--prefetch-first",
+        action="store_true",
+        help="Prefetch model weights before deploying (with --gpu, --all or --model)",
+    )
+    parser.add_argument(
+        "--multi-model",
+        type=str,
+        default="",
+        metavar="MODELS",
+        help="With --gpu, --all or --warm, host these models (comma-separated, or 'all') in one "
+             "hot-swapped container pool",
+    )
+    parser.add_argument(
+        "--warm-size",
+        type=int,
+        default=1,
+        help="With --warm, containers to keep warm per pool (0 = restore registry settings; default: 1)",
+    )
+    parser.add_argument(
+        "--warm-timeout",
+        type=float,
+        default=1200,
+        help="With --warm, seconds to wait for the pools to be ready (default: 1200)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --prefetch, re-verify models that are already complete; with --gpu or --all, "
+             "redeploy apps that are unchanged since their last deploy",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=DEPLOY_WORKERS,
+        help=f"With --all, GPU apps deployed at once (default: {DEPLOY_WORKERS})",
+    )
 
     args = parser.parse_args()
 
+    if args.prefetch_first and (args.gpu or args.all or args.model):
+        result = prefetch_weights(args.force)
+        if result != 0:
+            print("Prefetch failed; not deploying")
+            return result
+
     if args.list:
         return list_available()
+    elif args.prefetch:
+        return prefetch_weights(args.force)
     elif args.gpu:
-        return deploy_gpu(args.gpu)
+        return deploy_gpu(args.gpu, args.multi_model, args.force)
     elif args.all:
-        return deploy_all_gpus()
+        return deploy_all_gpus(args.multi_model, args.force, args.jobs)
+    elif args.warm:
+        return warm_pools(args.warm, args.warm_size, args.warm_timeout, args.multi_model)
     elif args.test_gpu:
         return test_gpu(args.test_gpu, args.test_model)
     elif args.url:
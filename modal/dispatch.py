@@ -0,0 +1,186 @@
+"""
+Request dispatch primitives for the multi-model GPU router.
+
+These helpers are asyncio-native, so the router in vllm_gpu_server.py can
+use them inside its event loop without blocking it.
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+
+class QueueFullError(Exception):
+    """Raised when a model's wait queue is already at capacity."""
+
+
+class ModelGate:
+    """Caps in-flight remote calls for one model behind a bounded wait queue.
+
+    Up to ``max_in_flight`` callers hold a slot at once. Up to ``max_queue``
+    further callers wait for a slot in FIFO order; anyone beyond that is
+    rejected immediately with ``QueueFullError`` instead of piling up.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight slot for the duration of the ``async with`` block."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise QueueFullError(
+                f"{self.in_flight} requests in flight and {self.waiting} queued"
+            )
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """Current occupancy, for health and debugging endpoints."""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+
+class RequestCoalescer:
+    """Merges compatible text-completion requests into one batched remote call.
+
+    Requests whose sampling/structured-output parameters are identical share a
+    pending batch. A batch is sent once ``max_batch`` prompts have been
+    collected or ``window_s`` seconds after its first request arrived,
+    whichever comes first. ``send_batch(params, prompts)`` must return a
+    completion response whose choices follow the prompt order (``params["n"]``
+    consecutive choices per prompt when set) and carry a per-choice ``usage``
+    block; each caller gets back a response with only its own choices and
+    usage.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[dict, list[str]], Awaitable[dict]],
+        window_s: float,
+        max_batch: int,
+    ):
+        self.send_batch = send_batch
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._pending: dict[str, _PendingBatch] = {}
+        self._sending: set[asyncio.Task] = set()  # keep in-flight sends referenced
+        self.batches_sent = 0
+        self.requests_coalesced = 0
+
+    async def submit(self, params: dict, prompts: list[str]) -> dict:
+        """Queue ``prompts`` under ``params`` and wait for this request's share."""
+        key = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.prompts) + len(prompts) > self.max_batch:
+            # Send what has been collected so far rather than overfilling it
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = _PendingBatch(params)
+            self._pending[key] = batch
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window_s, self._flush, key
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        choices_per_prompt = params.get("n", 1)
+        batch.waiters.append(
+            (future, len(batch.prompts) * choices_per_prompt, len(prompts) * choices_per_prompt)
+        )
+        batch.prompts.extend(prompts)
+
+        if len(batch.prompts) >= self.max_batch:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: str):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        self.batches_sent += 1
+        self.requests_coalesced += len(batch.waiters)
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: "_PendingBatch"):
+        try:
+            result = await self.send_batch(batch.params, batch.prompts)
+        except Exception as e:
+            for future, _, _ in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, start, count in batch.waiters:
+            if not future.done():
+                future.set_result(_slice_completion(result, start, count))
+
+    def stats(self) -> dict:
+        """Batching effectiveness, for health and debugging endpoints."""
+        return {
+            "batches_sent": self.batches_sent,
+            "requests_coalesced": self.requests_coalesced,
+            "pending_batches": len(self._pending),
+        }
+
+
+class _PendingBatch:
+    """Prompts and waiting callers collected for one coalesced remote call."""
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.prompts: list[str] = []
+        self.waiters: list[tuple[asyncio.Future, int, int]] = []  # (future, first choice, choice count)
+        self.timer: asyncio.TimerHandle | None = None
+
+
+def _slice_completion(result: dict, start: int, count: int) -> dict:
+    """Cut one caller's choices and usage out of a batched completion response."""
+    choices = []
+    prompt_tokens = 0
+    completion_tokens = 0
+    details: dict[str, dict[str, int]] = {}
+    for index, choice in enumerate(result["choices"][start : start + count]):
+        choice = dict(choice)
+        usage = choice.pop("usage", None) or {}
+        prompt_tokens += usage.get("prompt_tokens", 0)
+        completion_tokens += usage.get("completion_tokens", 0)
+        # prompt_tokens_details / completion_tokens_details: sum each counter
+        for field in ("prompt_tokens_details", "completion_tokens_details"):
+            for name, value in (usage.get(field) or {}).items():
+                totals = details.setdefault(field, {})
+                totals[name] = totals.get(name, 0) + value
+        choice["index"] = index
+        choices.append(choice)
+
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        **details,
+    }
+    return {**result, "choices": choices, "usage": usage}
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for the GPU model classes, for running router.py locally.
+
+FakeModel has the same chat / complete / chat_stream / complete_stream /
+health methods as the model classes in vllm_gpu_server.py and returns
+responses of the same shape (and engine heartbeats for /metrics), with configurable latency and token rate
+instead of a GPU. Wrapped in router.LocalHandle it lets the real router run
+on a laptop: bench_router.py drives it in-process, and running this file
+serves it over HTTP (for loadgen.py or curl), with batch jobs (batch.py)
+run in-process and stored under --batch-dir.
+
+Usage:
+    uv run python fake_engine.py --port 8000 --ttft 0.2 --tokens-per-s 50
+    uv run python loadgen.py --base-url http://127.0.0.1:8000 --rate 20 --duration 30
+    curl -X POST http://127.0.0.1:8000/v1/batches --data-binary @requests.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+from typing import Any
+
+from batch import BatchStore, run_job
+from config import BASE_MODELS
+from router import LocalHandle, create_app
+from structured_schemas import structured_outputs_spec
+
+# Returned as the generated text when a request asks for structured output
+FAKE_JSON = json.dumps({"extractions": [], "relationships": []})
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict[str, Any]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class FakeModel:
+    """Generates filler tokens with GPU-like timing.
+
+    Each call waits ``hop_s`` (the Modal call overhead), then ``ttft_s``
+    before the first token, then produces ``output_tokens`` tokens (capped
+    by max_tokens) at ``tokens_per_s``. A rate of 0 produces them all at
+    once; with every delay at 0 a call never sleeps, so only the caller's
+    own CPU cost is left to measure. Prompt tokens are estimated at four
+    characters per token.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        hop_s: float = 0.0,
+        ttft_s: float = 0.0,
+        tokens_per_s: float = 0.0,
+        output_tokens: int = 64,
+    ):
+        self.model_name = model_name
+        self.hop_s = hop_s
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.output_tokens = output_tokens
+        self.calls = 0
+        self.running = 0
+        self.generation_tokens = 0
+        self.container = uuid.uuid4().hex[:12]
+        self.started = time.time()
+
+    async def _sleep(self, seconds: float):
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def _num_tokens(self, max_tokens: int) -> int:
+        return max(1, min(self.output_tokens, max_tokens))
+
+    def _text(self, num_tokens: int, structured: bool) -> str:
+        return FAKE_JSON if structured else "lorem " * num_tokens
+
+    async def _generate(self, num_tokens: int, sequences: int = 1):
+        """Wait as long as ``sequences`` parallel sequences of ``num_tokens`` take."""
+        self.calls += 1
+        self.running += 1
+        decode_s = num_tokens / self.tokens_per_s if self.tokens_per_s else 0.0
+        try:
+            await self._sleep(self.hop_s + self.ttft_s + decode_s)
+        finally:
+            self.running -= 1
+        self.generation_tokens += num_tokens * sequences
+
+    async def chat(
+        self,
+        messages: list[dict],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        top_p: float = 1.0,
+        response_format: dict | None = None,
+        structured_outputs: dict | None = None,
+        strip_thinking: bool = False,
+        n: int = 1,
+        best_of: int | None = None,
+        **kwargs,
+    ) -> dict[str, Any]:
+        num_tokens = self._num_tokens(max_tokens)
+        structured = structured_outputs_spec(response_format, structured_outputs) is not None
+        candidates = max(n, best_of or n)
+        await self._generate(num_tokens, candidates)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        return {
+            "id": f"chatcmpl-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model_name,
+            "choices": [
+                {
+                    "index": index,
+                    "message": {"role": "assistant", "content": self._text(num_tokens, structured)},
+                    "finish_reason": "stop",
+                }
+                for index in range(n)
+            ],
+            "usage": _usage(prompt_tokens, num_tokens * candidates),
+        }
+
+    async def complete(
+        self,
+        prompt: str | list[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        top_p: float = 1.0,
+        echo: bool = False,
+        response_format: dict | None = None,
+        structured_outputs: dict | None = None,
+        include_choice_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        best_of: int | None = None,
+        **kwargs,
+    ) -> dict[str, Any]:
+        prompts = [prompt] if isinstance(prompt, str) else prompt
+        num_tokens = self._num_tokens(max_tokens)
+        structured = structured_outputs_spec(response_format, structured_outputs) is not None
+        candidates = max(n, best_of or n)
+        await self._generate(num_tokens, len(prompts) * candidates)  # batched, as by the engine
+
+        choices = []
+        for i, p in enumerate(prompts):
+            for j in range(n):
+                text = self._text(num_tokens, structured)
+                choice = {"index": i * n + j, "text": p + text if echo else text, "finish_reason": "stop",
+                          "logprobs": None}
+                if include_choice_usage:
+                    # As on the engine: the first choice also carries the prompt and unreturned candidates
+                    choice["usage"] = _usage(len(p) // 4 if j == 0 else 0,
+                                             num_tokens * (candidates - n + 1) if j == 0 else num_tokens)
+                choices.append(choice)
+        return {
+            "id": f"cmpl-{time.time_ns()}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": self.model_name,
+            "choices": choices,
+            "usage": _usage(sum(len(p) for p in prompts) // 4, num_tokens * len(prompts) * candidates),
+        }
+
+    async def chat_stream(
+        self,
+        messages: list[dict],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        top_p: float = 1.0,
+        response_format: dict | None = None,
+        structured_outputs: dict | None = None,
+        include_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        **kwargs,
+    ):
+        num_tokens = self._num_tokens(max_tokens)
+        chunk_id = f"chatcmpl-{time.time_ns()}"
+        created = int(time.time())
+
+        def chunk(index: int, delta: dict, finish_reason: str | None = None) -> dict[str, Any]:
+            return {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": self.model_name,
+                "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        self.calls += 1
+        await self._sleep(self.hop_s)
+        for index in range(n):
+            yield chunk(index, {"role": "assistant", "content": ""})
+        await self._sleep(self.ttft_s)
+        for i in range(num_tokens):
+            if i and self.tokens_per_s:
+                await asyncio.sleep(1 / self.tokens_per_s)
+            for index in range(n):
+                yield chunk(index, {"content": "lorem "})
+        self.generation_tokens += num_tokens * n
+        for index in range(n):
+            yield chunk(index, {}, "stop")
+        if include_usage:
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+            yield {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": self.model_name,
+                "choices": [],
+                "usage": _usage(prompt_tokens, num_tokens * n),
+            }
+
+    async def complete_stream(
+        self,
+        prompt: str | list[str],
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        top_p: float = 1.0,
+        echo: bool = False,
+        response_format: dict | None = None,
+        structured_outputs: dict | None = None,
+        include_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        **kwargs,
+    ):
+        prompts = [prompt] if isinstance(prompt, str) else prompt
+        choices = len(prompts) * n
+        num_tokens = self._num_tokens(max_tokens)
+        chunk_id = f"cmpl-{time.time_ns()}"
+        created = int(time.time())
+
+        def chunk(index: int, text: str, finish_reason: str | None = None) -> dict[str, Any]:
+            return {
+                "id": chunk_id,
+                "object": "text_completion",
+                "created": created,
+                "model": self.model_name,
+                "choices": [{"index": index, "text": text, "finish_reason": finish_reason, "logprobs": None}],
+            }
+
+        self.calls += 1
+        await self._sleep(self.hop_s)
+        if echo:
+            for i in range(choices):
+                yield chunk(i, prompts[i // n])
+        await self._sleep(self.ttft_s)
+        for step in range(num_tokens):
+            if step and self.tokens_per_s:
+                await asyncio.sleep(1 / self.tokens_per_s)
+            for i in range(choices):
+                yield chunk(i, "lorem ")
+        self.generation_tokens += num_tokens * choices
+        for i in range(choices):
+            yield chunk(i, "", "stop")
+        if include_usage:
+            yield {
+                "id": chunk_id,
+                "object": "text_completion",
+                "created": created,
+                "model": self.model_name,
+                "choices": [],
+                "usage": _usage(sum(len(p) for p in prompts) // 4, num_tokens * choices),
+            }
+
+    async def run_batch(self, requests: list[dict]) -> list[dict]:
+        async def run_one(request: dict) -> dict:
+            method = self.chat if request["endpoint"] == "chat" else self.complete
+            try:
+                return {"index": request["index"], "response": await method(**request["params"])}
+            except Exception as e:
+                return {"index": request["index"], "error": f"{type(e).__name__}: {e}"}
+
+        return list(await asyncio.gather(*(run_one(request) for request in requests)))
+
+    def health(self) -> dict:
+        return {"status": "ok", "model": self.model_name, "fake": True, "calls": self.calls}
+
+    def heartbeat(self, model_key: str) -> dict:
+        """Engine stats in the shape the GPU model containers publish."""
+        return {
+            "model": model_key,
+            "container": self.container,
+            "boot_mode": "fake",
+            "started": self.started,
+            "boot_s": 0.0,
+            "updated": time.time(),
+            "requests_running": self.running,
+            "requests_waiting": 0,
+            "generation_tokens_total": self.generation_tokens,
+        }
+
+
+def fake_handles(model_keys: list[str] | None = None, **settings) -> dict[str, LocalHandle]:
+    """Router handles for fake models, one per base model (FakeModel settings apply to all)."""
+    return {
+        key: LocalHandle(FakeModel(BASE_MODELS[key]["name"], **settings))
+        for key in (model_keys or BASE_MODELS)
+    }
+
+
+def fake_engine_stats(handles: dict[str, LocalHandle]):
+    """``engine_stats`` callback for create_app that reads the fake models' heartbeats."""
+
+    async def read() -> list[dict]:
+        return [handle.instance.heartbeat(key) for key, handle in handles.items()]
+
+    return read
+
+
+def local_batches(handles: dict[str, LocalHandle], directory: str) -> BatchStore:
+    """BatchStore whose jobs run as tasks in this process, over the given handles."""
+    running: set[asyncio.Task] = set()
+
+    async def run_shard(model_key: str, requests: list[dict]) -> list[dict]:
+        return await handles[model_key].call("run_batch", requests=requests)
+
+    async def launch(job_id: str):
+        task = asyncio.create_task(run_job(store, job_id, run_shard))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    store = BatchStore(directory, launch=launch)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the GPU router locally over fake models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--api-key", default="", help="Require this Bearer token (default: no auth)")
+    parser.add_argument("--hop", type=float, default=0.0, help="Seconds added to every model call")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="Decode rate per request (0 = instant)")
+    parser.add_argument("--output-tokens", type=int, default=64, help="Tokens generated per request")
+    parser.add_argument("--batch-dir", help="Where batch jobs are stored (default: a temporary directory)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    handles = fake_handles(
+        hop_s=args.hop, ttft_s=args.ttft, tokens_per_s=args.tokens_per_s, output_tokens=args.output_tokens
+    )
+    api = create_app(
+        handles,
+        gpu_key="fake",
+        api_key=args.api_key,
+        engine_stats=fake_engine_stats(handles),
+        batches=local_batches(handles, args.batch_dir or tempfile.mkdtemp(prefix="batches-")),
+    )
+    uvicorn.run(api, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
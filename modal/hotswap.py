@@ -0,0 +1,121 @@
+"""
+Time-sharing one container's GPUs between several sleeping vLLM engines.
+
+In multi-model mode (see MultiModel in vllm_gpu_server.py) a container loads
+an engine per hosted model and puts all but one to sleep: a sleeping engine
+has its weights offloaded to host memory and its KV cache freed, so the
+awake one gets the GPUs to itself. HotSwapper decides which engine is awake.
+
+``switch(previous, model)`` is the only hook into the engines: it puts the
+previous engine to sleep and wakes the next.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+
+
+class HotSwapper:
+    """Lets requests for one model at a time run, swapping engines between them.
+
+    A request for the awake model runs at once. A request for a sleeping
+    model waits until the awake model has no requests in flight, then
+    ``switch(previous, model)`` sleeps the one and wakes the other. While
+    other models are waiting, a busy model keeps admitting new requests for
+    ``min_turn_s`` after it woke and is then drained, so mixed traffic swaps
+    every few seconds at most instead of on every request. Waiting models
+    take turns in the order they started waiting.
+    """
+
+    def __init__(
+        self,
+        switch: Callable[[str | None, str], Awaitable],
+        min_turn_s: float,
+        active: str | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.switch = switch
+        self.min_turn_s = min_turn_s
+        self.active = active
+        self.clock = clock
+        self.active_since = clock()
+        self.in_flight = 0
+        self.waiting: dict[str, int] = {}  # insertion order = order models started waiting
+        self.swaps = 0
+        self.swap_seconds = 0.0
+        self._switching = False
+        self._changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def use(self, model_key: str):
+        """Keep ``model_key``'s engine awake for the duration of the ``async with`` block."""
+        await self._acquire(model_key)
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.in_flight -= 1
+                if self.in_flight == 0:
+                    self._changed.notify_all()
+
+    def _admits(self, model_key: str) -> bool:
+        if self._switching or self.active != model_key:
+            return False
+        others_waiting = any(key != model_key for key in self.waiting)
+        return not others_waiting or self.clock() - self.active_since < self.min_turn_s
+
+    def _next_turn(self) -> str | None:
+        return next((key for key in self.waiting if key != self.active), None)
+
+    async def _acquire(self, model_key: str):
+        async with self._changed:
+            if self._admits(model_key):
+                self.in_flight += 1
+                return
+            self.waiting[model_key] = self.waiting.get(model_key, 0) + 1
+            try:
+                while not self._admits(model_key):
+                    if not self._switching and self.in_flight == 0 and self._next_turn() == model_key:
+                        break
+                    await self._changed.wait()
+                else:
+                    self.in_flight += 1
+                    return
+            finally:
+                self.waiting[model_key] -= 1
+                if not self.waiting[model_key]:
+                    del self.waiting[model_key]
+                    self._changed.notify_all()  # the awake model may now admit its waiters
+            # This caller swaps; everyone else waits until the engine is awake
+            self._switching = True
+            previous = self.active
+
+        start = time.time()
+        try:
+            await self.switch(previous, model_key)
+        except BaseException:
+            async with self._changed:
+                self.active = None  # unknown which engine is awake; the next swap just wakes
+                self._switching = False
+                self._changed.notify_all()
+            raise
+
+        async with self._changed:
+            self.active = model_key
+            self.active_since = self.clock()
+            self._switching = False
+            self.swaps += 1
+            self.swap_seconds += time.time() - start
+            self.in_flight += 1
+            self._changed.notify_all()
+
+    def stats(self) -> dict:
+        """Awake model, queue and swap counters, for health endpoints."""
+        return {
+            "active": self.active,
+            "in_flight": self.in_flight,
+            "waiting": dict(self.waiting),
+            "swaps": self.swaps,
+            "mean_swap_s": self.swap_seconds / self.swaps if self.swaps else 0.0,
+        }
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for OpenAI-compatible endpoints.
+
+Sends chat completions built from docs/ in the benchmark's prompt shapes
+(workload.py) to any OpenAI-compatible base URL: a GPU router, a legacy
+model endpoint or the LiteLLM proxy. Arrivals follow a Poisson process at a
+fixed rate, or the timestamps of a trace file, and never wait for earlier
+responses, so a slow server builds a queue instead of slowing the load down.
+Latencies are measured from each request's scheduled arrival time.
+
+Reports time to first token (TTFT), time per output token after the first
+(TPOT), end-to-end latency p50/p95/p99, achieved throughput, and goodput:
+completed requests per second that met every SLO given.
+
+--stub starts a local server that streams fake tokens with configurable
+timing and capacity, to check the generator itself (and how many requests it
+can keep in flight) without a GPU.
+
+Usage:
+    # 2 requests/s for 5 minutes against a GPU router
+    uv run python loadgen.py --base-url https://your-workspace--vllm-h100-serve.modal.run \\
+        --model gemma-3-12b --api-key $VLLM_API_KEY --rate 2 --duration 300 --slo-ttft 5 --slo-e2e 120
+
+    # Through the LiteLLM proxy, replaying a trace
+    uv run python loadgen.py --base-url http://localhost:4000 --model h100/gemma-3-12b \\
+        --api-key $LITELLM_API_KEY --trace arrivals.jsonl
+
+    # Against the local stub, with thousands of requests in flight
+    uv run python loadgen.py --stub --rate 500 --duration 20 --stub-tpot 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from autotune import percentile
+from workload import PROMPT_SHAPES, build_workload, describe_workload
+
+PERCENTILES = (50, 95, 99)
+DEFAULT_DURATION = 60.0  # seconds of Poisson arrivals when neither --duration nor --requests is given
+
+
+@dataclass
+class RequestRecord:
+    """Timings of one request, in seconds from its scheduled arrival."""
+
+    kind: str
+    scheduled: float  # offset from the start of the run
+    send_lag: float = 0.0  # how late the generator actually sent it
+    ttft: float | None = None
+    e2e: float | None = None
+    output_tokens: int = 0
+    accepted_prediction_tokens: int | None = None  # speculative decoding, when the server reports it
+    rejected_prediction_tokens: int | None = None
+    error: str | None = None
+
+    def record_usage(self, usage: dict):
+        """Take output and speculative draft token counts from a usage block."""
+        self.output_tokens = usage.get("completion_tokens", 0)
+        details = usage.get("completion_tokens_details") or {}
+        self.accepted_prediction_tokens = details.get("accepted_prediction_tokens")
+        self.rejected_prediction_tokens = details.get("rejected_prediction_tokens")
+
+    @property
+    def tpot(self) -> float | None:
+        """Mean time per output token after the first."""
+        if self.ttft is None or self.e2e is None or self.output_tokens < 2:
+            return None
+        return (self.e2e - self.ttft) / (self.output_tokens - 1)
+
+    def meets(self, slo_ttft: float | None, slo_tpot: float | None, slo_e2e: float | None) -> bool:
+        if self.error is not None:
+            return False
+        tpot = self.tpot
+        return (
+            (slo_ttft is None or self.ttft is None or self.ttft <= slo_ttft)
+            and (slo_tpot is None or tpot is None or tpot <= slo_tpot)
+            and (slo_e2e is None or self.e2e <= slo_e2e)
+        )
+
+
+# =============================================================================
+# Arrivals
+# =============================================================================
+
+
+def poisson_arrivals(rate: float, duration: float | None, num_requests: int | None, seed: int) -> list[float]:
+    """Arrival offsets of a Poisson process, until ``duration`` or ``num_requests``."""
+    rng = random.Random(seed)
+    arrivals: list[float] = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if duration is not None and t > duration:
+            return arrivals
+        arrivals.append(t)
+        if num_requests is not None and len(arrivals) >= num_requests:
+            return arrivals
+
+
+def trace_arrivals(path: Path, speedup: float) -> list[float]:
+    """Arrival offsets from a JSONL trace: one {"timestamp": seconds} per line.
+
+    Timestamps may be absolute (epoch seconds) or relative; they are shifted
+    to start at zero and divided by ``speedup``.
+    """
+    timestamps = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                timestamps.append(float(json.loads(line)["timestamp"]))
+    if not timestamps:
+        raise ValueError(f"No arrivals in {path}")
+    timestamps.sort()
+    return [(t - timestamps[0]) / speedup for t in timestamps]
+
+
+# =============================================================================
+# Client
+# =============================================================================
+
+
+def request_body(request: dict, model: str, stream: bool) -> dict:
+    """OpenAI chat completion body for a workload request."""
+    body = {
+        "model": model,
+        "messages": request["messages"],
+        "max_tokens": request["max_tokens"],
+        "temperature": request["temperature"],
+        "stream": stream,
+    }
+    if stream:
+        body["stream_options"] = {"include_usage": True}
+    spec = request["structured_outputs"]
+    if spec and "json" in spec:
+        body["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": request["kind"].replace("-", "_"), "schema": spec["json"]},
+        }
+    return body
+
+
+async def send_request(
+    session: aiohttp.ClientSession,
+    url: str,
+    body: bytes,
+    stream: bool,
+    record: RequestRecord,
+    scheduled_at: float,
+):
+    """POST one chat completion and fill in ``record``; never raises."""
+    loop = asyncio.get_running_loop()
+    record.send_lag = loop.time() - scheduled_at
+    chunks = 0
+    try:
+        async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as resp:
+            if resp.status != 200:
+                record.error = f"HTTP {resp.status}: {(await resp.text())[:200]}"
+                return
+            if not stream:
+                data = await resp.json()  # no TTFT or TPOT without streaming
+                record.record_usage(data.get("usage") or {})
+            else:
+                async for line in resp.content:
+                    if not line.startswith(b"data: "):
+                        continue
+                    payload = line[6:].strip()
+                    if payload == b"[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    if chunk.get("usage"):
+                        record.record_usage(chunk["usage"])
+                    choices = chunk.get("choices") or []
+                    if choices and choices[0].get("delta", {}).get("content"):
+                        chunks += 1
+                        if record.ttft is None:
+                            record.ttft = loop.time() - scheduled_at
+                # Servers that do not report usage: count content chunks instead
+                record.output_tokens = record.output_tokens or chunks
+            record.e2e = loop.time() - scheduled_at
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        record.error = f"{type(e).__name__}: {e}"
+
+
+async def run_load(
+    base_url: str,
+    model: str,
+    api_key: str | None,
+    arrivals: list[float],
+    workload: list[dict],
+    stream: bool = True,
+    max_connections: int = 0,
+    timeout: float = 600,
+) -> tuple[list[RequestRecord], float, int]:
+    """Send ``workload[i]`` at ``arrivals[i]`` seconds; returns (records, elapsed, peak in flight)."""
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    connector = aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300)
+    url = f"{base_url.rstrip('/')}/v1/chat/completions"
+    loop = asyncio.get_running_loop()
+    records: list[RequestRecord] = []
+    tasks: set[asyncio.Task] = set()
+    peak_in_flight = 0
+
+    async with aiohttp.ClientSession(
+        headers=headers, connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        # Serialized up front: encoding ~50KB prompts at send time would delay later arrivals
+        bodies = [json.dumps(request_body(request, model, stream)).encode() for request in workload]
+        start = loop.time()
+        for offset, request, body in zip(arrivals, workload, bodies):
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            record = RequestRecord(kind=request["kind"], scheduled=offset)
+            records.append(record)
+            task = asyncio.create_task(send_request(session, url, body, stream, record, start + offset))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            peak_in_flight = max(peak_in_flight, len(tasks))
+        if tasks:
+            await asyncio.wait(set(tasks))
+        elapsed = loop.time() - start
+    return records, elapsed, peak_in_flight
+
+
+# =============================================================================
+# Report
+# =============================================================================
+
+
+def summarize(
+    records: list[RequestRecord],
+    elapsed: float,
+    peak_in_flight: int,
+    slo_ttft: float | None = None,
+    slo_tpot: float | None = None,
+    slo_e2e: float | None = None,
+) -> dict:
+    """Latency percentiles, throughput and goodput for a finished run."""
+    ok = [r for r in records if r.error is None]
+
+    def distribution(values: list[float]) -> dict:
+        return {f"p{q}": percentile(values, q) for q in PERCENTILES} | {"count": len(values)}
+
+    def acceptance(group: list[RequestRecord]) -> float | None:
+        drafted = [r for r in group if r.accepted_prediction_tokens is not None]
+        accepted = sum(r.accepted_prediction_tokens for r in drafted)
+        total = accepted + sum(r.rejected_prediction_tokens or 0 for r in drafted)
+        return accepted / total if total else None
+
+    good = [r for r in ok if r.meets(slo_ttft, slo_tpot, slo_e2e)]
+    offered = len(records) / records[-1].scheduled if len(records) > 1 and records[-1].scheduled else 0.0
+    return {
+        "requests": len(records),
+        "completed": len(ok),
+        "failed": len(records) - len(ok),
+        "elapsed_s": elapsed,
+        "offered_rps": offered,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "output_tok_s": sum(r.output_tokens for r in ok) / elapsed if elapsed else 0.0,
+        "goodput_rps": len(good) / elapsed if elapsed else 0.0,
+        "slo_attainment": len(good) / len(records) if records else 0.0,
+        "slo": {"ttft_s": slo_ttft, "tpot_s": slo_tpot, "e2e_s": slo_e2e},
+        "ttft_s": distribution([r.ttft for r in ok if r.ttft is not None]),
+        "tpot_s": distribution([r.tpot for r in ok if r.tpot is not None]),
+        "e2e_s": distribution([r.e2e for r in ok]),
+        "e2e_by_kind_s": {
+            kind: distribution([r.e2e for r in ok if r.kind == kind])
+            for kind in sorted({r.kind for r in records})
+        },
+        "spec_acceptance": acceptance(ok),
+        "spec_estimates": sum(r.accepted_prediction_tokens is not None for r in ok),
+        "spec_acceptance_by_kind": {
+            kind: acceptance([r for r in ok if r.kind == kind]) for kind in sorted({r.kind for r in ok})
+        },
+        "max_send_lag_s": max((r.send_lag for r in records), default=0.0),
+        "peak_in_flight": peak_in_flight,
+        "errors": sorted({r.error for r in records if r.error})[:10],
+    }
+
+
+def print_report(summary: dict):
+    print(f"\nRequests:   {summary['requests']} sent, {summary['completed']} completed, "
+          f"{summary['failed']} failed in {summary['elapsed_s']:.1f}s")
+    print(f"Offered:    {summary['offered_rps']:.2f} req/s")
+    print(f"Throughput: {summary['throughput_rps']:.2f} req/s, {summary['output_tok_s']:,.0f} output tok/s")
+
+    slo = summary["slo"]
+    limits = [f"{name} <= {value:g}s" for name, value in
+              (("TTFT", slo["ttft_s"]), ("TPOT", slo["tpot_s"]), ("E2E", slo["e2e_s"])) if value is not None]
+    attainment = (f"{summary['slo_attainment']:.1%} of requests met {', '.join(limits)}"
+                  if limits else "no SLO given")
+    print(f"Goodput:    {summary['goodput_rps']:.2f} req/s ({attainment})")
+
+    print(f"\n{'Latency':<26} | {'p50':>9} | {'p95':>9} | {'p99':>9} | {'n':>6}")
+    print("-" * 26 + "-+-" + "-+-".join("-" * w for w in (9, 9, 9, 6)))
+    rows = [("TTFT", summary["ttft_s"], 1), ("TPOT (ms)", summary["tpot_s"], 1000), ("E2E", summary["e2e_s"], 1)]
+    rows += [(f"E2E {kind}", dist, 1) for kind, dist in summary["e2e_by_kind_s"].items()]
+    for name, dist, scale in rows:
+        cells = " | ".join(f"{dist[f'p{q}'] * scale:>9.2f}" for q in PERCENTILES)
+        print(f"{name:<26} | {cells} | {dist['count']:>6}")
+
+    if summary["spec_acceptance"] is not None:
+        by_kind = ", ".join(
+            f"{kind} {rate:.1%}" for kind, rate in summary["spec_acceptance_by_kind"].items() if rate is not None
+        )
+        print(
+            f"\nSpeculative decoding (estimated from output deltas): {summary['spec_acceptance']:.1%} of draft "
+            f"tokens accepted ({by_kind}), over {summary['spec_estimates']} of {summary['completed']} responses"
+        )
+
+    print(f"\nPeak in flight: {summary['peak_in_flight']}, max send lag: {summary['max_send_lag_s'] * 1000:.0f} ms")
+    if summary["max_send_lag_s"] > 0.1:
+        print("  (the generator fell behind its schedule; latencies include that lag)")
+    for error in summary["errors"]:
+        print(f"  error: {error}")
+
+
+# =============================================================================
+# Stub server
+# =============================================================================
+
+
+class StubServer:
+    """Local OpenAI-style chat endpoint that streams fake tokens.
+
+    Each request waits for one of ``capacity`` slots (0 = unlimited), then
+    for ``ttft + prefill_s_per_kchar`` per thousand prompt characters, then
+    emits ``output_fraction`` of its max_tokens at ``tpot`` seconds per
+    token, ``chunk_tokens`` tokens per SSE event.
+    """
+
+    def __init__(
+        self,
+        ttft: float = 0.2,
+        prefill_s_per_kchar: float = 0.002,
+        tpot: float = 0.02,
+        output_fraction: float = 0.5,
+        capacity: int = 0,
+        chunk_tokens: int = 8,
+    ):
+        self.ttft = ttft
+        self.prefill_s_per_kchar = prefill_s_per_kchar
+        self.tpot = tpot
+        self.output_fraction = output_fraction
+        self.chunk_tokens = chunk_tokens
+        self.slots = asyncio.Semaphore(capacity) if capacity else None
+        self.runner: web.AppRunner | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port, backlog=4096)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if self.slots is None:
+            return await self._respond(request, body)
+        async with self.slots:
+            return await self._respond(request, body)
+
+    async def _respond(self, request: web.Request, body: dict) -> web.StreamResponse:
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        num_tokens = max(1, int(body.get("max_tokens", 256) * self.output_fraction))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": num_tokens,
+                 "total_tokens": prompt_chars // 4 + num_tokens}
+        await asyncio.sleep(self.ttft + self.prefill_s_per_kchar * prompt_chars / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.tpot * (num_tokens - 1))
+            return web.json_response({
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "tok " * num_tokens},
+                             "finish_reason": "length"}],
+                "usage": usage,
+            })
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        sent = 0
+        while sent < num_tokens:
+            count = min(self.chunk_tokens, num_tokens - sent)
+            if sent:
+                await asyncio.sleep(self.tpot * count)
+            chunk = {"object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": "tok " * count}, "finish_reason": None}]}
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            sent += count
+        final = {"object": "chat.completion.chunk", "choices": [], "usage": usage}
+        await resp.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        await resp.write_eof()
+        return resp
+
+
+# =============================================================================
+# Runner
+# =============================================================================
+
+
+def _raise_open_file_limit():
+    """Thousands of in-flight requests need as many sockets; lift the soft limit."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+        except (ValueError, OSError):
+            pass
+
+
+async def _main(args: argparse.Namespace) -> int:
+    if args.trace:
+        arrivals = trace_arrivals(args.trace, args.trace_speedup)
+        if args.requests:
+            arrivals = arrivals[: args.requests]
+    else:
+        duration = args.duration if args.duration or args.requests else DEFAULT_DURATION
+        arrivals = poisson_arrivals(args.rate, duration, args.requests, args.seed)
+    if not arrivals:
+        print("No requests to send (check --rate, --duration and --requests)")
+        return 1
+
+    kinds = args.kind or None
+    workload = build_workload(len(arrivals), seed=args.seed, kinds=kinds)
+
+    stub = None
+    base_url = args.base_url
+    if args.stub:
+        stub = StubServer(
+            ttft=args.stub_ttft,
+            tpot=args.stub_tpot,
+            output_fraction=args.stub_output_fraction,
+            capacity=args.stub_capacity,
+        )
+        base_url = await stub.start()
+    elif not base_url:
+        print("Pass --base-url, or --stub to run against the local stub server")
+        return 1
+
+    source = f"trace {args.trace}" if args.trace else f"Poisson {args.rate:g} req/s"
+    print(f"Target:   {base_url} (model {args.model}{', stub' if stub else ''})")
+    print(f"Arrivals: {len(arrivals)} over {arrivals[-1]:.0f}s ({source})")
+    print(f"Workload: {describe_workload(workload)}")
+
+    try:
+        records, elapsed, peak = await run_load(
+            base_url,
+            args.model,
+            args.api_key,
+            arrivals,
+            workload,
+            stream=args.stream,
+            max_connections=args.max_connections,
+            timeout=args.timeout,
+        )
+    finally:
+        if stub is not None:
+            await stub.stop()
+
+    summary = summarize(records, elapsed, peak, args.slo_ttft, args.slo_tpot, args.slo_e2e)
+    print_report(summary)
+    if args.output:
+        args.output.write_text(json.dumps({
+            "summary": summary,
+            "records": [asdict(r) | {"tpot": r.tpot} for r in records],
+        }, indent=2))
+        print(f"\nWrote {args.output}")
+    return 0 if summary["completed"] else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Open-loop load generator for OpenAI-compatible endpoints")
+    parser.add_argument("--base-url", help="Endpoint base URL (without /v1)")
+    parser.add_argument("--model", default="gemma-3-12b", help="Model name sent in requests")
+    parser.add_argument("--api-key", default=os.environ.get("VLLM_API_KEY"), help="Bearer token (default: $VLLM_API_KEY)")
+
+    arrivals = parser.add_argument_group("arrivals")
+    arrivals.add_argument("--rate", type=float, default=1.0, help="Poisson arrival rate in requests/s")
+    arrivals.add_argument("--duration", type=float,
+                          help=f"Seconds of Poisson arrivals (default {DEFAULT_DURATION:g}, or until --requests)")
+    arrivals.add_argument("--requests", type=int, help="Stop after this many requests")
+    arrivals.add_argument("--trace", type=Path, help='JSONL of {"timestamp": seconds} arrivals instead of Poisson')
+    arrivals.add_argument("--trace-speedup", type=float, default=1.0, help="Replay the trace this many times faster")
+    arrivals.add_argument("--kind", action="append", choices=list(PROMPT_SHAPES), help="Only send these request kinds")
+    arrivals.add_argument("--seed", type=int, default=0)
+
+    client = parser.add_argument_group("client")
+    client.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="Stream responses (needed for TTFT and TPOT)")
+    client.add_argument("--max-connections", type=int, default=0, help="Connection pool size (0 = unlimited)")
+    client.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds")
+
+    slo = parser.add_argument_group("SLO (for goodput)")
+    slo.add_argument("--slo-ttft", type=float, help="Max time to first token, seconds")
+    slo.add_argument("--slo-tpot", type=float, help="Max time per output token, seconds")
+    slo.add_argument("--slo-e2e", type=float, help="Max end-to-end latency, seconds")
+
+    stub = parser.add_argument_group("stub server")
+    stub.add_argument("--stub", action="store_true", help="Target a local stub server instead of --base-url")
+    stub.add_argument("--stub-ttft", type=float, default=0.2, help="Stub base time to first token, seconds")
+    stub.add_argument("--stub-tpot", type=float, default=0.02, help="Stub seconds per output token")
+    stub.add_argument("--stub-output-fraction", type=float, default=0.5, help="Fraction of max_tokens the stub emits")
+    stub.add_argument("--stub-capacity", type=int, default=0, help="Requests the stub serves at once (0 = unlimited)")
+
+    parser.add_argument("--output", type=Path, help="Write the summary and per-request records as JSON")
+    args = parser.parse_args()
+
+    _raise_open_file_limit()
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Prometheus metrics for the router.
+
+RouterMetrics holds the metrics router.py exposes in its own
+prometheus_client registry, so they are kept apart from the vLLM metrics in
+the default one. Request, call and token metrics are recorded on the
+request path. Engine metrics are copied from the heartbeats that model
+containers publish (ENGINE_GAUGES / ENGINE_COUNTERS) when /metrics is
+scraped.
+
+Usage:
+    metrics = RouterMetrics()
+    metrics.requests.labels(model="gemma-3-12b", method="chat").inc()
+    text = metrics.render()
+"""
+
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Remote-call latency buckets (seconds): from a warm hop to a cold start with a long generation
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# Router queue wait buckets (seconds)
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Container boot buckets (seconds): snapshot restores to cold weight downloads
+BOOT_BUCKETS = (5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600, 900)
+
+# Engine stats copied from each heartbeat into a per-container gauge
+ENGINE_GAUGES = {
+    "kv_cache_usage": ("engine_kv_cache_usage", "Fraction of KV cache blocks in use"),
+    "requests_running": ("engine_requests_running", "Sequences in the engine's running batch"),
+    "requests_waiting": ("engine_requests_waiting", "Sequences waiting for KV cache space"),
+    "prompt_tokens_per_s": ("engine_prompt_tokens_per_second", "Prefill tokens per second since the last heartbeat"),
+    "generation_tokens_per_s": (
+        "engine_generation_tokens_per_second", "Generated tokens per second since the last heartbeat"
+    ),
+    "prefix_cache_hit_rate": ("engine_prefix_cache_hit_rate", "Share of prompt tokens served from the prefix cache"),
+    "spec_acceptance_rate": (
+        "engine_spec_decode_acceptance_rate", "Share of speculative draft tokens accepted since the last heartbeat"
+    ),
+}
+
+# Engine totals copied from each heartbeat into a per-container counter
+ENGINE_COUNTERS = {
+    "preemptions_total": ("engine_preemptions_total", "Sequences preempted for KV cache space"),
+    "prompt_tokens_total": ("engine_prompt_tokens_total", "Prefill tokens processed"),
+    "generation_tokens_total": ("engine_generation_tokens_total", "Tokens generated"),
+    "spec_draft_tokens_total": ("engine_spec_decode_draft_tokens_total", "Speculative draft tokens proposed"),
+    "spec_accepted_tokens_total": ("engine_spec_decode_accepted_tokens_total", "Speculative draft tokens accepted"),
+}
+
+# A model container whose last heartbeat is older than this is gone (heartbeats come every 15s)
+HEARTBEAT_STALE_S = 60.0
+
+
+def warm_containers(heartbeats: list[dict], now: float | None = None, stale_after_s: float = HEARTBEAT_STALE_S) -> dict:
+    """Containers per model with a recent heartbeat, i.e. an engine up and serving."""
+    now = time.time() if now is None else now
+    counts: dict[str, int] = {}
+    for beat in heartbeats:
+        if now - beat.get("updated", 0) <= stale_after_s:
+            counts[beat["model"]] = counts.get(beat["model"], 0) + 1
+    return counts
+
+
+class _HeartbeatCollector:
+    """Engine metrics from the latest fresh heartbeats, built at each scrape."""
+
+    def __init__(self):
+        self.heartbeats: list[dict] = []
+
+    def collect(self):
+        containers = GaugeMetricFamily(
+            "model_containers", "Model containers with a recent engine heartbeat", labels=["model"]
+        )
+        counts: dict[str, int] = {}
+        for beat in self.heartbeats:
+            counts[beat["model"]] = counts.get(beat["model"], 0) + 1
+        for model, count in counts.items():
+            containers.add_metric([model], count)
+        yield containers
+
+        for fields, family in ((ENGINE_GAUGES, GaugeMetricFamily), (ENGINE_COUNTERS, CounterMetricFamily)):
+            for field, (name, help_text) in fields.items():
+                metric = family(name, help_text, labels=["model", "container"])
+                for beat in self.heartbeats:
+                    if beat.get(field) is not None:
+                        metric.add_metric([beat["model"], beat["container"]], beat[field])
+                yield metric
+
+
+class RouterMetrics:
+    """Everything the router's /metrics endpoint exposes.
+
+    Request, remote-call and token metrics are recorded on the request path.
+    Queue gauges are read from the ModelGates and engine metrics from the
+    model containers' heartbeats (see ``record_heartbeats``) at scrape time.
+    Counters are per router container and restart from zero with it.
+    """
+
+    def __init__(self, stale_after_s: float = HEARTBEAT_STALE_S):
+        self.stale_after_s = stale_after_s
+        self.started = time.time()
+        self._seen_containers: set[str] = set()
+
+        self.registry = registry = CollectorRegistry()
+        self.requests = Counter(
+            "router_requests_total", "Client requests per model and method", ["model", "method"], registry=registry
+        )
+        self.remote_calls = Counter(
+            "router_remote_calls_total",
+            "Calls to the model classes by outcome (ok, error, rejected, cancelled)",
+            ["model", "method", "outcome"],
+            registry=registry,
+        )
+        self.remote_latency = Histogram(
+            "router_remote_call_seconds",
+            "Model call duration once a gate slot is held; streams are timed to their last chunk",
+            ["model", "method"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.queue_wait = Histogram(
+            "router_queue_wait_seconds", "Time spent waiting for a model gate slot", ["model"],
+            buckets=QUEUE_WAIT_BUCKETS, registry=registry,
+        )
+        self.in_flight = Gauge("router_in_flight", "Model calls holding a gate slot", ["model"], registry=registry)
+        self.queue_depth = Gauge(
+            "router_queue_depth", "Model calls waiting for a gate slot", ["model"], registry=registry
+        )
+        self.cache_hits = Counter(
+            "router_response_cache_hits_total", "Responses served from the response cache", ["model", "tier"],
+            registry=registry,
+        )
+        self.prompt_tokens = Counter(
+            "router_prompt_tokens_total", "Prompt tokens in relayed responses", ["model"], registry=registry
+        )
+        self.completion_tokens = Counter(
+            "router_completion_tokens_total", "Completion tokens in relayed responses", ["model"], registry=registry
+        )
+        self.prediction_tokens = Counter(
+            "router_prediction_tokens_total",
+            "Speculative draft tokens in relayed responses, as estimated per response (accepted, rejected)",
+            ["model", "outcome"],
+            registry=registry,
+        )
+
+        self.cold_starts = Counter(
+            "model_cold_starts_total", "Model containers started since this router started", ["model", "boot_mode"],
+            registry=registry,
+        )
+        self.boot_seconds = Histogram(
+            "model_cold_start_seconds", "Container start to engine ready", ["model", "boot_mode"],
+            buckets=BOOT_BUCKETS, registry=registry,
+        )
+        self._engines = _HeartbeatCollector()
+        registry.register(self._engines)
+
+    def record_call(self, model: str, method: str, outcome: str, seconds: float | None = None,
+                    usage: dict | None = None):
+        """Count one model call, its duration (if it ran) and the tokens in its usage block."""
+        self.remote_calls.labels(model=model, method=method, outcome=outcome).inc()
+        if seconds is not None:
+            self.remote_latency.labels(model=model, method=method).observe(seconds)
+        if usage:
+            self.prompt_tokens.labels(model=model).inc(usage.get("prompt_tokens") or 0)
+            self.completion_tokens.labels(model=model).inc(usage.get("completion_tokens") or 0)
+            details = usage.get("completion_tokens_details") or {}
+            for outcome in ("accepted", "rejected"):
+                if details.get(f"{outcome}_prediction_tokens") is not None:
+                    self.prediction_tokens.labels(model=model, outcome=outcome).inc(
+                        details[f"{outcome}_prediction_tokens"]
+                    )
+
+    def record_gate(self, model: str, stats: dict):
+        """Copy a ModelGate's current occupancy into the queue gauges."""
+        self.in_flight.labels(model=model).set(stats["in_flight"])
+        self.queue_depth.labels(model=model).set(stats["waiting"])
+
+    def record_heartbeats(self, heartbeats: list[dict], now: float | None = None):
+        """Replace the engine metrics with the model containers' latest heartbeats.
+
+        A heartbeat is a dict with "model", "container", "updated" and the
+        ENGINE_GAUGES / ENGINE_COUNTERS fields it has. Heartbeats older than
+        ``stale_after_s`` belong to containers that are gone and are ignored.
+        A container seen for the first time that started after this router
+        counts as a cold start, with its "boot_s" observed per "boot_mode".
+        """
+        now = time.time() if now is None else now
+        fresh = [beat for beat in heartbeats if now - beat.get("updated", 0) <= self.stale_after_s]
+        for beat in fresh:
+            model, container = beat["model"], beat["container"]
+            if container not in self._seen_containers:
+                self._seen_containers.add(container)
+                if beat.get("started", 0) >= self.started:
+                    boot_mode = beat.get("boot_mode", "unknown")
+                    self.cold_starts.labels(model=model, boot_mode=boot_mode).inc()
+                    if beat.get("boot_s") is not None:
+                        self.boot_seconds.labels(model=model, boot_mode=boot_mode).observe(beat["boot_s"])
+        self._engines.heartbeats = fresh
+
+    def render(self) -> str:
+        return generate_latest(self.registry).decode()
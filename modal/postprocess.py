@@ -0,0 +1,446 @@
+"""
+Post-processing of generated text for the GPU server.
+
+ThinkingFilter strips thinking spans from streamed or final text and counts
+their tokens; extract_json pulls the JSON answer out of a completion.
+bench_postprocess.py benchmarks both.
+"""
+
+import bisect
+import heapq
+import json
+import math
+import re
+from typing import Any
+
+# Inside brackets, string literals are skipped whole so braces within them don't
+# count, and runs of one bracket character (openers may be whitespace-separated)
+# are taken as a single token. Opener runs are matched with a character class
+# rather than a repeated group, which the regex engine loops over far faster.
+_TOKEN_RE = re.compile(
+    r'"[^"\\]*(?:\\.[^"\\]*)*"|\{[{\s]*|\[[\[\s]*|\}+|\]+', re.DOTALL
+)
+_OPENER_FOR = {"}": "{", "]": "["}
+# Walks of openers hidden in string literals may re-read the text after them;
+# together they read at most this many times the rest of the text
+_MAX_REWALK = 2
+
+_DECODER = json.JSONDecoder()
+
+
+class _TagSpanFilter:
+    """Incrementally removes ``<tag>...</tag>`` spans from a text stream.
+
+    Makes the same decisions as ``re.sub(r"<tag>.*?</tag>", "", text,
+    flags=re.DOTALL)`` on the concatenated stream: each open tag is closed by
+    the nearest following close tag, and an open tag that is never closed is
+    kept verbatim along with everything after it. Work per fed character is
+    O(1): ``str.find`` only re-scans the few characters that could complete a
+    tag split across chunks.
+    """
+
+    def __init__(self, tag: str):
+        self.open_tag = f"<{tag}>"
+        self.close_tag = f"</{tag}>"
+        self.thinking_tokens = 0
+        self.chunk_in_span = False  # whether the last fed chunk touched a span
+        self._inside = False
+        self._held = ""  # outside: trailing text that may be the start of an open tag
+        self._span: list[str] = []  # inside: text after the open tag, kept in case it never closes
+        self._span_tail = ""  # inside: last few span characters, for close tags split across chunks
+        self._span_tokens = 0
+
+    def feed(self, text: str, num_tokens: int = 0) -> str:
+        """Consume a chunk and return the text that is now known to be visible."""
+        self.chunk_in_span = self._inside
+        visible: list[str] = []
+
+        # Prepend the few characters carried over from the previous chunk, then
+        # walk the buffer with a cursor so nothing is re-scanned or re-sliced
+        if self._inside:
+            buf, span_start = self._span_tail + text, 0
+            span_new = len(self._span_tail)  # the tail is already in self._span
+        else:
+            buf, span_start, span_new = self._held + text, 0, 0
+        self._held = ""
+        pos = 0
+
+        while True:
+            if not self._inside:
+                index = buf.find(self.open_tag, pos)
+                if index == -1:
+                    keep = _partial_suffix(buf, pos, self.open_tag)
+                    visible.append(buf[pos : len(buf) - keep])
+                    self._held = buf[len(buf) - keep :]
+                    break
+                visible.append(buf[pos:index])
+                pos = span_start = span_new = index + len(self.open_tag)
+                self._inside = True
+                self.chunk_in_span = True
+                self._span, self._span_tokens = [], 0
+            else:
+                index = buf.find(self.close_tag, pos)
+                if index == -1:
+                    self._span.append(buf[span_new:])
+                    tail_start = max(span_start, len(buf) - (len(self.close_tag) - 1))
+                    self._span_tail = buf[tail_start:]
+                    break
+                # Span closed: drop it and carry on after the close tag
+                pos = index + len(self.close_tag)
+                self._inside = False
+                self.thinking_tokens += self._span_tokens
+                self._span, self._span_tail, self._span_tokens = [], "", 0
+
+        if self.chunk_in_span:
+            if self._inside:
+                self._span_tokens += num_tokens
+            else:
+                self.thinking_tokens += num_tokens
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """End of stream: release held text, including an unclosed span verbatim."""
+        if self._inside:
+            text = self.open_tag + "".join(self._span)
+            self._inside = False
+            self._span, self._span_tail, self._span_tokens = [], "", 0
+            return text
+        text, self._held = self._held, ""
+        return text
+
+
+def _partial_suffix(text: str, start: int, tag: str) -> int:
+    """Length of the longest suffix of ``text[start:]`` that is a proper prefix of ``tag``."""
+    for length in range(min(len(tag) - 1, len(text) - start), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class _WhitespaceTrimmer:
+    """Streaming ``str.strip``: drops leading whitespace and holds back trailing whitespace."""
+
+    def __init__(self):
+        self._started = False
+        self._held: list[str] = []
+
+    def feed(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._held.append(text)
+            return ""
+        out = "".join(self._held) + stripped
+        self._held = [text[len(stripped) :]]
+        return out
+
+    def flush(self) -> str:
+        self._held = []
+        return ""
+
+
+class ThinkingFilter:
+    """Removes ``<think>`` / ``<thinking>`` spans from a generation stream.
+
+    The streaming counterpart of ``strip_thinking_tokens``: feeding every
+    chunk and then calling ``flush()`` yields exactly
+    ``strip_thinking_tokens(full_text)``. The two tag filters are chained in
+    the same order as the regex passes they replace, so text that only forms
+    a ``<thinking>`` tag once a ``<think>`` span is removed is handled the
+    same way.
+
+    When chunks come with their token counts (``feed(text, num_tokens)``),
+    tokens generated while inside a removed span are totalled in
+    ``thinking_tokens``.
+    """
+
+    def __init__(self, strip: bool = True):
+        self._think = _TagSpanFilter("think")
+        self._thinking = _TagSpanFilter("thinking")
+        self._trimmer = _WhitespaceTrimmer() if strip else None
+
+    @property
+    def thinking_tokens(self) -> int:
+        return self._think.thinking_tokens + self._thinking.thinking_tokens
+
+    def feed(self, text: str, num_tokens: int = 0) -> str:
+        """Consume a chunk and return the text that is now known to be visible."""
+        text = self._think.feed(text, num_tokens)
+        text = self._thinking.feed(text, 0 if self._think.chunk_in_span else num_tokens)
+        return self._trimmer.feed(text) if self._trimmer else text
+
+    def flush(self) -> str:
+        """End of stream: return any text still held back."""
+        text = self._thinking.feed(self._think.flush())
+        text += self._thinking.flush()
+        if self._trimmer:
+            text = self._trimmer.feed(text) + self._trimmer.flush()
+        return text
+
+    def filter_text(self, text: str) -> str:
+        """Filter a finished string in one call."""
+        return self.feed(text) + self.flush()
+
+
+def strip_thinking_tokens(text: str) -> str:
+    """Strip thinking tokens from model output.
+
+    Some models (like Gemma, Qwen) may include <think>...</think> blocks
+    before the actual response. This function removes them.
+    """
+    if "<think" not in text:
+        return text.strip()
+    return ThinkingFilter().filter_text(text)
+
+
+class _OpenerRun:
+    """A run of identical opening brackets, possibly separated by whitespace."""
+
+    __slots__ = ("char", "start", "count", "_token", "_contiguous", "_cursor", "_cursor_index")
+
+    def __init__(self, char: str, start: int, token: str):
+        token = token.rstrip()  # whitespace after the last opener
+        self.char = char
+        self.start = start
+        self.count = token.count(char)  # openers still unclosed
+        self._token = token
+        self._contiguous = len(token) == self.count
+        self._cursor = len(token)  # offset in the token of opener number _cursor_index
+        self._cursor_index = self.count
+
+    def position(self, index: int) -> int:
+        """Text position of the run's ``index``-th opener.
+
+        Openers are closed innermost first, so ``index`` only ever decreases:
+        a whitespace-separated run is walked backwards from the last lookup.
+        """
+        if self._contiguous:
+            return self.start + index
+        while self._cursor_index > index:
+            self._cursor = self._token.rfind(self.char, 0, self._cursor)
+            self._cursor_index -= 1
+        return self.start + self._cursor
+
+
+def _walk(text: str, start: int, runs: list[int], hidden: list[int]):
+    """Walk the opener at ``start`` to its matching closer, skipping string literals.
+
+    Returns ``(spans, end)``: the balanced spans completed inside, including
+    the candidate's own, and the position after its closer (-1 if it never
+    closes). The start of every opener run taken as a token is appended to
+    ``runs`` followed by its end, and every opener skipped as part of a string
+    literal to ``hidden``.
+    """
+    # Stack entries are _OpenerRun objects for runs of the same opener
+    stack = [_OpenerRun(text[start], start, text[start])]
+    depth = {"{": 0, "[": 0}
+    depth[text[start]] += 1
+    runs += (start, start + 1)
+    spans: list[tuple[int, int]] = []
+    pos = start + 1
+    while stack:
+        match = _TOKEN_RE.search(text, pos)
+        if match is None:
+            return spans, -1
+        pos = match.end()
+        token = match.group()
+        char = token[0]
+
+        if char in "{[":
+            run = _OpenerRun(char, match.start(), token)
+            stack.append(run)
+            depth[char] += run.count
+            runs += (run.start, pos)
+        elif char in "}]":
+            opener = _OPENER_FOR[char]
+            closed = 0
+            while closed < len(token) and depth[opener]:
+                # Drop unmatched openers of the other kind
+                while stack[-1].char != opener:
+                    dropped = stack.pop()
+                    depth[dropped.char] -= dropped.count
+                run = stack[-1]
+                take = min(len(token) - closed, run.count)
+                run.count -= take
+                depth[opener] -= take
+                closed += take
+                # Outermost of the spans just closed by this part of the run
+                spans.append((run.position(run.count), match.start() + closed))
+                if not run.count:
+                    stack.pop()
+                if not stack:
+                    return spans, match.start() + closed  # the rest lies outside this candidate
+            # closers with no opener left are ignored
+        else:
+            # A string literal: skipped, but an opener in it may start the answer
+            for opener in "{[":
+                found = text.find(opener, match.start(), pos)
+                while found != -1:
+                    hidden.append(found)
+                    found = text.find(opener, found + 1, pos)
+    return spans, -1
+
+
+def _covers(runs: list[int], position: int) -> bool:
+    """Whether ``position`` lies in one of a walk's opener runs (see _walk)."""
+    # runs alternates starts and ends in text order: an odd index is inside a run
+    return bisect.bisect_right(runs, position) % 2 == 1
+
+
+def json_candidate_spans(text: str):
+    """Yield ``(start, end, walk)`` for places in ``text`` where a JSON object or array may start.
+
+    Outside brackets, the next ``{`` or ``[`` is found with ``str.find`` (quotes
+    in surrounding prose are ignored); each such top-level opener is yielded
+    as ``(start, None, walk)`` before it is scanned, so a caller that parses
+    it successfully stops the scan early. Otherwise the opener is walked to
+    its matching closer (or the end of the text if it never closes), skipping
+    string literals, and the balanced spans completed inside it are yielded
+    with their ends, outer spans before the spans they contain. Scanning then
+    resumes after it.
+
+    Openers the walk skipped inside a string literal are walked too, as
+    candidates ``(start, None, walk)`` of their own: a stray ``"`` in prose
+    (``[2" long] {"a": 1}``) pairs with a quote of the real answer and would
+    otherwise hide it. ``walk`` numbers the walk a span came from, since
+    spans of one walk share its reading of which quotes open string literals.
+    An opener that some walk took as a token is not walked again, and those
+    walks stop once they have read ``_MAX_REWALK`` times the text after the
+    top-level opener, so the scan stays linear in ``len(text)`` however many
+    stray brackets or quotes there are.
+    """
+    next_open = {"{": text.find("{"), "[": text.find("[")}
+    pos = 0
+    walk = 0
+
+    while True:
+        for opener, found in next_open.items():
+            if found != -1 and found < pos:
+                next_open[opener] = text.find(opener, pos)
+        found = [p for p in next_open.values() if p != -1]
+        if not found:
+            return
+        start = min(found)
+        yield start, None, walk
+
+        first_runs: list[int] = []
+        hidden: list[int] = []
+        spans, end = _walk(text, start, first_runs, hidden)
+        candidates = [(span_start, span_end, walk) for span_start, span_end in spans if span_start != start]
+        # Spans of the other walks past the first walk's closer are left to the
+        # scan that resumes there
+        limit = len(text) if end == -1 else end
+        if hidden:
+            covered: set[int] = set()  # openers taken as tokens by the later walks
+            heapq.heapify(hidden)
+            budget = _MAX_REWALK * (len(text) - start)
+            while hidden and budget > 0:
+                hidden_start = heapq.heappop(hidden)
+                if hidden_start >= limit:
+                    break
+                if hidden_start in covered or _covers(first_runs, hidden_start):
+                    continue
+                walk += 1
+                runs, more_hidden = [], []
+                spans, hidden_end = _walk(text, hidden_start, runs, more_hidden)
+                candidates.append((hidden_start, None, walk))
+                candidates.extend(
+                    (span_start, span_end, walk)
+                    for span_start, span_end in spans
+                    if hidden_start != span_start < limit
+                )
+                for run_start, run_end in zip(runs[::2], runs[1::2]):
+                    covered.update(i for i in range(run_start, run_end) if text[i] in "{[")
+                budget -= (len(text) if hidden_end == -1 else hidden_end) - hidden_start
+                for position in more_hidden:
+                    heapq.heappush(hidden, position)
+        walk += 1
+
+        # Text order, with outer spans before the spans they contain
+        candidates.sort(key=lambda c: (c[0], c[1] is not None, -(c[1] or 0)))
+        yield from candidates
+        if end == -1:
+            return  # never closed: the scan reached the end of the text
+        pos = end
+
+
+def _leading_json(text: str) -> tuple[str, Any] | None:
+    """``(json_text, parsed)`` if ``text`` is JSON or starts with a JSON object, else None."""
+    try:
+        parsed, end = _DECODER.raw_decode(text)
+    except (ValueError, RecursionError):
+        return None
+    if end == len(text) or text[0] == "{":
+        return text[:end], parsed
+    return None
+
+
+def extract_json(text: str) -> tuple[str, Any | None]:
+    """Extract JSON from text that may contain non-JSON content.
+
+    Handles cases where the model outputs thinking tokens or other content
+    before/after the JSON. Returns ``(json_text, parsed)`` for the whole text
+    if it is JSON, else for the object at the first ``{`` if it parses, else
+    for the first candidate object that parses, else for
+    the first candidate array that parses (so a stray ``[1]`` in the prose
+    does not shadow the answer). Returns ``(stripped_text, None)`` if nothing
+    parses. Each candidate is parsed directly from ``text`` by the C decoder,
+    without slicing it out first.
+
+    A candidate that fails to parse still has its nested spans tried, except
+    those of the same walk the parse had entered when it failed (the failure
+    lies past their start and before their end): parsing them would stop at
+    the same place.
+    """
+    text = text.strip()
+
+    # Fast path: the text is JSON, or starts with a JSON object
+    found = _leading_json(text)
+    if found is None and "<think" in text:
+        text = strip_thinking_tokens(text)
+        found = _leading_json(text)
+    if found is not None:
+        return found
+
+    # The first "{" is the earliest place an object can start, however the
+    # quotes before it pair up
+    first = text.find("{")
+    if first != -1:
+        try:
+            parsed, parsed_end = _DECODER.raw_decode(text, first)
+            return text[first:parsed_end], parsed
+        except (ValueError, RecursionError):
+            pass
+
+    # Per walk: sorted positions where its candidates failed to parse, and the
+    # end of a too-deep candidate whose nested spans are skipped
+    failed_at: dict[int, list[int]] = {}
+    skip_until: dict[int, float] = {}
+    fallback = None
+    for start, end, walk in json_candidate_spans(text):
+        failures = failed_at.setdefault(walk, [])
+        if end is not None:
+            if start < skip_until.get(walk, -1):
+                continue
+            index = bisect.bisect_right(failures, start)
+            if index < len(failures) and failures[index] < end:
+                continue
+        try:
+            parsed, parsed_end = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError as e:
+            bisect.insort(failures, e.pos)
+            continue
+        except (ValueError, RecursionError):
+            skip_until[walk] = math.inf if end is None else end
+            continue
+        if text[start] == "{":
+            return text[start:parsed_end], parsed
+        if fallback is None:
+            fallback = text[start:parsed_end], parsed
+
+    # Return original stripped text as fallback
+    return fallback or (text, None)
@@ -0,0 +1,215 @@
+"""
+Prefetch model weights into the shared HuggingFace cache volume on Modal.
+
+Every GPU app mounts the `huggingface-cache` volume, so downloading the
+weights once, ahead of a deploy, means the first container for a model only
+has to initialize the engine. Each model is downloaded in its own CPU
+container, all in parallel; LFS files are checked against the sha256 that
+HuggingFace publishes for them. Models already downloaded and verified at the
+same revision are skipped.
+
+Usage:
+    # Prefetch every model in BASE_MODELS
+    uv run modal run prefetch.py
+
+    # Prefetch specific models, or re-verify everything
+    uv run modal run prefetch.py --models gemma-3-12b,gemma-3-27b
+    uv run modal run prefetch.py --force
+
+    # Or via deploy.py
+    uv run python deploy.py --prefetch
+    uv run python deploy.py --all --prefetch-first
+"""
+
+import sys
+import time
+
+import modal
+
+# Ensure /root is in path for config module in Modal container
+if "/root" not in sys.path:
+    sys.path.insert(0, "/root")
+
+from config import BASE_MODELS
+
+# Container image: only the HuggingFace client is needed, no GPU or vLLM
+prefetch_image = (
+    modal.Image.debian_slim(python_version="3.12")
+    .pip_install("huggingface_hub[hf_transfer]==0.35.0")
+    .env({"HF_HUB_ENABLE_HF_TRANSFER": "1"})
+    .add_local_file("config.py", "/root/config.py")
+)
+
+# Same volume the GPU apps mount at /root/.cache/huggingface
+hf_cache_vol = modal.Volume.from_name("huggingface-cache", create_if_missing=True)
+
+MINUTES = 60  # seconds
+HF_CACHE_DIR = "/root/.cache/huggingface"
+VERIFY_WORKERS = 8  # Files hashed concurrently
+HASH_CHUNK_BYTES = 64 * 1024 * 1024
+
+app = modal.App("vllm-prefetch")
+
+
+def _sha256(path: str) -> str:
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _git_blob_sha1(path: str) -> str:
+    """The git object id HuggingFace reports for small (non-LFS) files."""
+    import hashlib
+    import os
+
+    digest = hashlib.sha1()
+    digest.update(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+@app.function(
+    image=prefetch_image,
+    volumes={HF_CACHE_DIR: hf_cache_vol},
+    secrets=[modal.Secret.from_name("huggingface", required_keys=["HF_TOKEN"])],
+    timeout=60 * MINUTES,
+    cpu=8,
+)
+def prefetch_model(model_key: str, force: bool = False) -> dict:
+    """Download one model into the cache volume and verify it.
+
+    Returns a summary dict: status ("skipped", "downloaded" or "failed"),
+    bytes on disk, bytes downloaded, elapsed seconds and bytes per second.
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    from huggingface_hub import HfApi, snapshot_download
+    from huggingface_hub.file_download import repo_folder_name
+
+    model_info = BASE_MODELS[model_key]
+    repo_id = model_info["huggingface_id"]
+    start = time.time()
+
+    info = HfApi().model_info(repo_id, revision=model_info.get("revision"), files_metadata=True)
+    expected = {s.rfilename: s for s in info.siblings}
+    total_bytes = sum(s.size or 0 for s in info.siblings)
+
+    # A marker per revision records a download that has already been verified
+    marker = os.path.join(HF_CACHE_DIR, "prefetch", model_key, f"{info.sha}.ok")
+    if os.path.exists(marker) and not force:
+        print(f"{model_key}: {repo_id}@{info.sha[:8]} already complete")
+        return {"model": model_key, "status": "skipped", "bytes": total_bytes, "downloaded": 0,
+                "seconds": time.time() - start, "bytes_per_s": 0.0}
+
+    snapshot_dir = os.path.join(
+        HF_CACHE_DIR, "hub", repo_folder_name(repo_id=repo_id, repo_type="model"), "snapshots", info.sha
+    )
+
+    def bytes_on_disk() -> int:
+        return sum(
+            os.path.getsize(path)
+            for path in (os.path.join(snapshot_dir, name) for name in expected)
+            if os.path.exists(path)
+        )
+
+    before = bytes_on_disk()
+    print(f"{model_key}: downloading {repo_id}@{info.sha[:8]} ({total_bytes / 1e9:.1f} GB, {before / 1e9:.1f} GB cached)")
+    snapshot_download(repo_id, revision=info.sha, cache_dir=os.path.join(HF_CACHE_DIR, "hub"))
+    download_seconds = time.time() - start
+    downloaded = bytes_on_disk() - before
+
+    def verify(name: str) -> tuple[str, str | None]:
+        """Return ``(name, error)``; error is None if the file matches its checksum."""
+        sibling = expected[name]
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path):
+            return name, "missing"
+        if sibling.lfs is not None:
+            actual = _sha256(path)
+            if actual != sibling.lfs.sha256:
+                return name, f"sha256 {actual[:12]} != {sibling.lfs.sha256[:12]}"
+        elif sibling.blob_id and _git_blob_sha1(path) != sibling.blob_id:
+            return name, "git blob id mismatch"
+        return name, None
+
+    with ThreadPoolExecutor(VERIFY_WORKERS) as pool:
+        errors = {name: error for name, error in pool.map(verify, sorted(expected)) if error}
+
+    elapsed = time.time() - start
+    result = {
+        "model": model_key,
+        "status": "failed" if errors else "downloaded",
+        "bytes": total_bytes,
+        "downloaded": downloaded,
+        "seconds": elapsed,
+        "bytes_per_s": downloaded / download_seconds if download_seconds else 0.0,
+    }
+    if errors:
+        for name, error in errors.items():
+            print(f"{model_key}: {name}: {error}")
+            # Drop the corrupt file (snapshot symlink and cached blob) so a re-run fetches it again
+            path = os.path.join(snapshot_dir, name)
+            if os.path.lexists(path):
+                blob = os.path.realpath(path)
+                os.remove(path)
+                if blob != path and os.path.exists(blob):
+                    os.remove(blob)
+        result["errors"] = [f"{name}: {error}" for name, error in errors.items()]
+    else:
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, "w") as f:
+            f.write(f"{repo_id}@{info.sha}\n")
+
+    hf_cache_vol.commit()
+    print(
+        f"{model_key}: {result['status']} {downloaded / 1e9:.1f} GB in {download_seconds:.0f}s "
+        f"({result['bytes_per_s'] / 1e6:.0f} MB/s), verified in {elapsed - download_seconds:.0f}s"
+    )
+    return result
+
+
+@app.local_entrypoint()
+def main(models: str = "", force: bool = False):
+    """Prefetch models in parallel (one container each) and print a summary."""
+    model_keys = [m.strip() for m in models.split(",") if m.strip()] or list(BASE_MODELS)
+    unknown = [m for m in model_keys if m not in BASE_MODELS]
+    if unknown:
+        print(f"Unknown model(s): {', '.join(unknown)}. Available: {', '.join(BASE_MODELS)}")
+        sys.exit(1)
+
+    # Variants quantized at load time (e.g. "-fp8") share their base model's checkpoint
+    checkpoints = {}
+    for model_key in model_keys:
+        model_info = BASE_MODELS[model_key]
+        checkpoints.setdefault((model_info["huggingface_id"], model_info.get("revision")), model_key)
+    model_keys = list(checkpoints.values())
+
+    print(f"Prefetching {len(model_keys)} models into the huggingface-cache volume...")
+    start = time.time()
+    results = list(prefetch_model.map(model_keys, kwargs={"force": force}, return_exceptions=True))
+
+    print(f"\n{'Model':<15} | {'Status':<10} | {'Size':>9} | {'Fetched':>9} | {'Time':>7} | {'Rate':>10}")
+    print("-" * 15 + "-+-" + "-+-".join("-" * w for w in (10, 9, 9, 7, 10)))
+    failed = []
+    for model_key, result in zip(model_keys, results):
+        if isinstance(result, BaseException) or result["status"] == "failed":
+            failed.append(model_key)
+        if isinstance(result, BaseException):
+            print(f"{model_key:<15} | {'error':<10} | {result}")
+            continue
+        print(
+            f"{model_key:<15} | {result['status']:<10} | {result['bytes'] / 1e9:>6.1f} GB | "
+            f"{result['downloaded'] / 1e9:>6.1f} GB | {result['seconds']:>6.0f}s | "
+            f"{result['bytes_per_s'] / 1e6:>6.0f} MB/s"
+        )
+
+    print(f"\nDone in {time.time() - start:.0f}s")
+    if failed:
+        print(f"Failed: {', '.join(failed)} (re-run to retry)")
+        sys.exit(1)
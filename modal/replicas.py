@@ -0,0 +1,74 @@
+"""
+Request placement across the data-parallel engine replicas of one container.
+
+With ``data_parallel`` above 1 (see config.py) a model container runs that
+many engine replicas, each on its own ``n_gpu`` GPUs, behind one vLLM
+engine client. ReplicaBalancer picks the replica (data-parallel rank) for
+each request. Callers run on one event loop, so no locking is needed.
+"""
+
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
+
+from cache import LRUCache
+
+DEFAULT_MAX_SKEW = 4  # Extra in-flight requests a replica may carry to keep a prompt's prefix cache
+DEFAULT_AFFINITY_ENTRIES = 4096  # Prompt prefixes remembered
+
+
+class ReplicaBalancer:
+    """Sends each request to the replica with the fewest requests in flight.
+
+    Each replica has its own prefix cache, so a prompt whose prefix was seen
+    recently (the same document under another instruction, or a retry) goes
+    back to the replica that served it, as long as that replica carries at
+    most ``max_skew`` more requests than the least-loaded one.
+    """
+
+    def __init__(
+        self,
+        replicas: int,
+        max_skew: int = DEFAULT_MAX_SKEW,
+        affinity_entries: int = DEFAULT_AFFINITY_ENTRIES,
+    ):
+        self.max_skew = max_skew
+        self.in_flight = [0] * replicas
+        self.served = [0] * replicas
+        self.affinity = LRUCache(affinity_entries)
+        self.kept = 0  # requests that followed their prefix to its replica
+
+    def acquire(self, prefix_key: Hashable | None = None, rank: int | None = None) -> int:
+        """Pick a replica (or take ``rank`` as given) and count the request against it."""
+        if rank is None:
+            least = min(range(len(self.in_flight)), key=self.in_flight.__getitem__)
+            rank = self.affinity.get(prefix_key) if prefix_key is not None else None
+            if rank is None or self.in_flight[rank] - self.in_flight[least] > self.max_skew:
+                rank = least
+            else:
+                self.kept += 1
+        if prefix_key is not None:
+            self.affinity.put(prefix_key, rank)
+        self.in_flight[rank] += 1
+        self.served[rank] += 1
+        return rank
+
+    def release(self, rank: int):
+        self.in_flight[rank] -= 1
+
+    @contextmanager
+    def use(self, prefix_key: Hashable | None = None, rank: int | None = None) -> Iterator[int]:
+        """Hold a replica for the duration of the ``with`` block; yields its rank."""
+        rank = self.acquire(prefix_key, rank)
+        try:
+            yield rank
+        finally:
+            self.release(rank)
+
+    def stats(self) -> dict:
+        """Per-replica load and affinity counters, for health endpoints."""
+        served = sum(self.served)
+        return {
+            "in_flight": list(self.in_flight),
+            "served": list(self.served),
+            "affinity_rate": self.kept / served if served else 0.0,
+        }
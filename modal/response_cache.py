@@ -0,0 +1,240 @@
+"""
+Two-tier cache of deterministic completion responses for the GPU router.
+
+The memory tier is an LRUCache; the persistent tier is one JSON file per
+response under a directory, which vllm_gpu_server.py mounts from a Modal
+volume so entries survive router restarts and are shared between router
+containers.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from cache import LRUCache
+
+DEFAULT_COMMIT_DELAY_S = 10.0  # Writes within this window share one volume commit
+DEFAULT_RELOAD_INTERVAL_S = 30.0  # Least time between volume reloads on disk misses
+
+
+def response_cache_key(model_key: str, endpoint: str, request: dict) -> str:
+    """Hash everything that determines a response into a cache key.
+
+    ``request`` holds the generation inputs (messages or prompt, sampling
+    params, normalized structured-output spec, ...); keys are sorted so
+    field order in the client's JSON does not matter.
+    """
+    payload = json.dumps(
+        {"model": model_key, "endpoint": endpoint, "request": request},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_deterministic(temperature: float | None) -> bool:
+    """Whether a request decodes greedily, so repeating it gives the same output."""
+    return temperature is not None and temperature <= 0
+
+
+class ResponseCache:
+    """Memory LRU in front of an optional on-disk store, both with TTL.
+
+    Entries older than ``ttl_s`` are treated as misses and removed. The disk
+    tier is bounded by ``disk_max_bytes``: once writes push it over, the
+    oldest files are deleted until it is back under 90% of the limit. Disk
+    reads and writes run in a worker thread so the router's event loop is
+    never blocked on the volume.
+
+    When the directory is a shared volume, ``commit`` and ``reload`` (e.g. a
+    Modal Volume's methods) publish this container's writes and pick up
+    other containers'. Writes are committed in batches, ``commit_delay_s``
+    after the first uncommitted one. A disk miss reloads the volume and
+    looks again, at most once per ``reload_interval_s``.
+    """
+
+    def __init__(
+        self,
+        memory_max_entries: int,
+        memory_max_bytes: int,
+        directory: str | Path | None = None,
+        disk_max_bytes: int = 0,
+        ttl_s: float = 0,
+        commit: Callable[[], None] | None = None,
+        reload: Callable[[], None] | None = None,
+        commit_delay_s: float = DEFAULT_COMMIT_DELAY_S,
+        reload_interval_s: float = DEFAULT_RELOAD_INTERVAL_S,
+    ):
+        self.memory = LRUCache(
+            memory_max_entries,
+            max_bytes=memory_max_bytes,
+            sizeof=lambda entry: len(entry[1]),
+        )
+        self.directory = Path(directory) if directory else None
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_s = ttl_s
+        self._disk_bytes: int | None = None  # measured lazily on first write
+        self._stats: dict[str, dict[str, int]] = {}
+        self._commit = commit
+        self._reload = reload
+        self.commit_delay_s = commit_delay_s
+        self.reload_interval_s = reload_interval_s
+        self._commit_task: asyncio.Task | None = None
+        self._last_reload = 0.0
+
+    async def get(self, model_key: str, key: str) -> tuple[dict | None, str]:
+        """Return ``(response, tier)``; tier is "memory", "disk" or "miss"."""
+        stats = self._model_stats(model_key)
+        entry = self.memory.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            stats["memory_hits"] += 1
+            return json.loads(entry[1]), "memory"
+        if entry is not None:
+            self.memory.pop(key)
+
+        if self.directory is not None:
+            entry = await asyncio.to_thread(self._read, model_key, key)
+            if entry is None and await self._reload_volume():
+                entry = await asyncio.to_thread(self._read, model_key, key)
+            if entry is not None:
+                self.memory.put(key, entry)
+                stats["disk_hits"] += 1
+                return json.loads(entry[1]), "disk"
+
+        stats["misses"] += 1
+        return None, "miss"
+
+    async def put(self, model_key: str, key: str, response: dict):
+        """Store a response in both tiers."""
+        entry = (time.time(), json.dumps(response, separators=(",", ":")))
+        self.memory.put(key, entry)
+        self._model_stats(model_key)["stores"] += 1
+        if self.directory is not None:
+            await asyncio.to_thread(self._write, model_key, key, entry)
+            if self._commit is not None and self._commit_task is None:
+                self._commit_task = asyncio.create_task(self._commit_later())
+
+    def record_bypass(self, model_key: str):
+        """Count a request that skipped the cache because it samples."""
+        self._model_stats(model_key)["bypassed_sampled"] += 1
+
+    def stats(self) -> dict:
+        """Per-model hit rates plus memory-tier occupancy."""
+        models = {}
+        for model_key, counts in self._stats.items():
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            lookups = hits + counts["misses"]
+            models[model_key] = {**counts, "hit_rate": hits / lookups if lookups else 0.0}
+        return {
+            "models": models,
+            "memory": self.memory.stats(),
+            "disk_bytes": self._disk_bytes,
+            "ttl_s": self.ttl_s,
+        }
+
+    async def _commit_later(self):
+        """Commit the volume once the current batch of writes has had time to gather."""
+        await asyncio.sleep(self.commit_delay_s)
+        self._commit_task = None  # writes from here on schedule the next commit
+        try:
+            await asyncio.to_thread(self._commit)
+        except Exception as e:
+            print(f"Could not commit the response cache: {e}")
+
+    async def _reload_volume(self) -> bool:
+        """Reload the volume unless that was done recently; True if it was reloaded."""
+        if self._reload is None or time.time() - self._last_reload < self.reload_interval_s:
+            return False
+        self._last_reload = time.time()
+        try:
+            await asyncio.to_thread(self._reload)
+        except Exception as e:
+            print(f"Could not reload the response cache: {e}")
+            return False
+        return True
+
+    def _model_stats(self, model_key: str) -> dict[str, int]:
+        stats = self._stats.get(model_key)
+        if stats is None:
+            stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "bypassed_sampled": 0}
+            self._stats[model_key] = stats
+        return stats
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_s > 0 and time.time() - created > self.ttl_s
+
+    def _path(self, model_key: str, key: str) -> Path:
+        return self.directory / model_key / key[:2] / f"{key}.json"
+
+    def _read(self, model_key: str, key: str) -> tuple[float, str] | None:
+        path = self._path(model_key, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored["created"]):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return stored["created"], stored["response"]
+
+    def _write(self, model_key: str, key: str, entry: tuple[float, str]):
+        path = self._path(model_key, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"created": entry[0], "response": entry[1]})
+        # Write then rename, so a concurrent reader never sees a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        try:
+            replaced = os.stat(path).st_size  # overwriting an entry frees its old size
+        except OSError:
+            replaced = 0
+        os.replace(tmp, path)
+
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._scan())
+        else:
+            self._disk_bytes += len(data) - replaced
+        if self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes:
+            self._evict()
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) for every stored response."""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _evict(self):
+        """Delete expired files, then the oldest ones, until under 90% of the limit."""
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        now = time.time()
+        for mtime, size, path in files:
+            expired = self.ttl_s > 0 and now - mtime > self.ttl_s
+            if total <= target and not expired:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
@@ -0,0 +1,597 @@
+"""
+OpenAI-compatible FastAPI router in front of the per-model classes.
+
+vllm_gpu_server.py serves it from one Modal function per GPU app, with
+RemoteHandle wrappers around the model classes. The router itself has no
+Modal or vLLM dependency: with LocalHandle wrappers around fake_engine.py
+models, the same routing, request parsing, model lookup and response shaping
+run in-process (see bench_router.py).
+
+POST /v1/batches takes a JSONL file of requests for offline runs (see
+batch.py) when the router is given a BatchStore.
+
+GET /metrics serves Prometheus metrics (metrics.RouterMetrics): request and
+remote-call counts, latency histograms, queue depth, tokens, and the engine
+stats that model containers publish (``engine_stats``).
+"""
+
+import json
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Protocol
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from config import (
+    BASE_MODELS,
+    get_autoscaling,
+    get_coalesce_settings,
+    get_multi_model_autoscaling,
+    get_router_limits,
+    is_response_cache_enabled,
+)
+from batch import BATCH_ENDPOINTS, DEFAULT_PARALLEL_SHARDS, DEFAULT_SHARD_SIZE, BatchStore
+from dispatch import ModelGate, QueueFullError, RequestCoalescer
+from metrics import CONTENT_TYPE, RouterMetrics, warm_containers
+from response_cache import ResponseCache, is_deterministic, response_cache_key
+from structured_schemas import structured_outputs_spec
+
+MAX_SAMPLES = 64  # Largest n / best_of per prompt, since every candidate takes a KV cache slot
+
+
+class ModelHandle(Protocol):
+    """How the router calls a model: ``chat``/``complete`` and their ``_stream`` variants."""
+
+    async def call(self, method_name: str, **kwargs) -> dict: ...
+
+    def stream(self, method_name: str, **kwargs) -> AsyncIterator[dict]: ...
+
+
+class RemoteHandle:
+    """A Modal class instance; calls go over the network without blocking the event loop.
+
+    ``bound`` kwargs are added to every call, e.g. ``model_key`` for a class
+    hosting several models.
+    """
+
+    def __init__(self, instance, **bound):
+        self.instance = instance
+        self.bound = bound
+
+    async def call(self, method_name: str, **kwargs) -> dict:
+        return await getattr(self.instance, method_name).remote.aio(**kwargs, **self.bound)
+
+    def stream(self, method_name: str, **kwargs) -> AsyncIterator[dict]:
+        return getattr(self.instance, method_name).remote_gen.aio(**kwargs, **self.bound)
+
+
+class LocalHandle:
+    """An in-process object with the model classes' methods (e.g. fake_engine.FakeModel)."""
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    async def call(self, method_name: str, **kwargs) -> dict:
+        return await getattr(self.instance, method_name)(**kwargs)
+
+    def stream(self, method_name: str, **kwargs) -> AsyncIterator[dict]:
+        return getattr(self.instance, method_name)(**kwargs)
+
+
+def sampling_counts(body: dict) -> dict:
+    """``n`` and ``best_of`` from a request body, as model method kwargs.
+
+    Only values that differ from one sample per prompt are returned, so
+    ordinary requests keep their response cache keys and coalescing groups.
+    Invalid values raise a 400; best_of cannot be streamed (as in OpenAI).
+    """
+    n = body.get("n")
+    best_of = body.get("best_of")
+    counts = {}
+    if n is not None:
+        if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= MAX_SAMPLES:
+            raise HTTPException(status_code=400, detail=f"n must be an integer from 1 to {MAX_SAMPLES}")
+        if n > 1:
+            counts["n"] = n
+    if best_of is not None:
+        if not isinstance(best_of, int) or isinstance(best_of, bool) or not (n or 1) <= best_of <= MAX_SAMPLES:
+            raise HTTPException(status_code=400, detail=f"best_of must be an integer from n to {MAX_SAMPLES}")
+        if body.get("stream"):
+            raise HTTPException(status_code=400, detail="best_of cannot be used with stream")
+        if best_of > (n or 1):
+            counts["best_of"] = best_of
+    return counts
+
+
+def chat_params(body: dict) -> dict:
+    """``chat`` / ``chat_stream`` kwargs from a /v1/chat/completions body."""
+    return {
+        "messages": body.get("messages", []),
+        "max_tokens": body.get("max_tokens", 1024),
+        "temperature": body.get("temperature", 0.7),
+        "top_p": body.get("top_p", 1.0),
+        "response_format": body.get("response_format"),
+        "structured_outputs": body.get("structured_outputs"),  # vLLM extra_body
+        "strip_thinking": bool(body.get("strip_thinking")),
+        **sampling_counts(body),
+    }
+
+
+def completion_params(body: dict) -> dict:
+    """``complete`` / ``complete_stream`` kwargs from a /v1/completions body, except the prompt."""
+    return {
+        "max_tokens": body.get("max_tokens", 1024),
+        "temperature": body.get("temperature", 0.7),
+        "top_p": body.get("top_p", 1.0),
+        "echo": body.get("echo", False),
+        "response_format": body.get("response_format"),
+        "structured_outputs": body.get("structured_outputs"),  # vLLM extra_body
+        "strip_thinking": bool(body.get("strip_thinking")),
+        **sampling_counts(body),
+    }
+
+
+def cacheable_request(
+    params: dict,
+    response_format: dict | None,
+    structured_outputs: dict | None,
+) -> dict:
+    """Generation inputs for a response cache key, with the structured spec normalized.
+
+    Equivalent schemas (same content, different key order or whitespace) then
+    share cache entries, like they share compiled grammars.
+    """
+    spec = structured_outputs_spec(response_format, structured_outputs)
+    request = {k: v for k, v in params.items() if k not in ("response_format", "structured_outputs")}
+    request["structured_outputs"] = list(spec) if spec is not None else None
+    return request
+
+
+def create_app(
+    handles: dict[str, ModelHandle],
+    gpu_key: str,
+    api_key: str = "",
+    response_cache: ResponseCache | None = None,
+    engine_stats: Callable[[], Awaitable[list[dict]]] | None = None,
+    batches: BatchStore | None = None,
+    multi_model_keys: list[str] | None = None,
+) -> FastAPI:
+    """FastAPI app that routes requests to the model handle named by their "model" field.
+
+    Handlers never block the event loop: model calls are awaited and each
+    model is guarded by a ModelGate that caps in-flight calls and queue
+    length (429 once the queue is full).
+
+    Non-streamed responses to deterministic requests (temperature 0) are
+    served from ``response_cache`` when one is given; see cached_call below.
+    Without ``api_key`` no authentication is required.
+
+    ``engine_stats`` returns the model containers' latest heartbeats (see
+    RouterMetrics.record_heartbeats); /metrics calls it on every scrape and
+    /health/models uses it to tell warm models from cold ones.
+    The /v1/batches endpoints are only served when ``batches`` is given.
+    ``multi_model_keys`` are the models sharing the MultiModel container pool,
+    whose autoscaling settings /health/models reports for each of them.
+    """
+    api = FastAPI(title=f"vLLM Multi-Model Server ({gpu_key.upper()})")
+    security = HTTPBearer(auto_error=bool(api_key))  # a missing header is only an error with a key set
+
+    async def verify_token(credentials: HTTPAuthorizationCredentials | None = Depends(security)):
+        """Verify the Bearer token."""
+        if not api_key:
+            return  # No auth if key not configured
+        if credentials.credentials != api_key:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+
+    # Model name to class mapping
+    MODEL_LOOKUP = {}
+    for model_key, model_info in BASE_MODELS.items():
+        MODEL_LOOKUP[model_info["name"]] = model_key
+        MODEL_LOOKUP[model_key] = model_key
+        MODEL_LOOKUP[model_info["name"].split("/")[-1]] = model_key
+    # Partial matching prefers the longest name a request contains, so a quantized
+    # variant's name ("gemma-3-27b-it-fp8") beats its base model's ("gemma-3-27b-it")
+    LOOKUP_BY_LENGTH = sorted(
+        ((key.lower(), mk) for key, mk in MODEL_LOOKUP.items()), key=lambda item: -len(item[0])
+    )
+
+    # Concurrency gates are created once per router container
+    MODEL_GATES = {key: ModelGate(*get_router_limits(key)) for key in handles}
+
+    def make_coalescer(model_key: str) -> RequestCoalescer | None:
+        """Build the completion coalescer for a model, or None if disabled."""
+        window_ms, max_batch = get_coalesce_settings(model_key)
+        if window_ms <= 0 or max_batch <= 1:
+            return None
+
+        async def send_batch(params: dict, prompts: list[str]) -> dict:
+            return await dispatch(
+                model_key, "complete", prompt=prompts, include_choice_usage=True, **params
+            )
+
+        return RequestCoalescer(send_batch, window_ms / 1000, max_batch)
+
+    MODEL_COALESCERS = {key: make_coalescer(key) for key in handles}
+
+    metrics = RouterMetrics()
+
+    def resolve_model_key(model_name: str) -> str | None:
+        """Resolve a requested model name to a base model key."""
+        # Try exact match
+        if model_name in MODEL_LOOKUP:
+            return MODEL_LOOKUP[model_name]
+
+        # Try partial match: a known name within the request, else the request within a known name
+        model_lower = model_name.lower()
+        for key, mk in LOOKUP_BY_LENGTH:
+            if key in model_lower:
+                return mk
+        for key, mk in MODEL_LOOKUP.items():
+            if model_lower in key.lower():
+                return mk
+        return None
+
+    def get_model_key(model_name: str | None) -> str:
+        """Resolve the request's model or raise the matching HTTP error."""
+        if not model_name:
+            raise HTTPException(status_code=400, detail="model field is required")
+
+        model_key = resolve_model_key(model_name)
+        if not model_key or model_key not in handles:
+            available = list(BASE_MODELS.keys())
+            raise HTTPException(
+                status_code=404,
+                detail=f"Model '{model_name}' not found. Available: {available}"
+            )
+        return model_key
+
+    async def dispatch(model_key: str, method_name: str, **kwargs) -> dict:
+        """Call a model method, holding one of the model's gate slots."""
+        queued = time.perf_counter()
+        try:
+            async with MODEL_GATES[model_key].slot():
+                start = time.perf_counter()
+                metrics.queue_wait.labels(model=model_key).observe(start - queued)
+                try:
+                    result = await handles[model_key].call(method_name, **kwargs)
+                except Exception:
+                    metrics.record_call(model_key, method_name, "error", time.perf_counter() - start)
+                    raise
+        except QueueFullError as e:
+            metrics.record_call(model_key, method_name, "rejected")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Model '{model_key}' is at capacity: {e}",
+                headers={"Retry-After": "1"},
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        metrics.record_call(model_key, method_name, "ok", time.perf_counter() - start, result.get("usage"))
+        return result
+
+    async def dispatch_stream(model_key: str, method_name: str, **kwargs) -> StreamingResponse:
+        """Relay a model generator method to the client as server-sent events.
+
+        The model's gate slot is taken before the response starts (so a full
+        queue still yields a 429) and held until the stream ends or the
+        client disconnects.
+        """
+        slot = MODEL_GATES[model_key].slot()
+        queued = time.perf_counter()
+        try:
+            await slot.__aenter__()
+        except QueueFullError as e:
+            metrics.record_call(model_key, method_name, "rejected")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Model '{model_key}' is at capacity: {e}",
+                headers={"Retry-After": "1"},
+            )
+
+        start = time.perf_counter()
+        metrics.queue_wait.labels(model=model_key).observe(start - queued)
+
+        async def events():
+            outcome, usage = "cancelled", None  # unless the stream runs to its end
+            try:
+                async for chunk in handles[model_key].stream(method_name, **kwargs):
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+                outcome = "ok"
+            except Exception as e:
+                outcome = "error"
+                yield f"data: {json.dumps({'error': {'message': str(e)}})}\n\n"
+            finally:
+                await slot.__aexit__(None, None, None)
+                metrics.record_call(model_key, method_name, outcome, time.perf_counter() - start, usage)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def response_cache_key_for(model_key: str, endpoint: str, body: dict, params: dict) -> str | None:
+        """Cache key for a non-streamed request, or None if it must not be cached.
+
+        Caching is on when the model enables it in config.py or the request
+        sets "cache": true ("cache": false always opts out). Sampled requests
+        (temperature > 0) are never cached unless they also set
+        "cache_sampled": true. The structured spec is only normalized once a
+        request is known to be cacheable, so uncached requests skip that work.
+        """
+        if response_cache is None or not body.get("cache", is_response_cache_enabled(model_key)):
+            return None
+        if not is_deterministic(params["temperature"]) and not body.get("cache_sampled"):
+            response_cache.record_bypass(model_key)
+            return None
+        request = cacheable_request(params, params["response_format"], params["structured_outputs"])
+        return response_cache_key(model_key, endpoint, request)
+
+    async def cached_call(model_key: str, cache_key: str | None, call: Callable) -> JSONResponse:
+        """Serve ``call()`` through the response cache; X-Cache reports the tier."""
+        if cache_key is None:
+            return JSONResponse(await call())
+
+        result, tier = await response_cache.get(model_key, cache_key)
+        if result is None:
+            result = await call()
+            await response_cache.put(model_key, cache_key, result)
+        else:
+            metrics.cache_hits.labels(model=model_key, tier=tier).inc()
+        return JSONResponse(result, headers={"X-Cache": tier})
+
+    @api.get("/health")
+    async def health():
+        """Health check (no auth required)."""
+        return {
+            "status": "ok",
+            "gpu": gpu_key,
+            "models": list(BASE_MODELS.keys()),
+            "queues": {key: gate.stats() for key, gate in MODEL_GATES.items()},
+            "coalescing": {
+                key: coalescer.stats()
+                for key, coalescer in MODEL_COALESCERS.items()
+                if coalescer is not None
+            },
+            "response_cache": response_cache.stats() if response_cache is not None else None,
+        }
+
+    @api.get("/health/models")
+    async def health_models():
+        """Warm or cold state per model, read from heartbeats without starting a container (no auth required)."""
+        warm = None
+        if engine_stats is not None:
+            try:
+                warm = warm_containers(await engine_stats())
+            except Exception as e:
+                print(f"Could not read engine heartbeats: {e}")
+        pool_autoscaling = get_multi_model_autoscaling(multi_model_keys) if multi_model_keys else None
+        models = {}
+        for key in handles:
+            containers = warm.get(key, 0) if warm is not None else None
+            if containers is None:
+                state = "unknown"
+            else:
+                state = "warm" if containers else "cold"
+            pooled = key in (multi_model_keys or ())
+            models[key] = {
+                "state": state,
+                "containers": containers,
+                "pool": "MultiModel" if pooled else key,
+                "autoscaling": pool_autoscaling if pooled else get_autoscaling(key),
+            }
+        return {"gpu": gpu_key, "models": models}
+
+    @api.get("/cache/stats")
+    async def cache_stats():
+        """Response cache hit rates per model (no auth required)."""
+        return response_cache.stats() if response_cache is not None else {}
+
+    @api.get("/metrics")
+    async def prometheus_metrics():
+        """Prometheus metrics for this router container (no auth required)."""
+        for key, gate in MODEL_GATES.items():
+            metrics.record_gate(key, gate.stats())
+        if engine_stats is not None:
+            try:
+                metrics.record_heartbeats(await engine_stats())
+            except Exception as e:
+                print(f"Could not read engine heartbeats: {e}")
+        return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+    @api.get("/v1/models", dependencies=[Depends(verify_token)])
+    async def list_models():
+        """List available models (requires auth)."""
+        models = [
+            {
+                "id": info["name"],
+                "object": "model",
+                "created": 0,
+                "owned_by": "modal",
+            }
+            for info in BASE_MODELS.values()
+        ]
+        return {"object": "list", "data": models}
+
+    @api.post("/v1/chat/completions", dependencies=[Depends(verify_token)])
+    async def chat_completions(request: Request):
+        """Chat completions with structured output support (requires auth).
+
+        Supports structured output via:
+        - response_format: {"type": "json_object"} or {"type": "json_schema", ...}
+        - extra_body.structured_outputs: {"json": ...}, {"regex": ...}, {"choice": ...}, {"grammar": ...}
+
+        With "strip_thinking": true, <think>/<thinking> spans are removed from
+        the content and counted in usage.completion_tokens_details.reasoning_tokens.
+
+        With "n", each choice is a separate sample of one prefill; "best_of"
+        returns the n most likely of best_of samples (not with streaming).
+
+        With "stream": true the response is a stream of chat.completion.chunk
+        server-sent events terminated by "data: [DONE]".
+
+        See: https://docs.vllm.ai/en/v0.12.0/features/structured_outputs/
+        """
+        body = await request.json()
+        model_key = get_model_key(body.get("model"))
+        metrics.requests.labels(model=model_key, method="chat_stream" if body.get("stream") else "chat").inc()
+        params = chat_params(body)
+
+        if body.get("stream"):
+            stream_options = body.get("stream_options") or {}
+            return await dispatch_stream(
+                model_key,
+                "chat_stream",
+                include_usage=bool(stream_options.get("include_usage")),
+                **params,
+            )
+
+        cache_key = response_cache_key_for(model_key, "chat", body, params)
+        return await cached_call(
+            model_key, cache_key, lambda: dispatch(model_key, "chat", **params)
+        )
+
+    @api.post("/v1/completions", dependencies=[Depends(verify_token)])
+    async def text_completions(request: Request):
+        """Text completions endpoint (OpenAI /v1/completions API).
+
+        Supports structured output via:
+        - response_format: {"type": "json_object"} or {"type": "json_schema", ...}
+        - structured_outputs: {"json": ...}, {"regex": ...}, {"choice": ...}, {"grammar": ...}
+
+        With "strip_thinking": true, thinking spans are removed from each
+        choice and counted as reasoning tokens in usage.
+
+        With "n" (and "best_of", not with streaming) each prompt gets n
+        choices, at index prompt_index * n + j.
+
+        With "stream": true the response is a stream of text_completion
+        server-sent events terminated by "data: [DONE]".
+
+        See: https://docs.vllm.ai/en/v0.12.0/features/structured_outputs/
+        """
+        body = await request.json()
+        model_key = get_model_key(body.get("model"))
+        metrics.requests.labels(model=model_key, method="complete_stream" if body.get("stream") else "complete").inc()
+        prompt = body.get("prompt", "")
+        params = completion_params(body)
+
+        if body.get("stream"):
+            stream_options = body.get("stream_options") or {}
+            return await dispatch_stream(
+                model_key,
+                "complete_stream",
+                prompt=prompt,
+                include_usage=bool(stream_options.get("include_usage")),
+                **params,
+            )
+
+        cache_key = response_cache_key_for(model_key, "complete", body, {"prompt": prompt, **params})
+
+        async def generate() -> dict:
+            # Coalesce plain string prompts with other compatible requests
+            coalescer = MODEL_COALESCERS[model_key]
+            prompts = [prompt] if isinstance(prompt, str) else prompt
+            if coalescer and prompts and all(isinstance(p, str) for p in prompts):
+                return await coalescer.submit(params, prompts)
+            return await dispatch(model_key, "complete", prompt=prompt, **params)
+
+        return await cached_call(model_key, cache_key, generate)
+
+    if batches is None:
+        return api
+
+    def parse_batch_line(line_number: int, line: str, index: int) -> dict:
+        """One input line as a stored batch request; HTTP errors name the line."""
+        try:
+            item = json.loads(line)
+            endpoint = BATCH_ENDPOINTS.get(item.get("url"))
+            if endpoint is None:
+                raise HTTPException(status_code=400, detail=f"url must be one of {list(BATCH_ENDPOINTS)}")
+            body = item.get("body") or {}
+            if body.get("stream"):
+                raise HTTPException(status_code=400, detail="stream is not supported in batches")
+            model_key = get_model_key(body.get("model"))
+            if endpoint == "chat":
+                params = chat_params(body)
+            else:
+                params = {"prompt": body.get("prompt", ""), **completion_params(body)}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"line {line_number}: invalid JSON: {e}")
+        except AttributeError:
+            raise HTTPException(status_code=400, detail=f"line {line_number}: expected a JSON object")
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"line {line_number}: {e.detail}")
+        return {
+            "index": index,
+            "custom_id": str(item.get("custom_id") or f"request-{line_number}"),
+            "model": model_key,
+            "endpoint": endpoint,
+            "params": params,
+        }
+
+    def batch_summary(manifest: dict) -> dict:
+        """A job's manifest without its shard plan, for API responses."""
+        summary = {k: v for k, v in manifest.items() if k not in ("shards", "done_shards", "failed_shards")}
+        summary["shards"] = {
+            "total": len(manifest["shards"]),
+            "done": len(manifest["done_shards"]),
+            "failed": len(manifest["failed_shards"]),
+        }
+        return summary
+
+    async def get_manifest(job_id: str) -> dict:
+        try:
+            return await batches.manifest(job_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Batch '{job_id}' not found")
+
+    @api.post("/v1/batches", dependencies=[Depends(verify_token)])
+    async def create_batch(
+        request: Request,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        parallel: int = DEFAULT_PARALLEL_SHARDS,
+    ):
+        """Start a batch job from a JSONL body of OpenAI Batch API request lines (requires auth).
+
+        Every line is validated before the job is stored, so a bad line
+        fails the upload with its line number. ``shard_size`` requests go to
+        a model container per call, ``parallel`` shards per model at a time.
+        """
+        if shard_size < 1 or parallel < 1:
+            raise HTTPException(status_code=400, detail="shard_size and parallel must be at least 1")
+        try:
+            text = (await request.body()).decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"The batch file is not valid UTF-8: {e}")
+        requests = []
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                requests.append(parse_batch_line(line_number, line, len(requests)))
+        if not requests:
+            raise HTTPException(status_code=400, detail="The batch file has no requests")
+        return batch_summary(await batches.submit(requests, shard_size, parallel))
+
+    @api.get("/v1/batches/{job_id}", dependencies=[Depends(verify_token)])
+    async def batch_status(job_id: str):
+        """Status and progress of a batch job (requires auth)."""
+        return batch_summary(await get_manifest(job_id))
+
+    @api.get("/v1/batches/{job_id}/results", dependencies=[Depends(verify_token)])
+    async def batch_results(job_id: str):
+        """Result lines of the job's finished shards as JSONL (requires auth)."""
+        manifest = await get_manifest(job_id)
+        return StreamingResponse(batches.results(job_id, manifest), media_type="application/jsonl")
+
+    @api.post("/v1/batches/{job_id}/resume", dependencies=[Depends(verify_token)])
+    async def resume_batch(job_id: str):
+        """Run a job's unfinished shards again, e.g. after it failed (requires auth)."""
+        manifest = await get_manifest(job_id)
+        if manifest["status"] == "completed":
+            raise HTTPException(status_code=409, detail=f"Batch '{job_id}' is already completed")
+        if not await batches.start(job_id):
+            raise HTTPException(status_code=409, detail=f"Batch '{job_id}' is already {manifest['status']}")
+        return batch_summary(await get_manifest(job_id))
+
+    return api
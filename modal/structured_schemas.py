@@ -0,0 +1,177 @@
+"""
+Structured-output specs that the model classes compile at container start.
+
+These mirror the zod schemas used by dex-bench's structured-output and
+entity-extraction benchmarks (src/lib/entity-extraction.ts), expressed in the
+`structured_outputs` request format understood by vllm_gpu_server.py. Add a
+spec here when a new benchmark sends a fixed schema, so its first request
+after a cold start does not wait for grammar compilation.
+
+Also normalizes a request's structured-output settings to a canonical spec,
+shared by the router (response cache keys) and the model classes (compiled
+grammar cache).
+"""
+
+import json
+from typing import Any
+
+from cache import LRUCache
+
+# Canonical text keyed by the schema's raw text, so a repeated schema skips
+# the parse and the sorted re-serialization. Entries are (raw, canonical), so
+# the byte bound covers both texts.
+CANONICAL_SCHEMA_CACHE_SIZE = 256
+CANONICAL_SCHEMA_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Measured by raw plus canonical text length
+
+_canonical_schemas = LRUCache(
+    CANONICAL_SCHEMA_CACHE_SIZE,
+    max_bytes=CANONICAL_SCHEMA_CACHE_MAX_BYTES,
+    sizeof=lambda entry: len(entry[0]) + len(entry[1]),
+)
+_raw_encoder = json.JSONEncoder(separators=(",", ":"), check_circular=False)
+
+
+def canonical_schema(schema: dict | str) -> str:
+    """Serialize a JSON schema canonically (sorted keys, no whitespace).
+
+    Equivalent schemas then map to the same cache entry here and to the same
+    compiled grammar in vLLM's grammar backend, which caches by schema text.
+    Results are cached by the raw text: a string schema as sent, a dict by
+    its unsorted serialization, which skips the key sort.
+    """
+    raw = schema if isinstance(schema, str) else _raw_encoder.encode(schema)
+    entry = _canonical_schemas.get(raw)
+    if entry is None:
+        entry = raw, _canonicalize(schema)
+        _canonical_schemas.put(raw, entry)
+    return entry[1]
+
+
+def _canonicalize(schema: dict | str) -> str:
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except json.JSONDecodeError:
+            return schema  # let the grammar backend report the invalid schema
+    return json.dumps(schema, sort_keys=True, separators=(",", ":"))
+
+
+def structured_outputs_spec(
+    response_format: dict | None = None,
+    structured_outputs: dict | None = None,
+) -> tuple[str, Any] | None:
+    """Normalize a request's structured output settings to a hashable (kind, value)."""
+    # Handle response_format (OpenAI-compatible)
+    if response_format:
+        format_type = response_format.get("type")
+
+        if format_type == "json_object":
+            # Force valid JSON output
+            return ("json_object", True)
+
+        elif format_type == "json_schema":
+            # Force specific JSON schema
+            json_schema = response_format.get("json_schema", {})
+            schema = json_schema.get("schema")
+            if schema:
+                return ("json", canonical_schema(schema))
+
+    # Handle structured_outputs (vLLM extra_body)
+    if structured_outputs:
+        # JSON schema
+        if "json" in structured_outputs:
+            return ("json", canonical_schema(structured_outputs["json"]))
+
+        # Any valid JSON
+        if structured_outputs.get("json_object"):
+            return ("json_object", True)
+
+        # Regex pattern
+        if "regex" in structured_outputs:
+            return ("regex", structured_outputs["regex"])
+
+        # Choice - one of options
+        if "choice" in structured_outputs:
+            return ("choice", tuple(structured_outputs["choice"]))
+
+        # EBNF Grammar
+        if "grammar" in structured_outputs:
+            return ("grammar", structured_outputs["grammar"])
+
+    return None
+
+
+ENTITY_TYPES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "entityTypes": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": (
+                "Array of entity types to extract (e.g., PERSON, ORGANIZATION, "
+                "LOCATION). Must contain at least one type."
+            ),
+        },
+    },
+    "required": ["entityTypes"],
+    "additionalProperties": False,
+}
+
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "extractions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {
+                        "type": "string",
+                        "description": "unique identifier for this extraction (e.g., e1, e2, e3)",
+                    },
+                    "extractionClass": {
+                        "type": "string",
+                        "description": "UPPER_SNAKE_CASE like PERSON, ORGANIZATION",
+                    },
+                    "extractionText": {
+                        "type": "string",
+                        "description": "exact text from document",
+                    },
+                },
+                "required": ["id", "extractionClass", "extractionText"],
+                "additionalProperties": False,
+            },
+        },
+        "relationships": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "sourceId": {
+                        "type": "string",
+                        "description": "ID of the source entity (e.g., e1)",
+                    },
+                    "targetId": {
+                        "type": "string",
+                        "description": "ID of the target entity (e.g., e2)",
+                    },
+                    "relationshipType": {
+                        "type": "string",
+                        "description": "UPPER_SNAKE_CASE like WORKS_FOR, LOCATED_IN",
+                    },
+                },
+                "required": ["sourceId", "targetId", "relationshipType"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["extractions", "relationships"],
+    "additionalProperties": False,
+}
+
+# Specs compiled by every model class at container start
+WARMUP_STRUCTURED_OUTPUTS: list[dict] = [
+    {"json_object": True},
+    {"json": ENTITY_TYPES_SCHEMA},
+    {"json": EXTRACTION_SCHEMA},
+]
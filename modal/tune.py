@@ -0,0 +1,259 @@
+"""
+Auto-tune vLLM engine settings for one model on one GPU type.
+
+Sweeps tensor parallelism (n_gpu), data parallelism (data_parallel),
+max_num_seqs and max_num_batched_tokens for a config.MODELS key. Every trial boots a fresh engine with the candidate
+settings in its own Modal container and replays the same workload: the
+dex-bench prompt shapes over the documents in docs/ (workload.py), as a
+closed loop with max_num_seqs clients per engine replica. The profile with the best throughput
+whose p95 request latency meets the SLO is written to tuning.json, which
+config.py applies over ENGINE_PROFILES on the next deploy.
+
+The search itself lives in autotune.py; --simulate runs it against a
+SimulatedEngine instead of GPUs, to check a search space before paying for it.
+
+Usage:
+    uv run modal run tune.py --model gemma-3-12b-h100
+    uv run modal run tune.py --model gemma-3-27b-a100 --n-gpu 1,2 --max-num-seqs 32,64,96 --slo-p95 90
+    uv run modal run tune.py --model qwen3-vl-30b-h200 --objective per-gpu --no-write
+
+    # Tensor or data parallelism on two GPUs: one TP=2 engine vs two TP=1 replicas
+    uv run modal run tune.py --model gemma-3-12b-h100 --n-gpu 1,2 --data-parallel 1,2
+
+    # Dry run of the search (no GPUs are started)
+    uv run modal run tune.py --model gemma-3-12b-h100 --simulate
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import modal
+
+# Ensure /root is in path for config module in Modal container
+if "/root" not in sys.path:
+    sys.path.insert(0, "/root")
+
+from autotune import (
+    SearchSpace,
+    SimulatedEngine,
+    TrialResult,
+    format_profile,
+    format_result,
+    gpu_count,
+    percentile,
+    saturating_curve,
+    search,
+    write_tuning,
+)
+from config import GPU_SHORT_NAMES, get_model_config
+from workload import build_workload, describe_workload
+
+MINUTES = 60  # seconds
+
+DEFAULT_N_GPU = "1,2"
+DEFAULT_DATA_PARALLEL = "1"
+DEFAULT_MAX_NUM_SEQS = "16,32,64,96,128,192,256"
+DEFAULT_MAX_NUM_BATCHED_TOKENS = "8192,16384,32768"
+DEFAULT_SLO_P95 = 120.0  # seconds, end to end, for the longest (extraction) requests
+DEFAULT_REQUESTS = 192
+
+# Same stack as vllm_gpu_server.py; the workload is built locally and sent with each trial
+tune_image = (
+    modal.Image.from_registry("nvidia/cuda:12.8.1-devel-ubuntu22.04", add_python="3.12")
+    .entrypoint([])
+    .pip_install(
+        "vllm==0.12.0",
+        "huggingface_hub[hf_transfer]==0.35.0",
+        "flashinfer-python==0.5.3",
+    )
+    .env({"HF_HUB_ENABLE_HF_TRANSFER": "1"})
+    .add_local_file("config.py", "/root/config.py")
+    .add_local_file("tuning.json", "/root/tuning.json")
+    .add_local_file("autotune.py", "/root/autotune.py")
+    .add_local_file("structured_schemas.py", "/root/structured_schemas.py")
+    .add_local_file("workload.py", "/root/workload.py")
+)
+
+hf_cache_vol = modal.Volume.from_name("huggingface-cache", create_if_missing=True)
+
+app = modal.App("vllm-tune")
+
+
+@app.cls(
+    image=tune_image,
+    volumes={"/root/.cache/huggingface": hf_cache_vol},
+    secrets=[modal.Secret.from_name("huggingface", required_keys=["HF_TOKEN"])],
+    timeout=45 * MINUTES,
+    scaledown_window=2 * MINUTES,
+)
+class TrialRunner:
+    """Runs one trial per call; the GPU type and count are set with ``with_options``."""
+
+    @modal.method()
+    async def run(self, config_key: str, overrides: dict, workload: list[dict]) -> dict:
+        """Boot an engine with ``overrides`` applied, replay ``workload`` and measure it.
+
+        Returns throughput and latency figures, or ``{"error": ...}`` if the
+        engine does not start (weights or KV cache do not fit).
+        """
+        import asyncio
+        import dataclasses
+        import uuid
+
+        from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+        from vllm.inputs import TokensPrompt
+        from vllm.sampling_params import RequestOutputKind, StructuredOutputsParams
+
+        config = dataclasses.replace(get_model_config(config_key), **overrides)
+        print(f"Trial {config_key}: {format_profile(overrides)}")
+        try:
+            engine = AsyncLLMEngine.from_engine_args(
+                AsyncEngineArgs(**config.engine_kwargs(), trust_remote_code=True)
+            )
+        except Exception as e:
+            return {"error": f"engine failed to start: {type(e).__name__}: {e}"}
+
+        try:
+            tokenizer = await engine.get_tokenizer()
+            prompts = [
+                TokensPrompt(prompt_token_ids=tokenizer.apply_chat_template(
+                    request["messages"], tokenize=True, add_generation_prompt=True
+                ))
+                for request in workload
+            ]
+
+            def sampling_params(request: dict, max_tokens: int) -> SamplingParams:
+                spec = request["structured_outputs"]
+                return SamplingParams(
+                    max_tokens=max_tokens,
+                    temperature=request["temperature"],
+                    structured_outputs=StructuredOutputsParams(**spec) if spec else None,
+                    output_kind=RequestOutputKind.FINAL_ONLY,
+                )
+
+            async def generate(index: int, max_tokens: int) -> int:
+                final = None
+                params = sampling_params(workload[index], max_tokens)
+                async for output in engine.generate(prompts[index], params, request_id=uuid.uuid4().hex):
+                    final = output
+                return len(final.outputs[0].token_ids)
+
+            # Compile each grammar once before the clock starts
+            kinds = {request["kind"]: index for index, request in enumerate(workload)}
+            await asyncio.gather(*(generate(index, 1) for index in kinds.values()))
+
+            pending = iter(range(len(workload)))
+            latencies: list[float] = []
+            output_tokens = 0
+
+            async def client():
+                nonlocal output_tokens
+                for index in pending:
+                    start = time.perf_counter()
+                    output_tokens += await generate(index, workload[index]["max_tokens"])
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            clients = config.max_num_seqs * config.data_parallel  # vLLM spreads them over the replicas
+            await asyncio.gather(*(client() for _ in range(min(clients, len(workload)))))
+            elapsed = time.perf_counter() - start
+        finally:
+            engine.shutdown()
+
+        return {
+            "throughput": output_tokens / elapsed,
+            "requests_per_s": len(latencies) / elapsed,
+            "p50_latency_s": percentile(latencies, 50),
+            "p95_latency_s": percentile(latencies, 95),
+        }
+
+
+def modal_evaluator(config_key: str, workload: list[dict]):
+    """Evaluate a batch of profiles in parallel, one GPU container per trial."""
+    gpu = get_model_config(config_key).gpu
+
+    def run_one(profile: dict) -> TrialResult:
+        runner = TrialRunner.with_options(gpu=f"{gpu}:{gpu_count(profile)}")()
+        try:
+            measured = runner.run.remote(config_key, profile, workload)
+        except Exception as e:
+            return TrialResult(profile, error=f"{type(e).__name__}: {e}")
+        if "error" in measured:
+            return TrialResult(profile, error=measured["error"])
+        return TrialResult(profile, **measured)
+
+    def evaluate(profiles: list[dict]) -> list[TrialResult]:
+        with ThreadPoolExecutor(len(profiles)) as pool:
+            return list(pool.map(run_one, profiles))
+
+    return evaluate
+
+
+def _ints(values: str) -> list[int]:
+    return [int(v) for v in values.split(",") if v.strip()]
+
+
+@app.local_entrypoint()
+def main(
+    model: str,
+    slo_p95: float = DEFAULT_SLO_P95,
+    n_gpu: str = DEFAULT_N_GPU,
+    data_parallel: str = DEFAULT_DATA_PARALLEL,
+    max_num_seqs: str = DEFAULT_MAX_NUM_SEQS,
+    max_num_batched_tokens: str = DEFAULT_MAX_NUM_BATCHED_TOKENS,
+    requests: int = DEFAULT_REQUESTS,
+    seed: int = 0,
+    objective: str = "throughput",
+    simulate: bool = False,
+    write: bool = True,
+):
+    """Search the space for one MODELS key and record the winner in tuning.json."""
+    config = get_model_config(model)
+    space = SearchSpace(
+        n_gpu=_ints(n_gpu),
+        max_num_batched_tokens=_ints(max_num_batched_tokens),
+        max_num_seqs=_ints(max_num_seqs),
+        data_parallel=_ints(data_parallel),
+    )
+    workload = build_workload(requests, seed=seed)
+    description = describe_workload(workload)
+
+    print(f"\n{'='*60}")
+    print(f"Tuning {model} ({config.huggingface_id} on {config.gpu})")
+    print(f"  Current: n_gpu={config.n_gpu} data_parallel={config.data_parallel} max_num_seqs={config.max_num_seqs} "
+          f"max_num_batched_tokens={config.max_num_batched_tokens}")
+    print(f"  Space: n_gpu {space.n_gpu}, data_parallel {space.data_parallel}, max_num_seqs {space.max_num_seqs}, "
+          f"max_num_batched_tokens {space.max_num_batched_tokens}")
+    print(f"  Workload: {description}")
+    print(f"  SLO: p95 latency <= {slo_p95:.0f}s, objective: {objective}")
+    print(f"{'='*60}\n")
+
+    if simulate:
+        # Rough shape of a 12B model on one H100; only the search is being checked
+        average_max_tokens = sum(request["max_tokens"] for request in workload) / len(workload)
+        evaluate = SimulatedEngine(
+            saturating_curve(peak_tok_s=4000, half_seqs=48), tokens_per_request=average_max_tokens / 3
+        )
+    else:
+        evaluate = modal_evaluator(model, workload)
+
+    start = time.time()
+    result = search(evaluate, space, slo_p95, objective=objective)
+    print(f"\n{len(result.trials)} trials in {time.time() - start:.0f}s")
+
+    if result.best is None:
+        print(f"No profile met the SLO (p95 <= {slo_p95:.0f}s); tuning.json left unchanged")
+        sys.exit(1)
+
+    print(f"Best: {format_profile(result.best.profile)}")
+    print(f"      {format_result(result.best)}")
+    if simulate or not write:
+        print("Not written (simulated run)" if simulate else "Not written (--no-write)")
+        return
+
+    path = Path(__file__).with_name("tuning.json")
+    write_tuning(path, model, result.best, slo_p95, objective, description)
+    gpu_short = GPU_SHORT_NAMES[config.gpu]
+    print(f"Wrote {model} to {path.name}; redeploy with: uv run python deploy.py --gpu {gpu_short}")
@@ -6,37 +6,91 @@ Each model runs in its own container pool using Modal's class-based pattern.
 
 Architecture:
 - 5 GPU apps: vllm-l40s, vllm-a100, vllm-h100, vllm-h200, vllm-b200
-- 1 web endpoint per app (FastAPI router)
-- 3 model classes per app (NOT web endpoints, just Modal functions)
+- 1 web endpoint per app (FastAPI router, see router.py)
+- 1 model class per BASE_MODELS entry, i.e. per model and quantized
+  variant (NOT web endpoints, just Modal functions)
+- Each model class runs an async vLLM engine that batches concurrent
+  requests continuously (concurrency set per model in config.py)
 - Requests are routed to the correct model based on the 'model' field
+- Offline JSONL batch jobs (POST /v1/batches) run in a spawned function
+  that sends length-sorted shards to the model classes (see batch.py)
+- Multi-model mode (MULTI_MODELS) replaces the listed models' classes with
+  one MultiModel class whose containers load all of them and keep one awake,
+  swapping engines through vLLM sleep mode (see hotswap.py)
 
 Usage:
     # Deploy a GPU app
     GPU_KEY=h100 modal deploy vllm_gpu_server.py
 
+    # Host the gemmas in one 2-GPU container pool, swapped on demand
+    GPU_KEY=h100 MULTI_MODELS=gemma-3-12b,gemma-3-27b modal deploy vllm_gpu_server.py
+
     # Or use deploy.py helper
     python deploy.py --gpu h100
 """
 
+import abc
+import asyncio
 import os
 import sys
 import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from typing import Any
 
 import modal
 
+CONTAINER_START = time.time()  # module import ~ container start, for cold-start logs
+
 # Ensure /root is in path for config module in Modal container
 if "/root" not in sys.path:
     sys.path.insert(0, "/root")
 
-from config import BASE_MODELS, GPU_SHORT_NAMES
+from cache import LRUCache
+from config import (
+    BASE_MODELS,
+    MULTI_MODEL_MIN_TURN_S,
+    MULTI_MODEL_N_GPU,
+    VLLM_CACHE_DIR,
+    ModelConfig,
+    get_autoscaling,
+    get_compile_cache_root,
+    get_gpu_type,
+    get_model_config,
+    get_multi_model_autoscaling,
+    get_multi_model_config,
+    get_multi_model_memory_mb,
+)
+from hotswap import HotSwapper
+from postprocess import ThinkingFilter, extract_json
+from replicas import ReplicaBalancer
+from response_cache import ResponseCache
+from structured_schemas import WARMUP_STRUCTURED_OUTPUTS, structured_outputs_spec
 
 # Get GPU from environment variable
 GPU_KEY = os.environ.get("GPU_KEY", "h100")
 
-# Map short names to Modal GPU types
-GPU_SHORT_TO_MODAL = {v: k for k, v in GPU_SHORT_NAMES.items()}
-GPU_TYPE = f"{GPU_SHORT_TO_MODAL.get(GPU_KEY, 'H100')}:2"  # Request 2 GPUs
+
+def _multi_model_keys(value: str) -> list[str]:
+    """Models hosted together by MultiModel: MULTI_MODELS is "all" or comma-separated keys."""
+    if not value:
+        return []
+    model_keys = list(BASE_MODELS) if value == "all" else [key.strip() for key in value.split(",") if key.strip()]
+    unknown = [key for key in model_keys if key not in BASE_MODELS]
+    if unknown:
+        raise ValueError(f"Unknown MULTI_MODELS: {', '.join(unknown)}. Available: {', '.join(BASE_MODELS)}")
+    return model_keys
+
+
+# Multi-model mode: these models share one container pool and its GPUs (empty = one pool per model)
+MULTI_MODEL_KEYS = _multi_model_keys(os.environ.get("MULTI_MODELS", ""))
+
+
+def _model_config(model_key: str) -> ModelConfig:
+    """Engine profile for a base model on this app's GPU (see ENGINE_PROFILES in config.py)."""
+    return get_model_config(f"{model_key}-{GPU_KEY}")
+
 
 # Container image with vLLM
 vllm_image = (
@@ -49,70 +103,385 @@ vllm_image = (
         "fastapi[standard]",
         "requests",
     )
-    .env({"HF_HUB_ENABLE_HF_TRANSFER": "1"})
+    .env({
+        "HF_HUB_ENABLE_HF_TRANSFER": "1",
+        "VLLM_XGRAMMAR_CACHE_MB": "1024",  # compiled grammar cache, keyed by schema text
+    })
     .add_local_file("config.py", "/root/config.py")  # Include config module
+    .add_local_file("tuning.json", "/root/tuning.json")  # Tuned engine settings (tune.py)
+    .add_local_file("dispatch.py", "/root/dispatch.py")
+    .add_local_file("cache.py", "/root/cache.py")
+    .add_local_file("postprocess.py", "/root/postprocess.py")
+    .add_local_file("structured_schemas.py", "/root/structured_schemas.py")
+    .add_local_file("response_cache.py", "/root/response_cache.py")
+    .add_local_file("router.py", "/root/router.py")
+    .add_local_file("metrics.py", "/root/metrics.py")
+    .add_local_file("batch.py", "/root/batch.py")
+    .add_local_file("hotswap.py", "/root/hotswap.py")
+    .add_local_file("replicas.py", "/root/replicas.py")
 )
 
 # Modal Volumes for caching
 hf_cache_vol = modal.Volume.from_name("huggingface-cache", create_if_missing=True)
 vllm_cache_vol = modal.Volume.from_name("vllm-cache", create_if_missing=True)
+response_cache_vol = modal.Volume.from_name("vllm-response-cache", create_if_missing=True)
+batch_vol = modal.Volume.from_name("vllm-batches", create_if_missing=True)
+
+# Latest engine stats per model container, read by the router's /metrics
+engine_metrics_dict = modal.Dict.from_name(f"vllm-{GPU_KEY}-engine-metrics", create_if_missing=True)
 
 # Configuration
 MINUTES = 60  # seconds
-MAX_MODEL_LEN = 49000  # Maximum context length
-TENSOR_PARALLEL_SIZE = 2  # Number of GPUs for tensor parallelism
+ROUTER_MAX_INPUTS = 1000  # Concurrent client requests per router container
+PROMPT_CACHE_MAX_ENTRIES = 512  # Rendered chat prompts kept per container
+PROMPT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # ~36 bytes per cached token id
+AFFINITY_PREFIX_TOKENS = 512  # Leading prompt tokens that keep a prompt on one data-parallel replica
+STRUCTURED_CACHE_MAX_ENTRIES = 256  # Structured output specs kept per container
+STRUCTURED_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Measured by schema/grammar text length
+RESPONSE_CACHE_DIR = "/root/.cache/responses"  # response_cache_vol mount in the router
+RESPONSE_CACHE_MAX_ENTRIES = 4096  # Responses kept in router memory
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Router memory tier, by serialized size
+RESPONSE_CACHE_DISK_MAX_BYTES = 4 * 1024 * 1024 * 1024  # Volume tier
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * MINUTES  # Cached responses expire after a week
+BATCH_DIR = "/root/batches"  # batch_vol mount in the router and the batch runner
+BATCH_SHARDS_PER_CONTAINER = 2  # Batch shards a model container runs at once (Modal >= 1.0)
+
+PREFIX_CACHE_LOG_EVERY = 100  # Log the container's prefix cache hit rate every N prompts
+ENGINE_METRICS_INTERVAL = 15  # Seconds between engine stats heartbeats from each model container
+
+# vLLM Prometheus samples forwarded in heartbeats, by heartbeat field
+VLLM_METRICS = {
+    "vllm:kv_cache_usage_perc": "kv_cache_usage",
+    "vllm:gpu_cache_usage_perc": "kv_cache_usage",  # name in older vLLM releases
+    "vllm:num_requests_running": "requests_running",
+    "vllm:num_requests_waiting": "requests_waiting",
+    "vllm:num_preemptions_total": "preemptions_total",
+    "vllm:prompt_tokens_total": "prompt_tokens_total",
+    "vllm:generation_tokens_total": "generation_tokens_total",
+    "vllm:spec_decode_num_draft_tokens_total": "spec_draft_tokens_total",
+    "vllm:spec_decode_num_accepted_tokens_total": "spec_accepted_tokens_total",
+}
+
+# Structured output params per canonical spec, shared by all requests in a container
+STRUCTURED_OUTPUTS_CACHE = LRUCache(
+    STRUCTURED_CACHE_MAX_ENTRIES,
+    max_bytes=STRUCTURED_CACHE_MAX_BYTES,
+    sizeof=lambda params: len(str(params.json or params.grammar or params.regex or params.choice or "")),
+)
+
+
+@dataclass
+class _PrefixCacheTotals:
+    prompts: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+
+class PrefixCacheStats:
+    """Prompt tokens served from vLLM's prefix cache, totalled per model in the container.
+
+    Models are told apart by name, which is what the generation helpers
+    carry; each model key has its own name (see BASE_MODELS).
+    """
+
+    def __init__(self, log_every: int):
+        self.log_every = log_every
+        self._totals: dict[str, _PrefixCacheTotals] = {}
+
+    def record(self, model_name: str, prompt_tokens: int, cached_tokens: int):
+        """Count one finished prompt and log the model's running hit rate periodically."""
+        totals = self._totals.setdefault(model_name, _PrefixCacheTotals())
+        totals.prompts += 1
+        totals.prompt_tokens += prompt_tokens
+        totals.cached_tokens += cached_tokens
+        if self.log_every and totals.prompts % self.log_every == 0:
+            stats = self.stats(model_name)
+            print(
+                f"Prefix cache ({model_name}): {stats['hit_rate']:.1%} of prompt tokens cached over "
+                f"{totals.prompts} prompts ({totals.cached_tokens:,} prefill tokens saved)"
+            )
+
+    def stats(self, model_name: str) -> dict:
+        """A model's totals and hit rate, for health endpoints and heartbeats."""
+        totals = self._totals.get(model_name, _PrefixCacheTotals())
+        return {
+            "prompts": totals.prompts,
+            "prompt_tokens": totals.prompt_tokens,
+            "cached_tokens": totals.cached_tokens,
+            "hit_rate": totals.cached_tokens / totals.prompt_tokens if totals.prompt_tokens else 0.0,
+        }
+
+
+PREFIX_CACHE_STATS = PrefixCacheStats(PREFIX_CACHE_LOG_EVERY)
+
+
+def _read_vllm_metrics(model_name: str | None = None) -> dict[str, float]:
+    """Current VLLM_METRICS values from vLLM's in-process Prometheus registry.
+
+    Samples are summed over their labels (one set per engine), except KV
+    cache usage, which reports the fullest engine. With ``model_name``, only
+    samples labelled with that served model count (multi-model containers).
+    """
+    from prometheus_client import REGISTRY
+
+    values = dict.fromkeys(VLLM_METRICS.values(), 0.0)
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            stat = VLLM_METRICS.get(sample.name)
+            if model_name is not None and sample.labels.get("model_name", model_name) != model_name:
+                continue
+            if stat == "kv_cache_usage":
+                values[stat] = max(values[stat], sample.value)
+            elif stat is not None:
+                values[stat] += sample.value
+    return values
+
 
 # Create Modal app with GPU-specific name
 app = modal.App(f"vllm-{GPU_KEY}")
 
-# Common function configuration
+# Common function configuration (GPU count and autoscaling come from each model's config)
 COMMON_CONFIG = {
     "image": vllm_image,
-    "gpu": GPU_TYPE,
-    "scaledown_window": 15 * MINUTES,
     "timeout": 10 * MINUTES,
     "volumes": {
         "/root/.cache/huggingface": hf_cache_vol,
-        "/root/.cache/vllm": vllm_cache_vol,
+        VLLM_CACHE_DIR: vllm_cache_vol,
     },
     "secrets": [modal.Secret.from_name("huggingface", required_keys=["HF_TOKEN"])],
 }
 
 
+def _class_config(model_key: str) -> dict:
+    """Modal class options for a model: GPUs, autoscaling, and snapshotting if its boot mode uses it."""
+    config = _model_config(model_key)
+    options = {**COMMON_CONFIG, **get_autoscaling(model_key), "gpu": f"{config.gpu}:{config.gpu_count}"}
+    if config.boot_mode == "snapshot":
+        options["enable_memory_snapshot"] = True
+        options["experimental_options"] = {"enable_gpu_snapshot": True}
+    return options
+
+
 # =============================================================================
 # Model Classes - Must be defined at global scope for Modal
 # =============================================================================
 
 
-@app.cls(**COMMON_CONFIG)
-class Gemma3_12B:
-    """vLLM inference class for gemma-3-12b."""
-    
-    model_key: str = "gemma-3-12b"
-    model_name: str = BASE_MODELS["gemma-3-12b"]["name"]
-    huggingface_id: str = BASE_MODELS["gemma-3-12b"]["huggingface_id"]
-    
-    @modal.enter()
-    def load_model(self):
-        """Load the vLLM engine when container starts."""
-        from vllm import LLM
-        
-        print(f"Loading model: {self.huggingface_id}")
-        start = time.time()
-        
-        self.llm = LLM(
-            model=self.huggingface_id,
-            enforce_eager=True,
-            max_model_len=MAX_MODEL_LEN,
-            tensor_parallel_size=TENSOR_PARALLEL_SIZE,
-            trust_remote_code=True,
+@dataclass
+class _HostedModel:
+    """One model's engine in a container, with its chat prompt cache."""
+
+    model_key: str
+    config: ModelConfig
+    engine: Any
+    prompt_cache: LRUCache
+
+    @property
+    def model_name(self) -> str:
+        return self.config.name
+
+
+def _prefix_key(prompt) -> int | None:
+    """Hash of a prompt's leading tokens (or characters), for data-parallel replica affinity."""
+    if isinstance(prompt, str):
+        return hash(prompt[: 4 * AFFINITY_PREFIX_TOKENS])
+    token_ids = prompt.get("prompt_token_ids") if isinstance(prompt, dict) else None
+    return hash(tuple(token_ids[:AFFINITY_PREFIX_TOKENS])) if token_ids else None
+
+
+class _DataParallelEngine:
+    """A data-parallel vLLM engine that places each request with a ReplicaBalancer.
+
+    vLLM runs one engine core per data-parallel rank behind ``engine``, and
+    ``generate`` pins each request to the rank the balancer picks (least
+    loaded, or the one holding the prompt's prefix cache). Everything else
+    (tokenizer, sleep, shutdown, ...) is the wrapped engine's.
+    """
+
+    def __init__(self, engine, replicas: int):
+        self._engine = engine
+        self.replicas = replicas
+        self.balancer = ReplicaBalancer(replicas)
+
+    def __getattr__(self, name: str):
+        return getattr(self._engine, name)
+
+    async def generate(self, prompt, sampling_params, request_id, data_parallel_rank: int | None = None, **kwargs):
+        with self.balancer.use(_prefix_key(prompt), data_parallel_rank) as rank:
+            async for output in self._engine.generate(
+                prompt, sampling_params, request_id, data_parallel_rank=rank, **kwargs
+            ):
+                yield output
+
+
+def _load_engine(model_key: str, config: ModelConfig, boot_mode: str, sleep_mode: bool) -> tuple[_HostedModel, bool]:
+    """Build a model's engine; returns it and whether compile artifacts were already cached.
+
+    VLLM_CACHE_ROOT points at a directory on the vllm-cache volume keyed by
+    model, GPU and vLLM version, so torch.compile and CUDA graph artifacts
+    from an earlier container are reused instead of rebuilt. ``sleep_mode``
+    lets the engine offload its weights to host memory (engine.sleep).
+    """
+    from importlib.metadata import version
+
+    cache_root = get_compile_cache_root(model_key, GPU_KEY, version("vllm"))
+    compile_cache_hit = os.path.isdir(cache_root) and any(os.scandir(cache_root))
+    os.environ["VLLM_CACHE_ROOT"] = cache_root
+
+    from vllm import AsyncEngineArgs, AsyncLLMEngine
+
+    print(f"Loading model: {config.huggingface_id} (boot mode: {boot_mode}, "
+          f"quantization: {config.quantization or 'none'}, {config.data_parallel} x TP{config.n_gpu})")
+    start = time.time()
+
+    engine_args = AsyncEngineArgs(
+        **config.engine_kwargs(),
+        enable_sleep_mode=sleep_mode,
+        trust_remote_code=True,
+    )
+    engine = AsyncLLMEngine.from_engine_args(engine_args)
+    if config.data_parallel > 1:
+        engine = _DataParallelEngine(engine, config.data_parallel)
+    hosted = _HostedModel(
+        model_key,
+        config,
+        engine,
+        LRUCache(
+            PROMPT_CACHE_MAX_ENTRIES,
+            max_bytes=PROMPT_CACHE_MAX_BYTES,
+            sizeof=lambda token_ids: 36 * len(token_ids),
+        ),
+    )
+
+    elapsed = time.time() - start
+    print(f"Model loaded in {elapsed:.1f}s: {config.name}")
+    return hosted, compile_cache_hit
+
+
+async def _warm_structured_outputs(engine):
+    """Compile the grammars for known structured-output specs up front.
+
+    Runs a one-token generation per spec in WARMUP_STRUCTURED_OUTPUTS so
+    the grammar backend has them compiled (and cached by canonical schema
+    text) before the first real structured request arrives. Each
+    data-parallel replica compiles its own, so each gets the warm-up.
+    """
+    from vllm import SamplingParams
+
+    placements = [{}]
+    if isinstance(engine, _DataParallelEngine):
+        placements = [{"data_parallel_rank": rank} for rank in range(engine.replicas)]
+
+    start = time.time()
+    for spec in WARMUP_STRUCTURED_OUTPUTS:
+        sampling_params = SamplingParams(
+            max_tokens=1,
+            structured_outputs=_build_structured_outputs_params(structured_outputs=spec),
         )
-        
-        elapsed = time.time() - start
-        print(f"Model loaded in {elapsed:.1f}s: {self.model_name}")
-    
+        try:
+            for placement in placements:
+                await _run_generation(engine, "{", sampling_params, **placement)
+        except Exception as e:
+            print(f"Structured output warm-up failed for {list(spec)}: {e}")
+
+    elapsed = time.time() - start
+    print(f"Compiled {len(WARMUP_STRUCTURED_OUTPUTS)} structured output specs in {elapsed:.1f}s")
+
+
+def _container_id() -> str:
+    """This container's ID for heartbeat keys.
+
+    Read in the ``snap=False`` enter hooks, never at import: in snapshot boot
+    mode the module is imported before the snapshot, so a module-level value
+    would be shared by every container restored from it.
+    """
+    return os.environ.get("MODAL_TASK_ID") or uuid.uuid4().hex[:12]
+
+
+def _commit_compile_cache():
+    """Persist new compile artifacts now, so containers starting meanwhile reuse them."""
+    try:
+        vllm_cache_vol.commit()
+    except Exception as e:
+        print(f"Could not commit the compile cache: {e}")
+
+
+class _ModelMethods(abc.ABC):
+    """Modal methods shared by the per-model classes and MultiModel.
+
+    Subclasses load their engines into ``self.hosted`` (model key to
+    _HostedModel) and implement ``_serving``, which picks the engine for a
+    call. ``model_key`` selects the model on containers hosting several;
+    single-model classes ignore it.
+    """
+
+    hosted: dict[str, _HostedModel]
+    container_id: str
+    started: float
+    boot_mode: str
+    boot_s: float
+
+    @abc.abstractmethod
+    def _serving(self, model_key: str | None):
+        """Async context manager yielding the _HostedModel to run a call on."""
+
+    async def _publish_engine_metrics(self):
+        """Write each hosted model's engine stats to engine_metrics_dict every ENGINE_METRICS_INTERVAL.
+
+        The first heartbeat goes out as soon as the engines are ready, which
+        is how the router detects and times cold starts.
+        """
+        previous: dict[str, dict] = {}
+        previous_at = time.time()
+        while True:
+            now = time.time()
+            for model_key, hosted in self.hosted.items():
+                beat = {
+                    "model": model_key,
+                    "container": self.container_id,
+                    "boot_mode": self.boot_mode,
+                    "started": self.started,
+                    "boot_s": self.boot_s,
+                    "updated": now,
+                    "prefix_cache_hit_rate": PREFIX_CACHE_STATS.stats(hosted.model_name)["hit_rate"],
+                }
+                try:
+                    values = _read_vllm_metrics(hosted.config.huggingface_id)
+                    beat.update(values)
+                    if model_key in previous and now > previous_at:
+                        last = previous[model_key]
+                        for total, rate in (("prompt_tokens_total", "prompt_tokens_per_s"),
+                                            ("generation_tokens_total", "generation_tokens_per_s")):
+                            beat[rate] = (values[total] - last[total]) / (now - previous_at)
+                        drafted = values["spec_draft_tokens_total"] - last["spec_draft_tokens_total"]
+                        if drafted > 0:
+                            accepted = values["spec_accepted_tokens_total"] - last["spec_accepted_tokens_total"]
+                            beat["spec_acceptance_rate"] = accepted / drafted
+                    previous[model_key] = values
+                except Exception as e:
+                    print(f"Could not read engine metrics: {e}")
+                try:
+                    await engine_metrics_dict.put.aio(f"{model_key}:{self.container_id}", beat)
+                except Exception as e:
+                    print(f"Could not publish engine metrics: {e}")
+            previous_at = now
+            await asyncio.sleep(ENGINE_METRICS_INTERVAL)
+
+    @modal.exit()
+    def shutdown_engine(self):
+        """Stop the heartbeat and the engines' background processes when the container exits."""
+        if getattr(self, "heartbeat_task", None) is not None:
+            self.heartbeat_task.cancel()
+            for model_key in self.hosted:
+                try:
+                    engine_metrics_dict.pop(f"{model_key}:{self.container_id}")
+                except Exception:
+                    pass  # the router ignores stale heartbeats anyway
+        for hosted in getattr(self, "hosted", {}).values():
+            hosted.engine.shutdown()
+
     @modal.method()
-    def chat(
+    async def chat(
         self,
         messages: list[dict],
         max_tokens: int = 1024,
@@ -120,17 +489,26 @@ class Gemma3_12B:
         top_p: float = 1.0,
         response_format: dict | None = None,
         structured_outputs: dict | None = None,
+        strip_thinking: bool = False,
+        n: int = 1,
+        best_of: int | None = None,
+        model_key: str | None = None,
         **kwargs,
     ) -> dict[str, Any]:
         """Generate a chat completion with optional structured output."""
-        return _generate_chat_completion(
-            self.llm, self.model_name, messages, max_tokens, temperature, top_p,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
-        )
-    
+        async with self._serving(model_key) as hosted:
+            return await _generate_chat_completion(
+                hosted.engine, hosted.model_name, messages, max_tokens, temperature, top_p,
+                prompt_cache=hosted.prompt_cache,
+                response_format=response_format,
+                structured_outputs=structured_outputs,
+                strip_thinking=strip_thinking,
+                n=n,
+                best_of=best_of,
+            )
+
     @modal.method()
-    def complete(
+    async def complete(
         self,
         prompt: str | list[str],
         max_tokens: int = 1024,
@@ -139,50 +517,27 @@ class Gemma3_12B:
         echo: bool = False,
         response_format: dict | None = None,
         structured_outputs: dict | None = None,
+        include_choice_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        best_of: int | None = None,
+        model_key: str | None = None,
         **kwargs,
     ) -> dict[str, Any]:
         """Generate a text completion with optional structured output."""
-        return _generate_text_completion(
-            self.llm, self.model_name, prompt, max_tokens, temperature, top_p, echo,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
-        )
-    
-    @modal.method()
-    def health(self) -> dict:
-        """Health check."""
-        return {"status": "ok", "model": self.model_name}
-
+        async with self._serving(model_key) as hosted:
+            return await _generate_text_completion(
+                hosted.engine, hosted.model_name, prompt, max_tokens, temperature, top_p, echo,
+                response_format=response_format,
+                structured_outputs=structured_outputs,
+                include_choice_usage=include_choice_usage,
+                strip_thinking=strip_thinking,
+                n=n,
+                best_of=best_of,
+            )
 
-@app.cls(**COMMON_CONFIG)
-class Gemma3_27B:
-    """vLLM inference class for gemma-3-27b."""
-    
-    model_key: str = "gemma-3-27b"
-    model_name: str = BASE_MODELS["gemma-3-27b"]["name"]
-    huggingface_id: str = BASE_MODELS["gemma-3-27b"]["huggingface_id"]
-    
-    @modal.enter()
-    def load_model(self):
-        """Load the vLLM engine when container starts."""
-        from vllm import LLM
-        
-        print(f"Loading model: {self.huggingface_id}")
-        start = time.time()
-        
-        self.llm = LLM(
-            model=self.huggingface_id,
-            enforce_eager=True,
-            max_model_len=MAX_MODEL_LEN,
-            tensor_parallel_size=TENSOR_PARALLEL_SIZE,
-            trust_remote_code=True,
-        )
-        
-        elapsed = time.time() - start
-        print(f"Model loaded in {elapsed:.1f}s: {self.model_name}")
-    
-    @modal.method()
-    def chat(
+    @modal.method(is_generator=True)
+    async def chat_stream(
         self,
         messages: list[dict],
         max_tokens: int = 1024,
@@ -190,17 +545,27 @@ class Gemma3_27B:
         top_p: float = 1.0,
         response_format: dict | None = None,
         structured_outputs: dict | None = None,
+        include_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        model_key: str | None = None,
         **kwargs,
-    ) -> dict[str, Any]:
-        """Generate a chat completion with optional structured output."""
-        return _generate_chat_completion(
-            self.llm, self.model_name, messages, max_tokens, temperature, top_p,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
-        )
-    
-    @modal.method()
-    def complete(
+    ):
+        """Stream a chat completion as OpenAI ``chat.completion.chunk`` dicts."""
+        async with self._serving(model_key) as hosted:
+            async for chunk in _stream_chat_completion(
+                hosted.engine, hosted.model_name, messages, max_tokens, temperature, top_p,
+                prompt_cache=hosted.prompt_cache,
+                response_format=response_format,
+                structured_outputs=structured_outputs,
+                include_usage=include_usage,
+                strip_thinking=strip_thinking,
+                n=n,
+            ):
+                yield chunk
+
+    @modal.method(is_generator=True)
+    async def complete_stream(
         self,
         prompt: str | list[str],
         max_tokens: int = 1024,
@@ -209,97 +574,266 @@ class Gemma3_27B:
         echo: bool = False,
         response_format: dict | None = None,
         structured_outputs: dict | None = None,
+        include_usage: bool = False,
+        strip_thinking: bool = False,
+        n: int = 1,
+        model_key: str | None = None,
         **kwargs,
-    ) -> dict[str, Any]:
-        """Generate a text completion with optional structured output."""
-        return _generate_text_completion(
-            self.llm, self.model_name, prompt, max_tokens, temperature, top_p, echo,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
-        )
-    
+    ):
+        """Stream a text completion as OpenAI ``text_completion`` chunk dicts."""
+        async with self._serving(model_key) as hosted:
+            async for chunk in _stream_text_completion(
+                hosted.engine, hosted.model_name, prompt, max_tokens, temperature, top_p, echo,
+                response_format=response_format,
+                structured_outputs=structured_outputs,
+                include_usage=include_usage,
+                strip_thinking=strip_thinking,
+                n=n,
+            ):
+                yield chunk
+
     @modal.method()
-    def health(self) -> dict:
-        """Health check."""
-        return {"status": "ok", "model": self.model_name}
+    async def run_batch(self, requests: list[dict], model_key: str | None = None) -> list[dict]:
+        """Run one shard of a batch job; returns ``{"index", "response" | "error"}`` per request.
 
+        Every request is submitted to the engine at once, in the order given
+        (batch.plan_shards sorts by prompt length), so the scheduler sees the
+        shard like one offline generate call and keeps its batch full. A
+        failing request gets an error result instead of failing the shard.
+        """
+        async def run_one(hosted: _HostedModel, request: dict) -> dict:
+            try:
+                if request["endpoint"] == "chat":
+                    response = await _generate_chat_completion(
+                        hosted.engine, hosted.model_name, prompt_cache=hosted.prompt_cache, **request["params"]
+                    )
+                else:
+                    response = await _generate_text_completion(hosted.engine, hosted.model_name, **request["params"])
+            except Exception as e:
+                return {"index": request["index"], "error": f"{type(e).__name__}: {e}"}
+            return {"index": request["index"], "response": response}
 
-@app.cls(**COMMON_CONFIG)
-class Qwen3_VL_30B:
-    """vLLM inference class for qwen3-vl-30b."""
-    
-    model_key: str = "qwen3-vl-30b"
-    model_name: str = BASE_MODELS["qwen3-vl-30b"]["name"]
-    huggingface_id: str = BASE_MODELS["qwen3-vl-30b"]["huggingface_id"]
-    
-    @modal.enter()
-    def load_model(self):
-        """Load the vLLM engine when container starts."""
-        from vllm import LLM
-        
-        print(f"Loading model: {self.huggingface_id}")
         start = time.time()
-        
-        self.llm = LLM(
-            model=self.huggingface_id,
-            enforce_eager=True,
-            max_model_len=MAX_MODEL_LEN,
-            tensor_parallel_size=TENSOR_PARALLEL_SIZE,
-            trust_remote_code=True,
-        )
-        
-        elapsed = time.time() - start
-        print(f"Model loaded in {elapsed:.1f}s: {self.model_name}")
-    
+        async with self._serving(model_key) as hosted:
+            results = await asyncio.gather(*(run_one(hosted, request) for request in requests))
+        print(f"Batch shard: {len(requests)} requests in {time.time() - start:.1f}s")
+        return list(results)
+
     @modal.method()
-    def chat(
-        self,
-        messages: list[dict],
-        max_tokens: int = 1024,
-        temperature: float = 0.7,
-        top_p: float = 1.0,
-        response_format: dict | None = None,
-        structured_outputs: dict | None = None,
-        **kwargs,
-    ) -> dict[str, Any]:
-        """Generate a chat completion with optional structured output."""
-        return _generate_chat_completion(
-            self.llm, self.model_name, messages, max_tokens, temperature, top_p,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
+    def health(self, model_key: str | None = None) -> dict:
+        """Health check, including chat prompt and prefix cache counters."""
+        return self._health(model_key)
+
+    def _health(self, model_key: str | None) -> dict:
+        hosted = self.hosted.get(model_key) or next(iter(self.hosted.values()))
+        return {
+            "status": "ok",
+            "model": hosted.model_name,
+            "quantization": hosted.config.quantization,
+            "container": self.container_id,
+            "replicas": hosted.engine.balancer.stats() if isinstance(hosted.engine, _DataParallelEngine) else None,
+            "prompt_cache": hosted.prompt_cache.stats(),
+            "prefix_cache": PREFIX_CACHE_STATS.stats(hosted.model_name),
+            "structured_outputs_cache": STRUCTURED_OUTPUTS_CACHE.stats(),
+        }
+
+
+class _VLLMModel(_ModelMethods):
+    """Shared async vLLM inference logic for the per-model classes below.
+
+    Each subclass runs one ``AsyncLLMEngine`` per container, with one engine
+    core per data-parallel replica. Modal delivers up to
+    ``max_concurrent_inputs`` calls per replica at once (see
+    ``@modal.concurrent``) and the engine batches all in-flight requests
+    continuously.
+    """
+
+    model_key: str
+    model_name: str
+    huggingface_id: str
+    config: ModelConfig
+
+    @modal.enter(snap=True)
+    async def boot_for_snapshot(self):
+        """In snapshot boot mode, bring the engine up before the memory snapshot.
+
+        Modal snapshots the container, GPU memory included, after this hook.
+        The engine is put to sleep first so the snapshot holds no KV cache or
+        in-flight work; ``start_engine`` wakes it up in restored containers.
+        """
+        if self.config.boot_mode != "snapshot":
+            return
+        await self._boot("snapshot")
+        await self.hosted[self.model_key].engine.sleep(level=1)
+
+    @modal.enter(snap=False)
+    async def start_engine(self):
+        """Load the vLLM engine when the container starts, or wake a restored one."""
+        self.container_id = _container_id()
+        if getattr(self, "hosted", None):
+            start = time.time()
+            await self.hosted[self.model_key].engine.wake_up()
+            self.started, self.boot_mode, self.boot_s = start, "snapshot-restore", time.time() - start
+            print(f"Cold start (snapshot restore): {self.boot_s:.1f}s to wake {self.model_name}")
+        else:
+            await self._boot(self.config.boot_mode)
+            self.started, self.boot_mode = CONTAINER_START, self.config.boot_mode
+            self.boot_s = time.time() - CONTAINER_START
+        self.heartbeat_task = asyncio.create_task(self._publish_engine_metrics())
+
+    async def _boot(self, boot_mode: str):
+        """Load the engine and compile known grammars, logging the cold-start time."""
+        start = time.time()
+        hosted, compile_cache_hit = _load_engine(
+            self.model_key, self.config, boot_mode, sleep_mode=boot_mode == "snapshot"
         )
-    
-    @modal.method()
-    def complete(
-        self,
-        prompt: str | list[str],
-        max_tokens: int = 1024,
-        temperature: float = 0.7,
-        top_p: float = 1.0,
-        echo: bool = False,
-        response_format: dict | None = None,
-        structured_outputs: dict | None = None,
-        **kwargs,
-    ) -> dict[str, Any]:
-        """Generate a text completion with optional structured output."""
-        return _generate_text_completion(
-            self.llm, self.model_name, prompt, max_tokens, temperature, top_p, echo,
-            response_format=response_format,
-            structured_outputs=structured_outputs,
+        self.hosted = {self.model_key: hosted}
+        await _warm_structured_outputs(hosted.engine)
+
+        if boot_mode != "eager":
+            _commit_compile_cache()
+
+        print(
+            f"Cold start ({boot_mode}, compile cache {'hit' if compile_cache_hit else 'miss'}): "
+            f"{time.time() - start:.1f}s engine init, "
+            f"{time.time() - CONTAINER_START:.1f}s since container start"
         )
-    
-    @modal.method()
-    def health(self) -> dict:
-        """Health check."""
-        return {"status": "ok", "model": self.model_name}
 
+    @asynccontextmanager
+    async def _serving(self, model_key: str | None):
+        yield self.hosted[self.model_key]
+
+
+class _MultiVLLMModel(_ModelMethods):
+    """Every MULTI_MODEL_KEYS model in one container, one engine awake at a time.
 
-# Model class registry
+    All engines are loaded at container start with sleep mode enabled, and
+    all but the last are put to sleep (level 1: weights offloaded to host
+    memory, KV cache freed), so each engine has the GPUs to itself while
+    awake. A HotSwapper (hotswap.py) admits calls for the awake model and,
+    once it drains, sleeps it and wakes the model the next call is for:
+    seconds of host-to-GPU copying instead of a cold start.
+    """
+
+    @modal.enter()
+    async def start_engines(self):
+        """Load, warm up and put to sleep every hosted model's engine in turn."""
+        self.container_id = _container_id()
+        self.hosted = {}
+        for model_key in MULTI_MODEL_KEYS:
+            start = time.time()
+            config = get_multi_model_config(model_key, GPU_KEY)
+            hosted, compile_cache_hit = _load_engine(model_key, config, config.boot_mode, sleep_mode=True)
+            self.hosted[model_key] = hosted
+            await _warm_structured_outputs(hosted.engine)
+            if config.boot_mode != "eager":
+                _commit_compile_cache()
+            if model_key != MULTI_MODEL_KEYS[-1]:
+                await hosted.engine.sleep(level=1)
+            print(
+                f"Loaded {model_key} ({config.boot_mode}, compile cache "
+                f"{'hit' if compile_cache_hit else 'miss'}) in {time.time() - start:.1f}s"
+            )
+
+        self.swapper = HotSwapper(self._switch, MULTI_MODEL_MIN_TURN_S, active=MULTI_MODEL_KEYS[-1])
+        self.started, self.boot_mode = CONTAINER_START, "multi"
+        self.boot_s = time.time() - CONTAINER_START
+        print(f"Cold start (multi-model): {len(self.hosted)} engines in {self.boot_s:.1f}s since container start")
+        self.heartbeat_task = asyncio.create_task(self._publish_engine_metrics())
+
+    async def _switch(self, previous: str | None, model_key: str):
+        """Sleep the awake engine and wake ``model_key``'s (called by the swapper with no calls in flight)."""
+        start = time.time()
+        if previous is not None:
+            await self.hosted[previous].engine.sleep(level=1)
+        woke_at = time.time()
+        await self.hosted[model_key].engine.wake_up()
+        print(
+            f"Swapped {previous or 'no model'} for {model_key}: "
+            f"{woke_at - start:.1f}s sleep, {time.time() - woke_at:.1f}s wake"
+        )
+
+    @asynccontextmanager
+    async def _serving(self, model_key: str | None):
+        if model_key not in self.hosted:
+            raise ValueError(f"{model_key!r} is not hosted here. Hosted: {', '.join(self.hosted)}")
+        async with self.swapper.use(model_key):
+            yield self.hosted[model_key]
+
+    def _health(self, model_key: str | None) -> dict:
+        return {**super()._health(model_key), "hot_swap": self.swapper.stats()}
+
+
+def _make_model_class(model_key: str):
+    """Define and register the Modal class serving one base model.
+
+    Every model gets the same _VLLMModel logic; only its engine profile, GPU
+    count and input concurrency differ. The class is bound to its
+    BASE_MODELS class_name at module level, where Modal looks it up.
+    """
+    config = _model_config(model_key)
+    class_name = BASE_MODELS[model_key]["class_name"]
+    cls = type(class_name, (_VLLMModel,), {
+        "__module__": __name__,
+        "__qualname__": class_name,
+        "__doc__": f"vLLM inference class for {model_key}.",
+        "model_key": model_key,
+        "model_name": config.name,
+        "huggingface_id": config.huggingface_id,
+        "config": config,
+    })
+    cls = modal.concurrent(max_inputs=config.container_max_inputs)(cls)
+    cls = app.cls(**_class_config(model_key))(cls)
+    globals()[class_name] = cls
+    return cls
+
+
+def _make_multi_model_class():
+    """Define and register MultiModel, hosting every MULTI_MODEL_KEYS model.
+
+    It takes as many inputs at once as its models would separately, and
+    asks for enough host memory to hold all of their weights asleep.
+    """
+    configs = [get_multi_model_config(model_key, GPU_KEY) for model_key in MULTI_MODEL_KEYS]
+    cls = type("MultiModel", (_MultiVLLMModel,), {
+        "__module__": __name__,
+        "__qualname__": "MultiModel",
+        "__doc__": f"vLLM inference class for {', '.join(MULTI_MODEL_KEYS)}, hot-swapped.",
+    })
+    cls = modal.concurrent(max_inputs=sum(config.max_concurrent_inputs for config in configs))(cls)
+    cls = app.cls(
+        **COMMON_CONFIG,
+        **get_multi_model_autoscaling(MULTI_MODEL_KEYS),
+        gpu=f"{get_gpu_type(GPU_KEY)}:{MULTI_MODEL_N_GPU}",
+        memory=get_multi_model_memory_mb(MULTI_MODEL_KEYS),
+    )(cls)
+    globals()["MultiModel"] = cls
+    return cls
+
+
+# Model class registry: one class per BASE_MODELS entry not hosted by MultiModel
 MODEL_CLASSES = {
-    "gemma-3-12b": Gemma3_12B,
-    "gemma-3-27b": Gemma3_27B,
-    "qwen3-vl-30b": Qwen3_VL_30B,
+    model_key: _make_model_class(model_key) for model_key in BASE_MODELS if model_key not in MULTI_MODEL_KEYS
 }
+MULTI_MODEL_CLASS = _make_multi_model_class() if MULTI_MODEL_KEYS else None
+
+
+def _model_handle(model_key: str, max_inputs: int | None = None):
+    """RemoteHandle for a base model: its own class, or MultiModel if it is hosted there.
+
+    ``max_inputs`` asks for a separate container pool taking that many
+    inputs per container (``with_concurrency``, Modal >= 1.0; ignored on
+    older clients).
+    """
+    from router import RemoteHandle
+
+    if model_key in MULTI_MODEL_KEYS:
+        cls, bound = MULTI_MODEL_CLASS, {"model_key": model_key}
+    else:
+        cls, bound = MODEL_CLASSES[model_key], {}
+    if max_inputs is not None and hasattr(cls, "with_concurrency"):
+        cls = cls.with_concurrency(max_inputs=max_inputs)
+    return RemoteHandle(cls(), **bound)
 
 
 def _build_structured_outputs_params(
@@ -317,205 +851,395 @@ def _build_structured_outputs_params(
     
     Via structured_outputs (extra_body):
     - {"json": <schema>} - JSON schema as string or dict
+    - {"json_object": true} - Force valid JSON output
     - {"regex": "<pattern>"} - Regex pattern
     - {"choice": ["a", "b"]} - Force one of choices
     - {"grammar": "<ebnf>"} - EBNF grammar
+    
+    Params are cached per canonical spec in STRUCTURED_OUTPUTS_CACHE; each
+    call gets its own shallow copy because the engine annotates the object.
     """
-    import json as json_module
+    import copy
     from vllm.sampling_params import StructuredOutputsParams
     
-    # Handle response_format (OpenAI-compatible)
-    if response_format:
-        format_type = response_format.get("type")
-        
-        if format_type == "json_object":
-            # Force valid JSON output
-            return StructuredOutputsParams(json_object=True)
-        
-        elif format_type == "json_schema":
-            # Force specific JSON schema
-            json_schema = response_format.get("json_schema", {})
-            schema = json_schema.get("schema")
-            if schema:
-                if isinstance(schema, dict):
-                    schema = json_module.dumps(schema)
-                return StructuredOutputsParams(json=schema)
-    
-    # Handle structured_outputs (vLLM extra_body)
-    if structured_outputs:
-        # JSON schema
-        if "json" in structured_outputs:
-            schema = structured_outputs["json"]
-            if isinstance(schema, dict):
-                schema = json_module.dumps(schema)
-            return StructuredOutputsParams(json=schema)
-        
-        # Regex pattern
-        if "regex" in structured_outputs:
-            return StructuredOutputsParams(regex=structured_outputs["regex"])
-        
-        # Choice - one of options
-        if "choice" in structured_outputs:
-            return StructuredOutputsParams(choice=structured_outputs["choice"])
-        
-        # EBNF Grammar
-        if "grammar" in structured_outputs:
-            return StructuredOutputsParams(grammar=structured_outputs["grammar"])
+    spec = structured_outputs_spec(response_format, structured_outputs)
+    if spec is None:
+        return None
     
-    return None
+    params = STRUCTURED_OUTPUTS_CACHE.get(spec)
+    if params is None:
+        kind, value = spec
+        if kind == "choice":
+            value = list(value)
+        params = StructuredOutputsParams(**{kind: value})
+        STRUCTURED_OUTPUTS_CACHE.put(spec, params)
+    return copy.copy(params)
 
 
-def _strip_thinking_tokens(text: str) -> str:
-    """Strip thinking tokens from model output.
-    
-    Some models (like Gemma, Qwen) may include <think>...</think> blocks
-    before the actual response. This function removes them.
+async def _chat_prompt(engine, messages: list[dict], prompt_cache: LRUCache | None = None):
+    """Render chat messages to prompt token ids with the model's chat template.
+
+    The template is applied with tokenize=True, so the engine receives token
+    ids and never re-tokenizes the rendered text. Results are cached by a hash
+    of the message contents: benchmark prompts embed whole documents and the
+    same conversation is sent again for retries and other categories.
     """
-    import re
-    
-    # Remove <think>...</think> blocks (including multiline)
-    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
-    
-    # Remove other common thinking patterns
-    text = re.sub(r"<thinking>.*?</thinking>", "", text, flags=re.DOTALL)
-    
-    return text.strip()
+    import hashlib
+    import json as json_module
+    from vllm.inputs import TokensPrompt
 
+    cache_key = None
+    if prompt_cache is not None:
+        cache_key = hashlib.sha256(
+            json_module.dumps(messages, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()
+        token_ids = prompt_cache.get(cache_key)
+        if token_ids is not None:
+            return TokensPrompt(prompt_token_ids=list(token_ids))
 
-def _extract_json_from_text(text: str) -> str:
-    """Extract JSON from text that may contain non-JSON content.
-    
-    Handles cases where the model outputs thinking tokens or other
-    content before/after the JSON.
+    tokenizer = await engine.get_tokenizer()
+    # Long documents take a while to tokenize; keep the event loop free meanwhile
+    token_ids = await asyncio.to_thread(
+        tokenizer.apply_chat_template,
+        messages,
+        tokenize=True,
+        add_generation_prompt=True,
+    )
+
+    if prompt_cache is not None:
+        prompt_cache.put(cache_key, tuple(token_ids))
+    return TokensPrompt(prompt_token_ids=list(token_ids))
+
+
+def _usage(
+    prompt_tokens: int,
+    completion_tokens: int,
+    reasoning_tokens: int | None = None,
+    cached_tokens: int | None = None,
+    prediction_tokens: tuple[int, int] | None = None,
+) -> dict[str, Any]:
+    """Build an OpenAI usage block.
+
+    ``reasoning_tokens`` (tokens generated inside stripped thinking spans) is
+    reported under ``completion_tokens_details`` when given; those tokens are
+    still included in ``completion_tokens``. ``cached_tokens`` (prompt tokens
+    whose KV blocks came from the prefix cache, so skipped prefill) goes under
+    ``prompt_tokens_details``. ``prediction_tokens`` is the (accepted,
+    rejected) speculative draft token estimate from _prediction_tokens.
     """
-    import json as json_module
-    
-    # First try to parse as-is (fastest path)
-    text = text.strip()
-    try:
-        json_module.loads(text)
-        return text
-    except json_module.JSONDecodeError:
-        pass
-    
-    # Strip thinking tokens
-    text = _strip_thinking_tokens(text)
-    try:
-        json_module.loads(text)
-        return text
-    except json_module.JSONDecodeError:
-        pass
-    
-    # Try to find JSON object in text
-    # Look for outermost { } pair
-    start_idx = text.find("{")
-    if start_idx != -1:
-        depth = 0
-        in_string = False
-        escape_next = False
-        
-        for i, char in enumerate(text[start_idx:], start_idx):
-            if escape_next:
-                escape_next = False
-                continue
-            
-            if char == "\\":
-                escape_next = True
-                continue
-            
-            if char == '"' and not escape_next:
-                in_string = not in_string
-                continue
-            
-            if in_string:
-                continue
-            
-            if char == "{":
-                depth += 1
-            elif char == "}":
-                depth -= 1
-                if depth == 0:
-                    candidate = text[start_idx : i + 1]
-                    try:
-                        json_module.loads(candidate)
-                        return candidate
-                    except json_module.JSONDecodeError:
-                        pass
-                    break
-    
-    # Return original stripped text as fallback
-    return text
-
-
-def _generate_chat_completion(
-    llm,
+    usage: dict[str, Any] = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    if cached_tokens is not None:
+        usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+    details = {}
+    if reasoning_tokens is not None:
+        details["reasoning_tokens"] = reasoning_tokens
+    if prediction_tokens is not None:
+        details["accepted_prediction_tokens"], details["rejected_prediction_tokens"] = prediction_tokens
+    if details:
+        usage["completion_tokens_details"] = details
+    return usage
+
+
+def _speculative_tokens(engine) -> int:
+    """Draft tokens the engine proposes per decode step (0 without speculative decoding)."""
+    speculative_config = getattr(getattr(engine, "vllm_config", None), "speculative_config", None)
+    return getattr(speculative_config, "num_speculative_tokens", None) or 0
+
+
+@dataclass
+class _DecodeSteps:
+    """Output deltas of a generation, counted for the draft token estimate.
+
+    The first delta of each candidate comes from the prefill step, which
+    yields one token and verifies no drafts, so it is left out of ``steps``
+    and ``tokens``. ``largest`` is the most tokens a later delta carried and
+    ``merged`` is set when a first delta carried more than one; both expose
+    deltas the engine merged because the caller had not read them yet.
+    """
+
+    steps: int = 0
+    tokens: int = 0
+    largest: int = 0
+    merged: bool = False
+    _started: set[int] = field(default_factory=set)
+
+    def record(self, choice: int, tokens: int):
+        """Count one delta of candidate ``choice`` carrying ``tokens`` tokens."""
+        if not tokens:
+            return
+        if choice not in self._started:
+            self._started.add(choice)
+            self.merged = self.merged or tokens > 1
+            return
+        self.steps += 1
+        self.tokens += tokens
+        self.largest = max(self.largest, tokens)
+
+    def add(self, other: "_DecodeSteps"):
+        """Fold another generation's counts into this one."""
+        self.steps += other.steps
+        self.tokens += other.tokens
+        self.largest = max(self.largest, other.largest)
+        self.merged = self.merged or other.merged
+
+
+def _prediction_tokens(decode: _DecodeSteps, speculative_tokens: int) -> tuple[int, int] | None:
+    """Estimated (accepted, rejected) draft tokens of a speculatively decoded request.
+
+    vLLM reports speculative acceptance only as engine-wide counters, so the
+    per-request figure comes from the output deltas: each decode step yields
+    one token from the target model plus the draft tokens it accepted, so
+    tokens beyond one per step were accepted drafts, out of
+    ``speculative_tokens`` proposed per step. Prompt lookup proposes nothing
+    when the last tokens do not occur in the prompt, so this is an estimate;
+    the container-wide counters are exact. Returns None when a delta carried
+    more tokens than one step can yield: the engine merged steps a busy
+    caller had not read yet, and counting them as one would inflate the
+    accepted figure.
+    """
+    if not speculative_tokens or not decode.steps:
+        return None
+    if decode.merged or decode.largest > speculative_tokens + 1:
+        return None
+    accepted = decode.tokens - decode.steps
+    return accepted, decode.steps * speculative_tokens - accepted
+
+
+def _cached_tokens(output) -> int:
+    """Prompt tokens of a request output that were served from the prefix cache."""
+    return getattr(output, "num_cached_tokens", None) or 0
+
+
+async def _run_generation(engine, prompt, sampling_params, **kwargs):
+    """Submit one prompt to the async engine and return its final output.
+
+    The engine schedules this request alongside every other in-flight request
+    on the container, so concurrent callers share GPU batches. ``kwargs`` go
+    to ``engine.generate`` (e.g. ``data_parallel_rank``).
+    """
+    final_output = None
+    async for output in engine.generate(prompt, sampling_params, uuid.uuid4().hex, **kwargs):
+        final_output = output
+    return final_output
+
+
+@dataclass
+class _Sample:
+    """One generated candidate for a prompt (one of its ``n`` or ``best_of``)."""
+
+    text: str
+    completion_tokens: int
+    finish_reason: str = "stop"
+    cumulative_logprob: float | None = None
+    reasoning_tokens: int | None = None  # set when thinking spans were stripped
+    decode: _DecodeSteps = field(default_factory=_DecodeSteps)  # counted from deltas
+
+
+def _sampling_params(
+    max_tokens: int,
+    temperature: float,
+    top_p: float,
+    so_params,
+    n: int = 1,
+    best_of: int | None = None,
+    deltas: bool = False,
+):
+    """SamplingParams for ``n`` choices picked from ``best_of`` candidates per prompt.
+
+    All candidates of a prompt are one engine request, so the prompt is
+    prefilled once and the candidates share its KV blocks. The V1 engine has
+    no best_of of its own: with ``best_of > n`` every candidate reports its
+    cumulative logprob and _best_samples keeps the top ``n``. ``deltas``
+    selects ``RequestOutputKind.DELTA`` (streaming, thinking filters,
+    speculative step counts) over ``FINAL_ONLY``.
+    """
+    from vllm import SamplingParams
+    from vllm.sampling_params import RequestOutputKind
+
+    candidates = max(n, best_of or n)
+    return SamplingParams(
+        n=candidates,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        structured_outputs=so_params,
+        logprobs=0 if candidates > n else None,  # sampled-token logprobs only, for the ranking
+        output_kind=RequestOutputKind.DELTA if deltas else RequestOutputKind.FINAL_ONLY,
+    )
+
+
+def _best_samples(samples: list[_Sample], n: int) -> list[_Sample]:
+    """The ``n`` samples to return: all of them, or the most likely ``n`` of a best_of run."""
+    if len(samples) <= n:
+        return samples
+    return sorted(
+        samples,
+        key=lambda sample: sample.cumulative_logprob if sample.cumulative_logprob is not None else float("-inf"),
+        reverse=True,
+    )[:n]
+
+
+async def _run_counted_generation(engine, prompt, sampling_params):
+    """Generate one prompt; return ``(samples, prompt_tokens, cached_tokens)``.
+
+    ``samples`` holds one _Sample per candidate (``sampling_params.n``), in
+    candidate index order.
+    """
+    output = await _run_generation(engine, prompt, sampling_params)
+    prompt_tokens = len(output.prompt_token_ids) if output.prompt_token_ids else 0
+    cached_tokens = _cached_tokens(output)
+    samples = [
+        _Sample(
+            completion.text,
+            len(completion.token_ids) if completion.token_ids else 0,
+            completion.finish_reason or "stop",
+            completion.cumulative_logprob,
+        )
+        for completion in sorted(output.outputs, key=lambda completion: completion.index)
+    ]
+    return samples or [_Sample("", 0)], prompt_tokens, cached_tokens
+
+
+async def _run_incremental_generation(engine, prompt, sampling_params, strip_thinking: bool = False):
+    """Generate one prompt from its deltas, counting the decode steps of each candidate.
+
+    ``sampling_params`` must use ``RequestOutputKind.DELTA``. Used for
+    speculative decoding (decode steps give the acceptance estimate) and to
+    filter thinking spans out as the text arrives: with ``strip_thinking``
+    each candidate's deltas go through its own ThinkingFilter with their
+    token counts, so tokens spent inside thinking spans are counted without
+    re-tokenizing, and ``reasoning_tokens`` is set on each sample. Returns
+    ``(samples, prompt_tokens, cached_tokens)`` like _run_counted_generation.
+    """
+    candidates = sampling_params.n
+    filters = [ThinkingFilter() for _ in range(candidates)] if strip_thinking else None
+    pieces: list[list[str]] = [[] for _ in range(candidates)]
+    samples = [_Sample("", 0) for _ in range(candidates)]
+    prompt_tokens = 0
+    cached_tokens = 0
+    async for output in _stream_generation(engine, prompt, sampling_params):
+        if output.prompt_token_ids:
+            prompt_tokens = len(output.prompt_token_ids)
+        cached_tokens = max(cached_tokens, _cached_tokens(output))
+        for completion in output.outputs:
+            sample = samples[completion.index]
+            sample.completion_tokens += len(completion.token_ids)
+            sample.decode.record(completion.index, len(completion.token_ids))
+            text = completion.text
+            if filters is not None:
+                text = filters[completion.index].feed(text, len(completion.token_ids))
+            pieces[completion.index].append(text)
+            if completion.finish_reason:
+                sample.finish_reason = completion.finish_reason
+            if completion.cumulative_logprob is not None:
+                sample.cumulative_logprob = completion.cumulative_logprob
+    for index, (sample, texts) in enumerate(zip(samples, pieces)):
+        if filters is not None:
+            texts.append(filters[index].flush())
+            sample.reasoning_tokens = filters[index].thinking_tokens
+        sample.text = "".join(texts)
+    return samples, prompt_tokens, cached_tokens
+
+
+async def _run_samples(engine, prompt, sampling_params, strip_thinking: bool, speculative_tokens: int):
+    """Generate one prompt, from final outputs only unless deltas are needed.
+
+    Deltas are needed to filter thinking spans and, when the engine decodes
+    speculatively, to count decode steps for the acceptance estimate.
+    ``sampling_params`` must have been built with ``deltas`` to match.
+    """
+    if strip_thinking or speculative_tokens:
+        return await _run_incremental_generation(engine, prompt, sampling_params, strip_thinking)
+    return await _run_counted_generation(engine, prompt, sampling_params)
+
+
+def _samples_prediction_tokens(samples: list[_Sample], speculative_tokens: int) -> tuple[int, int] | None:
+    """_prediction_tokens over several samples."""
+    decode = _DecodeSteps()
+    for sample in samples:
+        decode.add(sample.decode)
+    return _prediction_tokens(decode, speculative_tokens)
+
+
+async def _generate_chat_completion(
+    engine,
     model_name: str,
     messages: list[dict],
     max_tokens: int,
     temperature: float,
     top_p: float,
+    prompt_cache: LRUCache | None = None,
     response_format: dict | None = None,
     structured_outputs: dict | None = None,
+    strip_thinking: bool = False,
+    n: int = 1,
+    best_of: int | None = None,
 ) -> dict[str, Any]:
     """Generate a chat completion with optional structured output.
     
     Supports vLLM v0.12.0 structured outputs API.
-    """
-    from vllm import SamplingParams
     
-    # Build prompt from messages using chat template
-    tokenizer = llm.get_tokenizer()
-    prompt = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-    )
+    With strip_thinking, <think>/<thinking> spans are removed from the
+    content and the tokens spent in them are reported as reasoning_tokens.
+    
+    Returns ``n`` choices, the most likely of ``best_of`` candidates when
+    given; usage counts the tokens of every candidate. With speculative
+    decoding, usage also estimates the accepted and rejected draft tokens.
+    """
+    # Build prompt token ids from messages using chat template
+    prompt = await _chat_prompt(engine, messages, prompt_cache)
     
     # Build structured outputs params
     so_params = _build_structured_outputs_params(response_format, structured_outputs)
     
-    sampling_params = SamplingParams(
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        structured_outputs=so_params,
+    speculative_tokens = _speculative_tokens(engine)
+    sampling_params = _sampling_params(
+        max_tokens, temperature, top_p, so_params, n, best_of,
+        deltas=strip_thinking or speculative_tokens > 0,
     )
     
     # Generate
-    outputs = llm.generate([prompt], sampling_params)
-    output = outputs[0]
-    
-    text = output.outputs[0].text if output.outputs else ""
-    prompt_tokens = len(output.prompt_token_ids) if output.prompt_token_ids else 0
-    completion_tokens = len(output.outputs[0].token_ids) if output.outputs and output.outputs[0].token_ids else 0
+    samples, prompt_tokens, cached_tokens = await _run_samples(
+        engine, prompt, sampling_params, strip_thinking, speculative_tokens
+    )
+    PREFIX_CACHE_STATS.record(model_name, prompt_tokens, cached_tokens)
+    completion_tokens = sum(sample.completion_tokens for sample in samples)
+    reasoning_tokens = sum(sample.reasoning_tokens for sample in samples) if strip_thinking else None
     
-    # If structured output was requested, clean up the response
-    if so_params is not None:
-        text = _extract_json_from_text(text)
+    choices = []
+    for index, sample in enumerate(_best_samples(samples, n)):
+        text = sample.text
+        # If structured output was requested, clean up the response
+        if so_params is not None:
+            text = extract_json(text)[0]
+        choices.append({
+            "index": index,
+            "message": {
+                "role": "assistant",
+                "content": text,
+            },
+            "finish_reason": sample.finish_reason,
+        })
     
     return {
         "id": f"chatcmpl-{time.time_ns()}",
         "object": "chat.completion",
         "created": int(time.time()),
         "model": model_name,
-        "choices": [{
-            "index": 0,
-            "message": {
-                "role": "assistant",
-                "content": text,
-            },
-            "finish_reason": "stop",
-        }],
-        "usage": {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-            "total_tokens": prompt_tokens + completion_tokens,
-        },
+        "choices": choices,
+        "usage": _usage(
+            prompt_tokens, completion_tokens, reasoning_tokens, cached_tokens,
+            _samples_prediction_tokens(samples, speculative_tokens),
+        ),
     }
 
 
-def _generate_text_completion(
-    llm,
+async def _generate_text_completion(
+    engine,
     model_name: str,
     prompt: str | list[str],
     max_tokens: int,
@@ -524,56 +1248,85 @@ def _generate_text_completion(
     echo: bool = False,
     response_format: dict | None = None,
     structured_outputs: dict | None = None,
+    include_choice_usage: bool = False,
+    strip_thinking: bool = False,
+    n: int = 1,
+    best_of: int | None = None,
 ) -> dict[str, Any]:
     """Generate a text completion (OpenAI /v1/completions API).
     
     Supports vLLM v0.12.0 structured outputs API.
-    """
-    from vllm import SamplingParams
     
+    Each prompt gets ``n`` choices (the most likely of ``best_of``
+    candidates when given), at indices ``prompt_index * n + j``.
+    
+    With include_choice_usage each choice also carries its own usage block,
+    which the router needs to split a coalesced batch back into responses.
+    With strip_thinking, thinking spans are removed from each choice (not
+    from an echoed prompt) and counted as reasoning_tokens.
+    """
     # Handle single or multiple prompts
     prompts = [prompt] if isinstance(prompt, str) else prompt
     
     # Build structured outputs params
     so_params = _build_structured_outputs_params(response_format, structured_outputs)
     
-    sampling_params = SamplingParams(
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        structured_outputs=so_params,
+    speculative_tokens = _speculative_tokens(engine)
+    sampling_params = _sampling_params(
+        max_tokens, temperature, top_p, so_params, n, best_of,
+        deltas=strip_thinking or speculative_tokens > 0,
     )
     
-    # Generate
-    outputs = llm.generate(prompts, sampling_params)
+    # Generate (all prompts are submitted at once and batched by the engine)
+    results = await asyncio.gather(*(
+        _run_samples(engine, p, sampling_params.clone(), strip_thinking, speculative_tokens) for p in prompts
+    ))
     
     choices = []
     total_prompt_tokens = 0
     total_completion_tokens = 0
+    total_cached_tokens = 0
+    total_reasoning_tokens = 0 if strip_thinking else None
     
-    for i, output in enumerate(outputs):
-        text = output.outputs[0].text if output.outputs else ""
-        prompt_tokens = len(output.prompt_token_ids) if output.prompt_token_ids else 0
-        completion_tokens = len(output.outputs[0].token_ids) if output.outputs and output.outputs[0].token_ids else 0
-        
+    for i, (samples, prompt_tokens, cached_tokens) in enumerate(results):
+        PREFIX_CACHE_STATS.record(model_name, prompt_tokens, cached_tokens)
         total_prompt_tokens += prompt_tokens
-        total_completion_tokens += completion_tokens
+        total_cached_tokens += cached_tokens
+        total_completion_tokens += sum(sample.completion_tokens for sample in samples)
+        if strip_thinking:
+            total_reasoning_tokens += sum(sample.reasoning_tokens for sample in samples)
         
-        # If structured output was requested, clean up the response
-        if so_params is not None:
-            text = _extract_json_from_text(text)
+        returned = _best_samples(samples, n)
+        # Per-choice usage must add up to the prompt's usage: the first choice
+        # also carries the prompt tokens and any best_of candidates not returned
+        unreturned = [sample for sample in samples if not any(sample is r for r in returned)]
         
-        # If echo is True, prepend the prompt
-        if echo:
-            original_prompt = prompts[i] if i < len(prompts) else ""
-            text = original_prompt + text
-        
-        choices.append({
-            "index": i,
-            "text": text,
-            "finish_reason": "stop",
-            "logprobs": None,
-        })
+        for j, sample in enumerate(returned):
+            text = sample.text
+            # If structured output was requested, clean up the response
+            if so_params is not None:
+                text = extract_json(text)[0]
+            
+            # If echo is True, prepend the prompt
+            if echo:
+                text = prompts[i] + text
+            
+            choice = {
+                "index": i * n + j,
+                "text": text,
+                "finish_reason": sample.finish_reason,
+                "logprobs": None,
+            }
+            if include_choice_usage:
+                counted = [sample, *unreturned] if j == 0 else [sample]
+                choice["usage"] = _usage(
+                    prompt_tokens if j == 0 else 0,
+                    sum(s.completion_tokens for s in counted),
+                    sum(s.reasoning_tokens for s in counted) if strip_thinking else None,
+                    cached_tokens if j == 0 else 0,
+                    _samples_prediction_tokens(counted, speculative_tokens),
+                )
+            choices.append(choice)
     
     return {
         "id": f"cmpl-{time.time_ns()}",
@@ -581,14 +1334,275 @@ def _generate_text_completion(
         "created": int(time.time()),
         "model": model_name,
         "choices": choices,
-        "usage": {
-            "prompt_tokens": total_prompt_tokens,
-            "completion_tokens": total_completion_tokens,
-            "total_tokens": total_prompt_tokens + total_completion_tokens,
-        },
+        "usage": _usage(
+            total_prompt_tokens, total_completion_tokens, total_reasoning_tokens, total_cached_tokens,
+            _samples_prediction_tokens([sample for samples, _, _ in results for sample in samples], speculative_tokens),
+        ),
     }
 
 
+async def _stream_generation(engine, prompt, sampling_params):
+    """Yield incremental outputs for one prompt as the engine produces them.
+
+    ``sampling_params`` must use ``RequestOutputKind.DELTA`` so each output
+    carries only the newly generated text and token ids.
+    """
+    async for output in engine.generate(prompt, sampling_params, uuid.uuid4().hex):
+        yield output
+
+
+async def _stream_chat_completion(
+    engine,
+    model_name: str,
+    messages: list[dict],
+    max_tokens: int,
+    temperature: float,
+    top_p: float,
+    prompt_cache: LRUCache | None = None,
+    response_format: dict | None = None,
+    structured_outputs: dict | None = None,
+    include_usage: bool = False,
+    strip_thinking: bool = False,
+    n: int = 1,
+):
+    """Stream a chat completion as OpenAI ``chat.completion.chunk`` dicts.
+
+    Structured output is enforced by the engine while decoding; the JSON
+    clean-up applied to full responses is skipped because it needs the whole
+    text. Thinking spans can be filtered out, since that works on deltas:
+    text that might still turn out to be part of a tag is held back until the
+    next delta decides it.
+
+    With ``n`` > 1 the choices' chunks are interleaved in arrival order and
+    told apart by ``choices[0].index``; each has its own finish chunk.
+    """
+    prompt = await _chat_prompt(engine, messages, prompt_cache)
+    so_params = _build_structured_outputs_params(response_format, structured_outputs)
+    sampling_params = _sampling_params(max_tokens, temperature, top_p, so_params, n, deltas=True)
+
+    chunk_id = f"chatcmpl-{time.time_ns()}"
+    created = int(time.time())
+
+    def chunk(index: int, delta: dict, finish_reason: str | None = None) -> dict[str, Any]:
+        return {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model_name,
+            "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    for index in range(n):
+        yield chunk(index, {"role": "assistant", "content": ""})
+
+    filters = [ThinkingFilter() for _ in range(n)] if strip_thinking else None
+    prompt_tokens = 0
+    completion_tokens = 0
+    cached_tokens = 0
+    decode = _DecodeSteps()
+    finish_reasons = ["stop"] * n
+    async for output in _stream_generation(engine, prompt, sampling_params):
+        if output.prompt_token_ids:
+            prompt_tokens = len(output.prompt_token_ids)
+        cached_tokens = max(cached_tokens, _cached_tokens(output))
+        for completion in output.outputs:
+            index = completion.index
+            completion_tokens += len(completion.token_ids)
+            decode.record(index, len(completion.token_ids))
+            text = completion.text
+            if filters is not None:
+                text = filters[index].feed(text, len(completion.token_ids))
+            if text:
+                yield chunk(index, {"content": text})
+            if completion.finish_reason:
+                finish_reasons[index] = completion.finish_reason
+
+    for index in range(n):
+        if filters is not None:
+            text = filters[index].flush()
+            if text:
+                yield chunk(index, {"content": text})
+        yield chunk(index, {}, finish_reasons[index])
+
+    PREFIX_CACHE_STATS.record(model_name, prompt_tokens, cached_tokens)
+
+    if include_usage:
+        yield {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model_name,
+            "choices": [],
+            "usage": _usage(
+                prompt_tokens, completion_tokens,
+                sum(f.thinking_tokens for f in filters) if filters is not None else None,
+                cached_tokens,
+                _prediction_tokens(decode, _speculative_tokens(engine)),
+            ),
+        }
+
+
+async def _stream_text_completion(
+    engine,
+    model_name: str,
+    prompt: str | list[str],
+    max_tokens: int,
+    temperature: float,
+    top_p: float,
+    echo: bool = False,
+    response_format: dict | None = None,
+    structured_outputs: dict | None = None,
+    include_usage: bool = False,
+    strip_thinking: bool = False,
+    n: int = 1,
+):
+    """Stream a text completion as OpenAI ``text_completion`` chunk dicts.
+
+    Multiple prompts (and ``n`` choices per prompt, at index
+    ``prompt_index * n + j``) are generated concurrently; their chunks are
+    interleaved in arrival order and told apart by ``choices[0].index``. With
+    strip_thinking each choice goes through its own ThinkingFilter.
+    """
+    prompts = [prompt] if isinstance(prompt, str) else prompt
+    so_params = _build_structured_outputs_params(response_format, structured_outputs)
+    sampling_params = _sampling_params(max_tokens, temperature, top_p, so_params, n, deltas=True)
+
+    chunk_id = f"cmpl-{time.time_ns()}"
+    created = int(time.time())
+
+    def chunk(index: int, text: str, finish_reason: str | None = None) -> dict[str, Any]:
+        return {
+            "id": chunk_id,
+            "object": "text_completion",
+            "created": created,
+            "model": model_name,
+            "choices": [{
+                "index": index,
+                "text": text,
+                "finish_reason": finish_reason,
+                "logprobs": None,
+            }],
+        }
+
+    # Each prompt is pumped by its own task into a shared queue; None marks a finished prompt
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(index: int, prompt_text: str):
+        try:
+            async for output in _stream_generation(engine, prompt_text, sampling_params.clone()):
+                await queue.put((index, output))
+        finally:
+            await queue.put((index, None))
+
+    tasks = [asyncio.create_task(pump(i, p)) for i, p in enumerate(prompts)]
+    try:
+        if echo:
+            for i, p in enumerate(prompts):
+                for j in range(n):
+                    yield chunk(i * n + j, p)
+
+        filters = [ThinkingFilter() for _ in range(len(prompts) * n)] if strip_thinking else None
+        prompt_tokens = [0] * len(prompts)
+        cached_tokens = [0] * len(prompts)
+        completion_tokens = 0
+        decode = _DecodeSteps()
+        finish_reasons = ["stop"] * (len(prompts) * n)
+        remaining = len(prompts)
+        while remaining:
+            index, output = await queue.get()
+            if output is None:
+                remaining -= 1
+                PREFIX_CACHE_STATS.record(model_name, prompt_tokens[index], cached_tokens[index])
+                for choice_index in range(index * n, (index + 1) * n):
+                    if filters is not None:
+                        text = filters[choice_index].flush()
+                        if text:
+                            yield chunk(choice_index, text)
+                    yield chunk(choice_index, "", finish_reasons[choice_index])
+                continue
+            if output.prompt_token_ids:
+                prompt_tokens[index] = len(output.prompt_token_ids)
+            cached_tokens[index] = max(cached_tokens[index], _cached_tokens(output))
+            for completion in output.outputs:
+                choice_index = index * n + completion.index
+                completion_tokens += len(completion.token_ids)
+                decode.record(choice_index, len(completion.token_ids))
+                if completion.finish_reason:
+                    finish_reasons[choice_index] = completion.finish_reason
+                text = completion.text
+                if filters is not None:
+                    text = filters[choice_index].feed(text, len(completion.token_ids))
+                if text:
+                    yield chunk(choice_index, text)
+
+        # Surface generation errors instead of ending the stream silently
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if include_usage:
+        yield {
+            "id": chunk_id,
+            "object": "text_completion",
+            "created": created,
+            "model": model_name,
+            "choices": [],
+            "usage": _usage(
+                sum(prompt_tokens), completion_tokens,
+                sum(f.thinking_tokens for f in filters) if filters is not None else None,
+                sum(cached_tokens),
+                _prediction_tokens(decode, _speculative_tokens(engine)),
+            ),
+        }
+
+
+# =============================================================================
+# Batch jobs
+# =============================================================================
+
+
+def _batch_store():
+    """Batch jobs on batch_vol; launching one spawns run_batch_job."""
+    from batch import BatchStore
+
+    async def launch(job_id: str):
+        await run_batch_job.spawn.aio(job_id)
+
+    return BatchStore(BATCH_DIR, launch=launch, persist=batch_vol.commit.aio, refresh=batch_vol.reload.aio)
+
+
+def _batch_model(model_key: str):
+    """Model handle for batch shards.
+
+    With Modal >= 1.0 it is a separate container pool that takes
+    BATCH_SHARDS_PER_CONTAINER shards per container, so shards spread over
+    containers and offline jobs do not queue behind interactive traffic.
+    """
+    return _model_handle(model_key, max_inputs=BATCH_SHARDS_PER_CONTAINER)
+
+
+@app.function(
+    image=vllm_image,
+    volumes={BATCH_DIR: batch_vol},
+    timeout=24 * 60 * MINUTES,
+    retries=3,  # a rerun skips finished shards, so a crashed runner resumes
+)
+async def run_batch_job(job_id: str):
+    """Run a batch job's unfinished shards on the model classes (see batch.run_job)."""
+    from batch import run_job
+
+    models = {}
+
+    async def run_shard(model_key: str, requests: list[dict]) -> list[dict]:
+        if model_key not in models:
+            models[model_key] = _batch_model(model_key)
+        return await models[model_key].call("run_batch", requests=requests)
+
+    await run_job(_batch_store(), job_id, run_shard)
+
+
 # =============================================================================
 # FastAPI Router - Single web endpoint
 # =============================================================================
@@ -598,163 +1612,40 @@ def _generate_text_completion(
     image=vllm_image,
     scaledown_window=5 * MINUTES,
     secrets=[modal.Secret.from_name("vllm-api-key", required_keys=["API_KEY"])],
+    volumes={RESPONSE_CACHE_DIR: response_cache_vol, BATCH_DIR: batch_vol},
 )
+@modal.concurrent(max_inputs=ROUTER_MAX_INPUTS)
 @modal.asgi_app()
 def serve():
-    """FastAPI app that routes requests to the appropriate model."""
-    from fastapi import FastAPI, HTTPException, Request, Depends
-    from fastapi.responses import JSONResponse
-    from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-    
-    api = FastAPI(title=f"vLLM Multi-Model Server ({GPU_KEY.upper()})")
-    security = HTTPBearer()
-    
-    # Get API key from environment (set by Modal secret)
-    API_KEY = os.environ.get("API_KEY", "")
-    
-    async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        """Verify the Bearer token."""
-        if not API_KEY:
-            return  # No auth if key not configured
-        if credentials.credentials != API_KEY:
-            raise HTTPException(status_code=401, detail="Invalid API key")
-    
-    # Model name to class mapping
-    MODEL_LOOKUP = {}
-    for model_key, model_info in BASE_MODELS.items():
-        MODEL_LOOKUP[model_info["name"]] = model_key
-        MODEL_LOOKUP[model_key] = model_key
-        MODEL_LOOKUP[model_info["name"].split("/")[-1]] = model_key
-    
-    def get_model_instance(model_name: str):
-        """Get a Modal class instance for a model name."""
-        model_key = None
-        
-        # Try exact match
-        if model_name in MODEL_LOOKUP:
-            model_key = MODEL_LOOKUP[model_name]
-        else:
-            # Try partial match
-            model_lower = model_name.lower()
-            for key, mk in MODEL_LOOKUP.items():
-                if key.lower() in model_lower or model_lower in key.lower():
-                    model_key = mk
-                    break
-        
-        if model_key and model_key in MODEL_CLASSES:
-            return MODEL_CLASSES[model_key]()
-        return None
-    
-    @api.get("/health")
-    async def health():
-        """Health check (no auth required)."""
-        return {"status": "ok", "gpu": GPU_KEY, "models": list(BASE_MODELS.keys())}
-    
-    @api.get("/v1/models", dependencies=[Depends(verify_token)])
-    async def list_models():
-        """List available models (requires auth)."""
-        models = [
-            {
-                "id": info["name"],
-                "object": "model",
-                "created": 0,
-                "owned_by": "modal",
-            }
-            for info in BASE_MODELS.values()
-        ]
-        return {"object": "list", "data": models}
-    
-    @api.post("/v1/chat/completions", dependencies=[Depends(verify_token)])
-    async def chat_completions(request: Request):
-        """Chat completions with structured output support (requires auth).
-        
-        Supports structured output via:
-        - response_format: {"type": "json_object"} or {"type": "json_schema", ...}
-        - extra_body.structured_outputs: {"json": ...}, {"regex": ...}, {"choice": ...}, {"grammar": ...}
-        
-        See: https://docs.vllm.ai/en/v0.12.0/features/structured_outputs/
-        """
-        body = await request.json()
-        model_name = body.get("model")
-        
-        if not model_name:
-            raise HTTPException(status_code=400, detail="model field is required")
-        
-        model = get_model_instance(model_name)
-        if not model:
-            available = list(BASE_MODELS.keys())
-            raise HTTPException(
-                status_code=404,
-                detail=f"Model '{model_name}' not found. Available: {available}"
-            )
-        
-        messages = body.get("messages", [])
-        max_tokens = body.get("max_tokens", 1024)
-        temperature = body.get("temperature", 0.7)
-        top_p = body.get("top_p", 1.0)
-        response_format = body.get("response_format")
-        structured_outputs = body.get("structured_outputs")  # vLLM extra_body
-        
-        try:
-            result = model.chat.remote(
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                response_format=response_format,
-                structured_outputs=structured_outputs,
-            )
-            return JSONResponse(result)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    """FastAPI app that routes requests to the appropriate model (see router.py).
     
-    @api.post("/v1/completions", dependencies=[Depends(verify_token)])
-    async def text_completions(request: Request):
-        """Text completions endpoint (OpenAI /v1/completions API).
-        
-        Supports structured output via:
-        - response_format: {"type": "json_object"} or {"type": "json_schema", ...}
-        - structured_outputs: {"json": ...}, {"regex": ...}, {"choice": ...}, {"grammar": ...}
-        
-        See: https://docs.vllm.ai/en/v0.12.0/features/structured_outputs/
-        """
-        body = await request.json()
-        model_name = body.get("model")
-        
-        if not model_name:
-            raise HTTPException(status_code=400, detail="model field is required")
-        
-        model = get_model_instance(model_name)
-        if not model:
-            available = list(BASE_MODELS.keys())
-            raise HTTPException(
-                status_code=404,
-                detail=f"Model '{model_name}' not found. Available: {available}"
-            )
-        
-        prompt = body.get("prompt", "")
-        max_tokens = body.get("max_tokens", 1024)
-        temperature = body.get("temperature", 0.7)
-        top_p = body.get("top_p", 1.0)
-        echo = body.get("echo", False)
-        response_format = body.get("response_format")
-        structured_outputs = body.get("structured_outputs")  # vLLM extra_body
-        
-        try:
-            result = model.complete.remote(
-                prompt=prompt,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                echo=echo,
-                response_format=response_format,
-                structured_outputs=structured_outputs,
-            )
-            return JSONResponse(result)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    return api
+    Model class handles are resolved once per router container. Responses
+    cached by the router live in memory and on response_cache_vol. /metrics
+    reads the model containers' heartbeats from engine_metrics_dict. Batch
+    jobs are stored on batch_vol and run by run_batch_job.
+    """
+    from router import create_app
+    
+    async def engine_stats() -> list[dict]:
+        return [beat async for beat in engine_metrics_dict.values.aio()]
+    
+    return create_app(
+        {key: _model_handle(key) for key in BASE_MODELS},
+        gpu_key=GPU_KEY,
+        api_key=os.environ.get("API_KEY", ""),  # set by the vllm-api-key secret
+        response_cache=ResponseCache(
+            RESPONSE_CACHE_MAX_ENTRIES,
+            RESPONSE_CACHE_MAX_BYTES,
+            directory=RESPONSE_CACHE_DIR,
+            disk_max_bytes=RESPONSE_CACHE_DISK_MAX_BYTES,
+            ttl_s=RESPONSE_CACHE_TTL,
+            commit=response_cache_vol.commit,
+            reload=response_cache_vol.reload,
+        ),
+        engine_stats=engine_stats,
+        batches=_batch_store(),
+        multi_model_keys=MULTI_MODEL_KEYS,
+    )
 
 
 # =============================================================================
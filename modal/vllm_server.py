@@ -14,6 +14,7 @@ Usage:
 
 import json
 import os
+import shlex
 import subprocess
 import sys
 from typing import Any
@@ -25,7 +26,15 @@ import modal
 if "/root" not in sys.path:
     sys.path.insert(0, "/root")
 
-from config import GPU_OPTIONS, MODELS, ModelConfig, get_model_config
+from config import (
+    GPU_OPTIONS,
+    GPU_SHORT_NAMES,
+    MODELS,
+    VLLM_CACHE_DIR,
+    ModelConfig,
+    get_compile_cache_root,
+    get_model_config,
+)
 
 # Default model key (must include GPU suffix)
 DEFAULT_MODEL_KEY = "gemma-3-12b-l40s"
@@ -57,6 +66,7 @@ vllm_image = (
         "MODEL_KEY": MODEL_KEY,  # Bake model key into container
     })
     .add_local_file("config.py", "/root/config.py")  # Include config module
+    .add_local_file("tuning.json", "/root/tuning.json")  # Tuned engine settings (tune.py)
 )
 
 # Modal Volumes for caching
@@ -64,7 +74,6 @@ hf_cache_vol = modal.Volume.from_name("huggingface-cache", create_if_missing=Tru
 vllm_cache_vol = modal.Volume.from_name("vllm-cache", create_if_missing=True)
 
 # Configuration
-FAST_BOOT = True  # Use --enforce-eager for faster cold starts
 MINUTES = 60  # seconds
 VLLM_PORT = 8000
 
@@ -75,19 +84,42 @@ app = modal.App(f"vllm-{MODEL_KEY}")
 # Get config for decorator (evaluated at deploy time with MODEL_KEY from env)
 _deploy_config = _get_runtime_config()
 
+# "eager" boots fastest; "compiled" trades a one-off compile for graph-mode decode.
+# Memory snapshots need the in-process engine of vllm_gpu_server.py, so "snapshot"
+# boots as "compiled" here.
+FAST_BOOT = _deploy_config.boot_mode == "eager"  # Use --enforce-eager for faster cold starts
+
+
+def _engine_flags(engine_kwargs: dict) -> list[str]:
+    """Turn engine keyword arguments into `vllm serve` flags.
+
+    Dict values (e.g. speculative_config) become shell-quoted JSON, as the
+    command runs through a shell.
+    """
+    flags = []
+    for key, value in engine_kwargs.items():
+        flag = "--" + key.replace("_", "-")
+        if isinstance(value, bool):
+            flags.append(flag if value else f"--no-{flag[2:]}")
+        elif isinstance(value, dict):
+            flags += [flag, shlex.quote(json.dumps(value))]
+        else:
+            flags += [flag, str(value)]
+    return flags
+
 
 @app.function(
     image=vllm_image,
-    gpu=f"{_deploy_config.gpu}:{_deploy_config.n_gpu}",
+    gpu=f"{_deploy_config.gpu}:{_deploy_config.gpu_count}",
     scaledown_window=15 * MINUTES,  # Auto-shutdown after 15 minutes idle
     timeout=10 * MINUTES,  # Container start timeout
     volumes={
         "/root/.cache/huggingface": hf_cache_vol,
-        "/root/.cache/vllm": vllm_cache_vol,
+        VLLM_CACHE_DIR: vllm_cache_vol,
     },
     secrets=[modal.Secret.from_name("huggingface", required_keys=["HF_TOKEN"])],
 )
-@modal.concurrent(max_inputs=32)  # Handle multiple concurrent requests
+@modal.concurrent(max_inputs=_deploy_config.container_max_inputs)  # Handle multiple concurrent requests
 @modal.web_server(port=VLLM_PORT, startup_timeout=10 * MINUTES)
 def serve():
     """Start the vLLM server with OpenAI-compatible API."""
@@ -108,19 +140,18 @@ def serve():
         "info",
     ]
 
-    # Add revision if specified
-    if config.revision:
-        cmd += ["--revision", config.revision]
+    # Engine profile from config.py: tensor and data parallelism (vLLM balances
+    # requests across data-parallel replicas itself), context length, memory,
+    # batching limits, chunked prefill, prefix caching and eager vs graph mode
+    engine_kwargs = config.engine_kwargs()
+    del engine_kwargs["model"]  # positional above
+    engine_kwargs["enforce_eager"] = FAST_BOOT
+    cmd += _engine_flags(engine_kwargs)
 
-    # Add max model length if specified (helps with memory)
-    if config.max_model_len:
-        cmd += ["--max-model-len", str(config.max_model_len)]
-
-    # Fast boot vs optimized performance
-    cmd += ["--enforce-eager"] if FAST_BOOT else ["--no-enforce-eager"]
-
-    # Tensor parallelism for multi-GPU
-    cmd += ["--tensor-parallel-size", str(config.n_gpu)]
+    # Report prefix cache hits in usage.prompt_tokens_details; vLLM also logs the
+    # prefix cache hit rate with its periodic engine stats
+    if config.enable_prefix_caching:
+        cmd += ["--enable-prompt-tokens-details"]
 
     # Enable OpenAI-compatible tool calling and structured outputs
     cmd += ["--enable-auto-tool-choice"]
@@ -129,13 +160,32 @@ def serve():
     if config.tool_parser:
         cmd += ["--tool-call-parser", config.tool_parser]
 
+    # Engine stats stay on (no --disable-log-stats): vllm serve exports them at
+    # GET /metrics on this port, next to the OpenAI routes, including the
+    # speculative decoding draft and accepted token counters
     print(f"Starting vLLM server for {config.name}")
     print(f"MODEL_KEY from env: {os.environ.get('MODEL_KEY', 'NOT SET')}")
-    print(f"GPU: {config.gpu} x{config.n_gpu}")
+    print(f"GPU: {config.gpu} x{config.gpu_count} ({config.data_parallel} x TP{config.n_gpu})")
+    print(f"Boot mode: {'eager' if FAST_BOOT else 'compiled'}")
     print(f"Tool parser: {config.tool_parser or 'default'}")
+    print(f"Prefix caching: {'on' if config.enable_prefix_caching else 'off'}")
+    print(f"Speculative decoding: {config.speculative or 'off'}")
+    print(f"Quantization: {config.quantization or 'none'}")
     print(f"Command: {' '.join(cmd)}")
 
-    subprocess.Popen(" ".join(cmd), shell=True)
+    # Keep torch.compile / CUDA graph artifacts on the volume, per model, GPU and vLLM version
+    from importlib.metadata import version
+
+    env = os.environ.copy()
+    if not FAST_BOOT:
+        env["VLLM_CACHE_ROOT"] = get_compile_cache_root(
+            MODEL_KEY.removesuffix(f"-{GPU_SHORT_NAMES[config.gpu]}"),
+            GPU_SHORT_NAMES[config.gpu],
+            version("vllm"),
+        )
+        print(f"Compile cache: {env['VLLM_CACHE_ROOT']}")
+
+    subprocess.Popen(" ".join(cmd), shell=True, env=env)
 
 
 @app.local_entrypoint()
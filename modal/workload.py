@@ -0,0 +1,151 @@
+"""
+Benchmark-shaped request workload built from the documents in docs/.
+
+The prompts mirror src/lib/prompts.ts and the schemas the structured-output
+benchmark sends (structured_schemas.py), so tuning and load tests exercise the
+same prompt lengths, output lengths and grammars as a dex-bench run.
+"""
+
+import random
+from pathlib import Path
+
+from structured_schemas import ENTITY_TYPES_SCHEMA, EXTRACTION_SCHEMA
+
+DOCS_DIR = Path(__file__).resolve().parent.parent / "docs"
+
+# Longest document text sent (~24K tokens), so every request fits a 32K context
+# together with its output budget
+DEFAULT_MAX_DOC_CHARS = 96_000
+
+# Entity types the extraction requests ask for (the benchmark generates these per
+# document first; a fixed list keeps the workload identical across runs)
+EXTRACT_ENTITY_TYPES = ["PERSON", "ORGANIZATION", "LOCATION", "DATE", "MONEY", "TECHNOLOGY"]
+
+
+def summarize_prompt(document: str) -> str:
+    return f"""Generate a comprehensive yet concise summary of this document:
+<document>{document}</document>
+
+Guidelines:
+- Capture the main purpose, key arguments, and conclusions
+- Preserve the document's tone and intent
+- Include critical details, facts, and figures that are central to understanding
+- Maintain logical flow from introduction through conclusion
+- Scale summary length appropriately: ~1-2 paragraphs for short docs, ~3-4 for longer ones
+- Avoid generic filler phrases; be specific and informative"""
+
+
+def extract_entities_prompt(document: str, entity_types: list[str]) -> str:
+    return f"""Extract all instances of the following entity types from the document: {", ".join(entity_types)}
+
+Rules for extractions:
+- Each extraction must have a unique id (e.g., e1, e2, e3).
+- extractionClass must be UPPER_SNAKE_CASE and the most specific applicable type (e.g., EMAIL_ADDRESS over URL; FULL_NAME over NAME).
+- extractionText must be an exact copy of characters from the document (preserve casing, accents, spacing; do not normalize).
+- Produce a separate item for each occurrence (duplicates share the same start index and should not be repeated).
+- Avoid overlapping spans. If two candidates overlap, keep the most specific class.
+- Handle multilingual cues (e.g., "E-Mail:", "courriel:", "correo:", "email:", "mail:").
+- Include relevant attributes when applicable (e.g., role, type, currency, brand).
+
+Rules for relationships:
+- Identify relationships between extracted entities based on context in the document.
+- relationshipType must be UPPER_SNAKE_CASE (e.g., WORKS_FOR, LOCATED_IN, OWNS, MANAGES, PART_OF, MEMBER_OF, CREATED_BY, ASSOCIATED_WITH).
+- Use sourceId and targetId to reference the entity ids.
+- Only include relationships that are explicitly stated or strongly implied in the document.
+- Add a description when the relationship needs clarification.
+
+If no entities are found, return {{"extractions": [], "relationships": []}}.
+If entities are found but no relationships exist, return {{"extractions": [...], "relationships": []}}.
+
+Document to extract from:
+<document>{document}</document>"""
+
+
+def entity_types_prompt(document: str, count: int = 20) -> str:
+    return f"""Identify ALL distinct entity types present in this document. This is not limited to common types - extract every category of named entity you can find.
+
+Return ONLY the {count} most important entity types. If there are fewer than {count}, return them all.
+
+Examples of entity types (non-exhaustive): PERSON, ORGANIZATION, LOCATION, DATE, TIME, EMAIL_ADDRESS, PHONE_NUMBER, URL, IP_ADDRESS, MONEY, PERCENTAGE, PRODUCT, EVENT, JOB_TITLE, COMPANY, ADDRESS, COUNTRY, CITY, LANGUAGE, TECHNOLOGY, SOFTWARE, HARDWARE, MEDICAL_TERM, LEGAL_TERM, BRAND, PUBLICATION, ARTWORK, VEHICLE, ANIMAL, PLANT, CHEMICAL, MEASUREMENT, COORDINATE, HASHTAG, USERNAME, LICENSE_PLATE, SERIAL_NUMBER, CREDIT_CARD, BANK_ACCOUNT, SSN, PASSPORT_NUMBER, etc.
+
+Document to extract from:
+<document>{document}</document>
+
+Rules:
+- Be comprehensive: identify ALL entity types that appear in the document, not just common ones
+- Only output the {count} most important types, ordered by significance to the document's content
+- Return only the entity TYPE names, not the actual entity values
+- Use UPPER_SNAKE_CASE format (e.g., EMAIL_ADDRESS, PHONE_NUMBER)
+- Be specific: prefer specific types (CREDIT_CARD) over generic ones (NUMBER)
+- Include domain-specific entity types relevant to the document's context"""
+
+
+# Request shapes: (kind, prompt builder, max_tokens, structured_outputs spec)
+PROMPT_SHAPES = {
+    "summarize-document": (summarize_prompt, 1024, None),
+    "generate-entity-types": (entity_types_prompt, 512, {"json": ENTITY_TYPES_SCHEMA}),
+    "extract-entities": (
+        lambda document: extract_entities_prompt(document, EXTRACT_ENTITY_TYPES),
+        4096,
+        {"json": EXTRACTION_SCHEMA},
+    ),
+}
+
+
+def load_documents(docs_dir: Path = DOCS_DIR, max_chars: int = DEFAULT_MAX_DOC_CHARS) -> dict[str, str]:
+    """Markdown documents by file name, each cut to ``max_chars``."""
+    documents = {
+        path.name: path.read_text(encoding="utf-8")[:max_chars]
+        for path in sorted(docs_dir.glob("*.md"))
+    }
+    if not documents:
+        raise FileNotFoundError(f"No .md documents in {docs_dir}")
+    return documents
+
+
+def build_workload(
+    num_requests: int,
+    seed: int = 0,
+    kinds: list[str] | None = None,
+    docs_dir: Path = DOCS_DIR,
+    max_doc_chars: int = DEFAULT_MAX_DOC_CHARS,
+) -> list[dict]:
+    """A shuffled, reproducible mix of benchmark requests.
+
+    Every (document, kind) pair is used equally often. Each request is a dict
+    with ``kind``, ``document``, ``messages``, ``max_tokens``, ``temperature``
+    and ``structured_outputs`` (None for free text), ready to be sent as a
+    chat completion.
+    """
+    kinds = kinds or list(PROMPT_SHAPES)
+    unknown = [kind for kind in kinds if kind not in PROMPT_SHAPES]
+    if unknown:
+        raise ValueError(f"Unknown request kind(s): {', '.join(unknown)}. Available: {', '.join(PROMPT_SHAPES)}")
+
+    documents = load_documents(docs_dir, max_doc_chars)
+    pairs = [(name, kind) for name in documents for kind in kinds]
+    rng = random.Random(seed)
+    requests = []
+    while len(requests) < num_requests:
+        rng.shuffle(pairs)
+        for name, kind in pairs[: num_requests - len(requests)]:
+            build_prompt, max_tokens, structured_outputs = PROMPT_SHAPES[kind]
+            requests.append({
+                "kind": kind,
+                "document": name,
+                "messages": [{"role": "user", "content": build_prompt(documents[name])}],
+                "max_tokens": max_tokens,
+                "temperature": 0.0,
+                "structured_outputs": structured_outputs,
+            })
+    return requests
+
+
+def describe_workload(requests: list[dict]) -> str:
+    """One-line summary: request count, mix and prompt size."""
+    counts: dict[str, int] = {}
+    for request in requests:
+        counts[request["kind"]] = counts.get(request["kind"], 0) + 1
+    chars = sum(len(m["content"]) for request in requests for m in request["messages"])
+    mix = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+    return f"{len(requests)} requests ({mix}), {chars / max(len(requests), 1) / 1000:.0f}K prompt chars avg"